@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de QGZ Editor
+
+Genera proyectos QGIS sintéticos (.qgz) de distintos tamaños, cantidad de
+reglas y densidad de coincidencias, mide cada etapa de procesar_archivo_qgz
+y el lote completo, y escribe los resultados en bench_output.txt con un
+formato estable para poder comparar dos versiones con diff.
+
+Uso:
+    python qgz_benchmark.py                  # escenarios rápidos (hasta ~50 MB)
+    python qgz_benchmark.py --completo       # incluye .qgs de 100 MB y 1 GB
+    python qgz_benchmark.py -e qgs_10m_r100_d10 -r 5
+"""
+
+import os
+import sys
+import io
+import argparse
+import contextlib
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import zipfile
+
+import qgz_editor
+
+
+# Archivo de resultados (en el directorio del script)
+NOMBRE_RESULTADOS = 'bench_output.txt'
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+# Escenarios por archivo: tamaño del .qgs, reglas, fracción de capas con
+# coincidencia y tamaño de un miembro adjunto (p. ej. una imagen embebida).
+# Las reglas son de texto; 'ip' es la fracción de reglas de tipo 'ip' (opcional)
+ESCENARIOS = [
+    {'nombre': 'qgs_100k_r1_d10', 'tamano_qgs': 100 * KB, 'reglas': 1, 'densidad': 0.10, 'adjunto': 0},
+    {'nombre': 'qgs_1m_r10_d10', 'tamano_qgs': 1 * MB, 'reglas': 10, 'densidad': 0.10, 'adjunto': 0},
+    {'nombre': 'qgs_10m_r100_d0', 'tamano_qgs': 10 * MB, 'reglas': 100, 'densidad': 0.0, 'adjunto': 0},
+    {'nombre': 'qgs_10m_r100_d10', 'tamano_qgs': 10 * MB, 'reglas': 100, 'densidad': 0.10, 'adjunto': 0},
+    {'nombre': 'qgs_10m_r100_d100', 'tamano_qgs': 10 * MB, 'reglas': 100, 'densidad': 1.0, 'adjunto': 0},
+    {'nombre': 'qgs_10m_r10000_d10', 'tamano_qgs': 10 * MB, 'reglas': 10000, 'densidad': 0.10, 'adjunto': 0},
+    {'nombre': 'qgs_10m_r100_d10_ip50', 'tamano_qgs': 10 * MB, 'reglas': 100, 'densidad': 0.10, 'adjunto': 0,
+     'ip': 0.5},
+    {'nombre': 'qgs_10m_r10000_d10_ip50', 'tamano_qgs': 10 * MB, 'reglas': 10000, 'densidad': 0.10,
+     'adjunto': 0, 'ip': 0.5},
+    {'nombre': 'adjunto_50m_qgs_1m', 'tamano_qgs': 1 * MB, 'reglas': 10, 'densidad': 0.10, 'adjunto': 50 * MB},
+    {'nombre': 'qgs_100m_r1000_d10', 'tamano_qgs': 100 * MB, 'reglas': 1000, 'densidad': 0.10, 'adjunto': 0,
+     'completo': True},
+    {'nombre': 'qgs_1g_r100_d1', 'tamano_qgs': 1 * GB, 'reglas': 100, 'densidad': 0.01, 'adjunto': 0,
+     'completo': True},
+    {'nombre': 'adjunto_500m_qgs_10m', 'tamano_qgs': 10 * MB, 'reglas': 100, 'densidad': 0.10,
+     'adjunto': 500 * MB, 'completo': True},
+]
+
+# Escenario de lote: varios archivos iguales procesados con ejecutar_configuracion
+ESCENARIO_LOTE = {'nombre': 'lote_8x5m_r100_d10', 'archivos': 8, 'tamano_qgs': 5 * MB,
+                  'reglas': 100, 'densidad': 0.10, 'adjunto': 0}
+
+# Semilla fija: el corpus generado es siempre el mismo. VERSION_CORPUS
+# separa en --corpus los proyectos generados con otras reglas
+SEMILLA = 20240601
+VERSION_CORPUS = 2
+
+CABECERA_QGS = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+<qgis projectname="Benchmark" version="3.34.0-Prizren">
+  <title>Proyecto sintético de benchmark</title>
+  <projectlayers>
+"""
+
+CAPA_QGS = """    <maplayer type="vector" geometry="Polygon" autoRefreshTime="0">
+      <id>capa_{numero}_{sufijo}</id>
+      <datasource>dbname='gis' host={host} port=5432 user='lector' sslmode=disable key='id' srid=4326 type=Polygon table="public"."tabla_{numero}" (geom)</datasource>
+      <layername>Capa {numero}</layername>
+      <srs><spatialrefsys><authid>EPSG:4326</authid></spatialrefsys></srs>
+      <customproperties><Option type="Map"><Option name="servidor" type="QString" value="{host}"/></Option></customproperties>
+    </maplayer>
+"""
+
+PIE_QGS = """  </projectlayers>
+</qgis>
+"""
+
+
+def generar_reglas(cantidad, fraccion_ip=0.0):
+    """
+    Genera reglas de reemplazo sintéticas.
+    
+    Las reglas de texto cambian un nombre de host por otro; las de IP
+    trasladan una dirección de 10.0.0.0/8 a 172.16.0.0/12. Las de IP se
+    reparten de forma pareja entre las de texto.
+    
+    Args:
+        cantidad: Cantidad de reglas
+        fraccion_ip: Fracción de reglas de tipo 'ip' (0 a 1)
+    
+    Returns:
+        list: Reglas con 'buscar', 'reemplazar_por' y 'tipo'
+    """
+    reglas = []
+    for i in range(cantidad):
+        if int((i + 1) * fraccion_ip) > int(i * fraccion_ip):
+            a, b, c = (i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF
+            reglas.append({
+                'buscar': f"10.{a}.{b}.{c}",
+                'reemplazar_por': f"172.{16 + a % 16}.{b}.{c}",
+                'tipo': 'ip'
+            })
+        else:
+            reglas.append({
+                'buscar': f"srv-{i:05d}.interno.lan",
+                'reemplazar_por': f"srv-{i:05d}.nube.lan",
+                'tipo': 'texto'
+            })
+    return reglas
+
+
+def escribir_qgs(destino, tamano, reglas, densidad, semilla=SEMILLA):
+    """
+    Escribe un documento .qgs sintético de aproximadamente 'tamano' bytes.
+    
+    Una fracción 'densidad' de las capas apunta a un host que coincide con
+    alguna regla; el resto usa hosts que no coinciden con ninguna.
+    
+    Args:
+        destino: Archivo binario abierto para escritura
+        tamano: Tamaño aproximado del documento en bytes
+        reglas: Reglas generadas con generar_reglas
+        densidad: Fracción de capas con coincidencia (0 a 1)
+        semilla: Semilla del generador aleatorio
+    
+    Returns:
+        int: Bytes escritos
+    """
+    azar = random.Random(semilla)
+    escritos = destino.write(CABECERA_QGS.encode('utf-8'))
+    pie = PIE_QGS.encode('utf-8')
+    numero = 0
+    bloque = []
+    tamano_bloque = 0
+    while escritos + tamano_bloque + len(pie) < tamano:
+        numero += 1
+        if reglas and azar.random() < densidad:
+            host = azar.choice(reglas)['buscar']
+        else:
+            host = f"db-{numero % 997}.interno.lan"
+        capa = CAPA_QGS.format(numero=numero, sufijo=f"{azar.getrandbits(48):012x}", host=host).encode('utf-8')
+        bloque.append(capa)
+        tamano_bloque += len(capa)
+        if tamano_bloque >= MB:
+            escritos += destino.write(b''.join(bloque))
+            bloque = []
+            tamano_bloque = 0
+    escritos += destino.write(b''.join(bloque))
+    escritos += destino.write(pie)
+    return escritos
+
+
+def generar_qgz(ruta, escenario):
+    """
+    Genera un .qgz sintético para un escenario (si no existe ya).
+    
+    Contiene el .qgs, un .qgd pequeño y, si el escenario lo pide, un miembro
+    adjunto de datos aleatorios guardado sin comprimir (como una imagen).
+    
+    Args:
+        ruta: Ruta del .qgz a generar
+        escenario: Diccionario del escenario
+    """
+    if os.path.exists(ruta):
+        return
+    
+    reglas = generar_reglas(escenario['reglas'], escenario.get('ip', 0.0))
+    temporal = ruta + '.tmp'
+    with zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED) as zip_salida:
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        info = zipfile.ZipInfo(f"{nombre}.qgs", date_time=(2024, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zip_salida.open(info, 'w', force_zip64=escenario['tamano_qgs'] > qgz_editor.UMBRAL_FORZAR_ZIP64) as destino:
+            escribir_qgs(destino, escenario['tamano_qgs'], reglas, escenario['densidad'])
+        
+        zip_salida.writestr(zipfile.ZipInfo(f"{nombre}.qgd", date_time=(2024, 1, 1, 0, 0, 0)),
+                            b'SQLite format 3\x00' + bytes(4080))
+        
+        if escenario['adjunto']:
+            azar = random.Random(SEMILLA + 1)
+            info = zipfile.ZipInfo('adjuntos/ortofoto.tif', date_time=(2024, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            with zip_salida.open(info, 'w', force_zip64=escenario['adjunto'] > qgz_editor.UMBRAL_FORZAR_ZIP64) as destino:
+                restante = escenario['adjunto']
+                while restante > 0:
+                    cantidad = min(MB, restante)
+                    destino.write(azar.randbytes(cantidad))
+                    restante -= cantidad
+    os.replace(temporal, ruta)
+
+
+def crear_config(reglas):
+    """Configuración mínima del editor para las reglas dadas."""
+    return {
+        'modulos': {
+            'reemplazo_texto': {
+                'activo': True,
+                'descripcion': 'Benchmark',
+                'reglas': reglas
+            }
+        },
+        'postfijo': '_BENCH',
+        'carpeta_entrada': 'entrada',
+        'carpeta_salida': 'salida'
+    }
+
+
+def medir_archivo(carpeta_corpus, escenario, repeticiones):
+    """
+    Mide procesar_archivo_qgz sobre el .qgz de un escenario.
+    
+    Args:
+        carpeta_corpus: Carpeta donde están (o se generan) los .qgz
+        escenario: Diccionario del escenario
+        repeticiones: Cantidad de ejecuciones (se informa la mediana)
+    
+    Returns:
+        dict: Resultado con la mediana de cada etapa y del total
+    """
+    carpeta_entrada = os.path.join(carpeta_corpus, f"v{VERSION_CORPUS}", escenario['nombre'])
+    carpeta_salida = os.path.join(carpeta_entrada, 'salida')
+    os.makedirs(carpeta_salida, exist_ok=True)
+    archivo = f"{escenario['nombre']}.qgz"
+    generar_qgz(os.path.join(carpeta_entrada, archivo), escenario)
+    
+    config = crear_config(generar_reglas(escenario['reglas'], escenario.get('ip', 0.0)))
+    mediciones = []
+    for _ in range(repeticiones):
+        metricas = {}
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            exito = qgz_editor.procesar_archivo_qgz(archivo, carpeta_entrada, carpeta_salida, config, metricas)
+        total = time.perf_counter() - inicio
+        if not exito:
+            raise RuntimeError(f"El escenario {escenario['nombre']} no se pudo procesar")
+        mediciones.append((total, metricas))
+    
+    return {
+        'nombre': escenario['nombre'],
+        'bytes_qgs': mediciones[0][1]['bytes_qgs_leidos'],
+        'reglas': escenario['reglas'],
+        'ip': escenario.get('ip', 0.0),
+        'densidad': escenario['densidad'],
+        'coincidencias': sum(mediciones[0][1]['conteos'].values()),
+        'total': statistics.median(total for total, _ in mediciones),
+        'etapas': {etapa: statistics.median(metricas['etapas'][etapa] for _, metricas in mediciones)
+                   for etapa in qgz_editor.ETAPAS_PROCESO},
+    }
+
+
+def medir_lote(carpeta_corpus, escenario, repeticiones, trabajos):
+    """
+    Mide el lote completo (pasos 2 a 4, como main) sobre varios archivos.
+    
+    Args:
+        carpeta_corpus: Carpeta donde están (o se generan) los .qgz
+        escenario: ESCENARIO_LOTE
+        repeticiones: Cantidad de ejecuciones (se informa la mediana)
+        trabajos: Valor de --jobs para el lote
+    
+    Returns:
+        dict: Nombre, archivos, bytes y mediana del total
+    """
+    carpeta = os.path.join(carpeta_corpus, f"v{VERSION_CORPUS}", escenario['nombre'])
+    os.makedirs(os.path.join(carpeta, 'entrada'), exist_ok=True)
+    primero = os.path.join(carpeta, 'entrada', 'proyecto_01.qgz')
+    generar_qgz(primero, escenario)
+    for i in range(2, escenario['archivos'] + 1):
+        copia = os.path.join(carpeta, 'entrada', f'proyecto_{i:02d}.qgz')
+        if not os.path.exists(copia):
+            shutil.copyfile(primero, copia)
+    
+    config = crear_config(generar_reglas(escenario['reglas'], escenario.get('ip', 0.0)))
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            codigo = qgz_editor.ejecutar_configuracion(config, carpeta, trabajos, forzar=True)
+        tiempos.append(time.perf_counter() - inicio)
+        if codigo != 0:
+            raise RuntimeError(f"El lote {escenario['nombre']} terminó con errores")
+    
+    with zipfile.ZipFile(primero) as zip_entrada:
+        bytes_qgs = sum(m.file_size for m in zip_entrada.infolist() if m.filename.endswith('.qgs'))
+    
+    return {
+        'nombre': f"{escenario['nombre']}_j{trabajos or 'auto'}",
+        'archivos': escenario['archivos'],
+        'bytes_qgs': bytes_qgs * escenario['archivos'],
+        'total': statistics.median(tiempos),
+    }
+
+
+def formatear_resultados(archivos, lotes, repeticiones):
+    """
+    Arma el texto de bench_output.txt.
+    
+    Una línea por escenario, columnas de ancho fijo y escenarios en orden
+    alfabético, para que dos ejecuciones se puedan comparar con diff.
+    
+    Returns:
+        str: Contenido del archivo de resultados
+    """
+    lineas = [
+        "# QGZ Editor - benchmark",
+        f"# python {platform.python_version()} | {platform.system()} {platform.machine()} | "
+        f"cpus {os.cpu_count()} | repeticiones {repeticiones} (mediana)",
+        "",
+        "## procesar_archivo_qgz (segundos)",
+        f"{'escenario':<24} {'qgs_bytes':>12} {'reglas':>6} {'ip':>5} {'densidad':>8} {'coincid':>9} "
+        f"{'total':>9} " + ' '.join(f"{etapa[:10]:>10}" for etapa in qgz_editor.ETAPAS_PROCESO) +
+        f" {'MB/s':>8}",
+    ]
+    for resultado in sorted(archivos, key=lambda r: r['nombre']):
+        mb_por_segundo = resultado['bytes_qgs'] / MB / resultado['total'] if resultado['total'] else 0
+        lineas.append(
+            f"{resultado['nombre']:<24} {resultado['bytes_qgs']:>12} {resultado['reglas']:>6} "
+            f"{resultado['ip']:>5.2f} {resultado['densidad']:>8.2f} {resultado['coincidencias']:>9} {resultado['total']:>9.4f} " +
+            ' '.join(f"{resultado['etapas'][etapa]:>10.4f}" for etapa in qgz_editor.ETAPAS_PROCESO) +
+            f" {mb_por_segundo:>8.1f}")
+    
+    if lotes:
+        lineas += [
+            "",
+            "## lote completo (ejecutar_configuracion, segundos)",
+            f"{'escenario':<24} {'archivos':>8} {'qgs_bytes':>12} {'total':>9} {'MB/s':>8}",
+        ]
+        for resultado in sorted(lotes, key=lambda r: r['nombre']):
+            mb_por_segundo = resultado['bytes_qgs'] / MB / resultado['total'] if resultado['total'] else 0
+            lineas.append(f"{resultado['nombre']:<24} {resultado['archivos']:>8} {resultado['bytes_qgs']:>12} "
+                          f"{resultado['total']:>9.4f} {mb_por_segundo:>8.1f}")
+    return '\n'.join(lineas) + '\n'
+
+
+def parsear_argumentos(argv=None):
+    """
+    Lee los argumentos de la línea de comandos.
+    
+    Args:
+        argv: Lista de argumentos (por defecto, sys.argv)
+    
+    Returns:
+        argparse.Namespace: Argumentos leídos
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de QGZ Editor con proyectos sintéticos")
+    parser.add_argument(
+        '--completo', action='store_true',
+        help="incluir los escenarios grandes (.qgs de 100 MB y 1 GB, adjunto de 500 MB)")
+    parser.add_argument(
+        '-e', '--escenario', action='append', metavar='NOMBRE',
+        help="ejecutar solo este escenario (se puede repetir; 'lote' = solo el lote)")
+    parser.add_argument(
+        '-r', '--repeticiones', type=int, default=3, metavar='N',
+        help="ejecuciones por escenario; se informa la mediana (por defecto 3)")
+    parser.add_argument(
+        '--corpus', metavar='CARPETA',
+        help="carpeta donde generar y reutilizar el corpus (por defecto, una carpeta temporal)")
+    parser.add_argument(
+        '--salida', metavar='ARCHIVO',
+        help=f"archivo de resultados (por defecto, {NOMBRE_RESULTADOS} junto al script)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Función principal del benchmark."""
+    args = parsear_argumentos(argv)
+    directorio_base = os.path.dirname(os.path.abspath(__file__))
+    ruta_salida = args.salida or os.path.join(directorio_base, NOMBRE_RESULTADOS)
+    
+    escenarios = [e for e in ESCENARIOS if args.completo or not e.get('completo')]
+    incluir_lote = True
+    if args.escenario:
+        conocidos = {e['nombre'] for e in ESCENARIOS} | {'lote'}
+        desconocidos = sorted(set(args.escenario) - conocidos)
+        if desconocidos:
+            print(f"❌ ERROR: Escenario(s) desconocido(s): {', '.join(desconocidos)}")
+            print(f"   👉 Disponibles: {', '.join(sorted(conocidos))}")
+            return 1
+        escenarios = [e for e in ESCENARIOS if e['nombre'] in args.escenario]
+        incluir_lote = 'lote' in args.escenario
+    
+    carpeta_corpus = args.corpus or tempfile.mkdtemp(prefix='qgz_bench_')
+    os.makedirs(carpeta_corpus, exist_ok=True)
+    print(f"📁 Corpus: {carpeta_corpus}")
+    
+    try:
+        archivos = []
+        for escenario in escenarios:
+            print(f"   ⏱️ {escenario['nombre']}...", end='', flush=True)
+            resultado = medir_archivo(carpeta_corpus, escenario, args.repeticiones)
+            archivos.append(resultado)
+            print(f" {resultado['total']:.4f} s")
+        
+        lotes = []
+        if incluir_lote:
+            for trabajos in (1, 0):
+                print(f"   ⏱️ {ESCENARIO_LOTE['nombre']} (--jobs {trabajos})...", end='', flush=True)
+                resultado = medir_lote(carpeta_corpus, ESCENARIO_LOTE, args.repeticiones, trabajos)
+                lotes.append(resultado)
+                print(f" {resultado['total']:.4f} s")
+    finally:
+        if not args.corpus:
+            shutil.rmtree(carpeta_corpus, ignore_errors=True)
+    
+    texto = formatear_resultados(archivos, lotes, args.repeticiones)
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        f.write(texto)
+    print("")
+    print(texto, end='')
+    print(f"\n   📄 Resultados guardados en: {ruta_salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
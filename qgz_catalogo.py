@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catálogo de carpetas de QGZ Editor
+
+Lista los .qgz de una carpeta (nombre, tamaño y fecha) una sola vez y
+guarda el resultado en memoria. Mientras la fecha de modificación de la
+carpeta no cambie, las consultas se responden desde la memoria, en páginas
+ordenadas con un cursor. Un hilo de fondo revisa la carpeta y avisa a
+quien espere cambios (por ejemplo, un stream SSE del servidor web).
+
+Uso:
+    catalogo = CatalogoCarpeta('data_in')
+    pagina = catalogo.pagina(orden='modificado', descendente=True, limite=100)
+    siguiente = catalogo.pagina(cursor=pagina['siguiente'])
+"""
+
+import os
+import json
+import base64
+import bisect
+import threading
+import time
+from collections import deque
+
+
+# Campos por los que se puede ordenar una página
+ORDENES_CATALOGO = ('nombre', 'tamano', 'modificado')
+
+LIMITE_POR_DEFECTO = 200
+LIMITE_MAXIMO = 1000
+
+# Segundos entre revisiones de la carpeta en el hilo de fondo
+INTERVALO_REVISION = 1.0
+
+# Cada tanto se vuelve a leer todo aunque la fecha de la carpeta no cambie:
+# sobrescribir un archivo existente cambia su tamaño pero no la carpeta
+REVISION_COMPLETA_SEG = 30.0
+
+# Una fecha de carpeta tan cercana al momento de la lectura no es confiable
+# (sistemas de archivos con resolución de 1-2 s): se vuelve a leer
+MARGEN_FECHA_INCIERTA_NS = 2 * 1000 * 1000 * 1000
+
+# Cambios que se recuerdan para responder "qué cambió desde la versión N"
+CAMBIOS_CONSERVADOS = 100
+
+
+def codificar_cursor(orden, descendente, clave):
+    """Cursor opaco con el orden y la clave del último elemento entregado"""
+    datos = json.dumps([orden, descendente, clave], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Decodificar un cursor de codificar_cursor.
+    
+    Returns:
+        tuple: (orden, descendente, clave)
+    
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        orden, descendente, clave = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+    # La clave se compara con las de la lista ordenada: tiene que tener sus mismos tipos
+    if orden not in ORDENES_CATALOGO or not isinstance(clave, list) or not clave_valida(orden, clave):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return orden, bool(descendente), tuple(clave)
+
+
+def clave_valida(orden, clave):
+    """True si la clave tiene la forma de las de _ordenadas_por para ese orden"""
+    if orden == 'nombre':
+        return len(clave) == 1 and isinstance(clave[0], str)
+    valor, nombre = clave if len(clave) == 2 else (None, None)
+    tipos = int if orden == 'tamano' else (int, float)
+    return isinstance(valor, tipos) and not isinstance(valor, bool) and isinstance(nombre, str)
+
+
+class CatalogoCarpeta:
+    """
+    Lista en memoria de los archivos de una carpeta, con páginas y avisos de cambios.
+    
+    La lista se vuelve a leer (con os.scandir, una sola llamada a stat por
+    entrada) sólo cuando cambia la fecha de modificación de la carpeta, o
+    cada REVISION_COMPLETA_SEG segundos. Cada vez que el contenido cambia,
+    la versión aumenta y se despierta a quien esté en esperar_cambios().
+    """
+    
+    def __init__(self, carpeta, extension='.qgz'):
+        self.carpeta = os.fspath(carpeta)
+        self.extension = extension
+        self.version = 0
+        self.condicion = threading.Condition()
+        self._entradas = {}
+        self._ordenadas = {}
+        self._fecha_carpeta = None
+        self._ultima_lectura = 0.0
+        # Lecturas de la carpeta empezadas y la última aplicada: una lectura
+        # más vieja que la aplicada no reemplaza a la lista
+        self._lecturas = 0
+        self._lectura_aplicada = 0
+        self._cambios = deque(maxlen=CAMBIOS_CONSERVADOS)
+        self._vigilante = None
+    
+    def _leer_carpeta(self):
+        entradas = {}
+        try:
+            with os.scandir(self.carpeta) as iterador:
+                for entrada in iterador:
+                    nombre = entrada.name
+                    if not nombre.endswith(self.extension) or nombre.startswith('.'):
+                        continue
+                    try:
+                        if not entrada.is_file():
+                            continue
+                        estado = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    entradas[nombre] = {'nombre': nombre, 'tamano': estado.st_size,
+                                        'modificado': estado.st_mtime}
+        except FileNotFoundError:
+            pass
+        return entradas
+    
+    def actualizar(self, forzar=False):
+        """
+        Volver a leer la carpeta si cambió (o si forzar=True).
+        
+        La carpeta se lee sin tener tomado el bloqueo, así que las páginas y
+        quienes esperan cambios no quedan frenados por una carpeta grande
+        o lenta; el resultado se aplica después, bajo el bloqueo.
+        
+        Returns:
+            int: Versión actual del catálogo
+        """
+        try:
+            fecha_carpeta = os.stat(self.carpeta).st_mtime_ns
+        except FileNotFoundError:
+            fecha_carpeta = None
+        
+        with self.condicion:
+            ahora = time.time()
+            vigente = (fecha_carpeta == self._fecha_carpeta
+                       and ahora - self._ultima_lectura < REVISION_COMPLETA_SEG)
+            if vigente and not forzar:
+                return self.version
+            self._lecturas += 1
+            lectura = self._lecturas
+        
+        entradas = self._leer_carpeta()
+        # Si la carpeta cambió en el mismo instante de la lectura, la próxima vez se vuelve a leer
+        incierta = fecha_carpeta is not None and time.time_ns() - fecha_carpeta < MARGEN_FECHA_INCIERTA_NS
+        
+        with self.condicion:
+            if lectura < self._lectura_aplicada:
+                return self.version
+            self._lectura_aplicada = lectura
+            self._fecha_carpeta = None if incierta else fecha_carpeta
+            self._ultima_lectura = ahora
+            
+            anteriores = self._entradas
+            agregados = sorted(n for n in entradas if n not in anteriores)
+            eliminados = sorted(n for n in anteriores if n not in entradas)
+            modificados = sorted(n for n, e in entradas.items() if n in anteriores and anteriores[n] != e)
+            if agregados or eliminados or modificados:
+                self._entradas = entradas
+                self._ordenadas = {}
+                self.version += 1
+                self._cambios.append({'version': self.version, 'agregados': agregados,
+                                      'eliminados': eliminados, 'modificados': modificados})
+                self.condicion.notify_all()
+            return self.version
+    
+    def invalidar(self):
+        """Volver a leer la carpeta ya (después de escribir en ella)"""
+        return self.actualizar(forzar=True)
+    
+    def _ordenadas_por(self, orden):
+        """Lista ordenada de (clave, entrada); se calcula una vez por versión y orden"""
+        if orden not in self._ordenadas:
+            if orden == 'nombre':
+                claves = ((e['nombre'],) for e in self._entradas.values())
+            else:
+                claves = ((e[orden], e['nombre']) for e in self._entradas.values())
+            lista = sorted(zip(claves, self._entradas.values()), key=lambda par: par[0])
+            self._ordenadas[orden] = ([clave for clave, _ in lista], [entrada for _, entrada in lista])
+        return self._ordenadas[orden]
+    
+    def pagina(self, orden='nombre', descendente=False, cursor=None, limite=LIMITE_POR_DEFECTO):
+        """
+        Página de entradas ordenadas.
+        
+        El cursor guarda la clave del último elemento entregado (no una
+        posición), así que agregar o borrar archivos entre dos páginas no
+        hace que se repitan ni se salteen elementos.
+        
+        Args:
+            orden: 'nombre', 'tamano' o 'modificado'
+            descendente: Ordenar de mayor a menor
+            cursor: Valor 'siguiente' de la página anterior (su orden manda)
+            limite: Cantidad máxima de entradas (hasta LIMITE_MAXIMO)
+        
+        Returns:
+            dict: items, siguiente (None en la última página), total y version
+        
+        Raises:
+            ValueError: Si el orden, el límite o el cursor no son válidos
+        """
+        if cursor:
+            orden, descendente, clave = decodificar_cursor(cursor)
+        elif orden not in ORDENES_CATALOGO:
+            raise ValueError(f"Orden inválido: {orden} (opciones: {', '.join(ORDENES_CATALOGO)})")
+        limite = int(limite)
+        if not 1 <= limite <= LIMITE_MAXIMO:
+            raise ValueError(f"El límite debe estar entre 1 y {LIMITE_MAXIMO}")
+        
+        self.actualizar()
+        with self.condicion:
+            claves, entradas = self._ordenadas_por(orden)
+            if descendente:
+                fin = bisect.bisect_left(claves, clave) if cursor else len(claves)
+                inicio = max(fin - limite, 0)
+                items = entradas[inicio:fin][::-1]
+                quedan = inicio > 0
+            else:
+                inicio = bisect.bisect_right(claves, clave) if cursor else 0
+                items = entradas[inicio:inicio + limite]
+                quedan = inicio + limite < len(claves)
+            
+            siguiente = None
+            if quedan and items:
+                ultimo = items[-1]
+                clave_ultimo = [ultimo['nombre']] if orden == 'nombre' else [ultimo[orden], ultimo['nombre']]
+                siguiente = codificar_cursor(orden, descendente, clave_ultimo)
+            return {'items': [dict(e) for e in items], 'siguiente': siguiente,
+                    'total': len(claves), 'version': self.version}
+    
+    def nombres(self):
+        """Todos los nombres, ordenados"""
+        self.actualizar()
+        with self.condicion:
+            return sorted(self._entradas)
+    
+    def entradas(self):
+        """Todas las entradas (nombre, tamaño, fecha), ordenadas por nombre"""
+        self.actualizar()
+        with self.condicion:
+            return [dict(e) for e in self._ordenadas_por('nombre')[1]]
+    
+    def cambios_desde(self, version):
+        """
+        Cambios posteriores a una versión, juntos.
+        
+        Returns:
+            dict: version, agregados, eliminados y modificados; o None si la
+                versión es tan vieja que ya no se recuerdan sus cambios (hay
+                que volver a pedir la lista)
+        """
+        with self.condicion:
+            cambios = [c for c in self._cambios if c['version'] > version]
+            if version > self.version or (cambios and cambios[0]['version'] != version + 1):
+                return None
+            
+            estado = {}
+            for cambio in cambios:
+                for tipo in ('agregados', 'eliminados', 'modificados'):
+                    for nombre in cambio[tipo]:
+                        anterior = estado.get(nombre)
+                        if tipo == 'modificados' and anterior == 'agregados':
+                            continue
+                        if tipo == 'eliminados' and anterior == 'agregados':
+                            del estado[nombre]
+                            continue
+                        # Ya existía en 'version': borrado y vuelto a crear es un cambio
+                        if tipo == 'agregados' and anterior in ('eliminados', 'modificados'):
+                            tipo = 'modificados'
+                        estado[nombre] = tipo
+            resultado = {'version': self.version, 'agregados': [], 'eliminados': [], 'modificados': []}
+            for nombre, tipo in sorted(estado.items()):
+                resultado[tipo].append(nombre)
+            return resultado
+    
+    def esperar_cambios(self, version, timeout=None):
+        """
+        Esperar hasta que la versión supere a la indicada.
+        
+        Args:
+            version: Última versión conocida por quien espera
+            timeout: Segundos máximos de espera
+        
+        Returns:
+            int: Versión actual (igual a la indicada si venció el tiempo)
+        """
+        self.vigilar()
+        with self.condicion:
+            self.condicion.wait_for(lambda: self.version > version, timeout)
+            return self.version
+    
+    def vigilar(self):
+        """Arrancar (una sola vez) el hilo que revisa la carpeta cada INTERVALO_REVISION segundos"""
+        with self.condicion:
+            if self._vigilante is not None:
+                return
+            self._vigilante = threading.Thread(target=self._revisar_siempre, daemon=True,
+                                               name=f'catalogo-{os.path.basename(self.carpeta)}')
+        self._vigilante.start()
+    
+    def _revisar_siempre(self):
+        while True:
+            try:
+                self.actualizar()
+            except OSError:
+                pass
+            time.sleep(INTERVALO_REVISION)
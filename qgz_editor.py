@@ -14,15 +14,274 @@
 
 import os
 import sys
+import io
 import json
+import argparse
+import bz2
+import codecs
+import collections
+import contextlib
+import cProfile
+import csv
+import gzip
+import hashlib
+import lzma
+import pstats
 import zipfile
+import zlib
+import re
 import shutil
+import signal
+import struct
 import tempfile
-import re
+import threading
+import time
+import tracemalloc
+import xml.parsers.expat
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
 # Forzar flush automático para streaming en web
-sys.stdout.reconfigure(line_buffering=True)
+if hasattr(sys.stdout, 'reconfigure'):
+    sys.stdout.reconfigure(line_buffering=True)
+
+# Tamaño de bloque para copiar miembros del .qgz sin cargarlos enteros en memoria
+TAMANO_BLOQUE_COPIA = 1024 * 1024
+
+# Bit de "data descriptor" en las cabeceras ZIP (CRC y tamaños después de los datos)
+ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+
+# Identificador del campo extra ZIP64 en las cabeceras ZIP
+ZIP_EXTRA_ZIP64 = 0x0001
+
+# Bit de nombre en UTF-8 en las cabeceras ZIP
+ZIP_FLAG_UTF8 = 0x800
+
+# Estructuras de un ZIP según la especificación de PKWARE (APPNOTE.TXT), para
+# EscritorZip: firma y formato de cada una
+FIRMA_CABECERA_LOCAL = b'PK\x03\x04'
+FIRMA_DATA_DESCRIPTOR = b'PK\x07\x08'
+FIRMA_DIRECTORIO_CENTRAL = b'PK\x01\x02'
+FIRMA_FIN_DIRECTORIO_ZIP64 = b'PK\x06\x06'
+FIRMA_LOCALIZADOR_ZIP64 = b'PK\x06\x07'
+FIRMA_FIN_DIRECTORIO = b'PK\x05\x06'
+FORMATO_CABECERA_LOCAL = '<4s5H3L2H'
+FORMATO_DIRECTORIO_CENTRAL = '<4s4B4H3L5H2L'
+FORMATO_FIN_DIRECTORIO_ZIP64 = '<4sQ2H2L4Q'
+FORMATO_LOCALIZADOR_ZIP64 = '<4sLQL'
+FORMATO_FIN_DIRECTORIO = '<4s4H2LH'
+# Tamaños, posiciones y cantidad de miembros a partir de los que hace falta ZIP64
+LIMITE_ZIP = 0xFFFFFFFF
+LIMITE_MIEMBROS_ZIP = 0xFFFF
+# Versión de la especificación necesaria para extraer, según el método y con ZIP64
+VERSION_ZIP_POR_METODO = {zipfile.ZIP_STORED: 20, zipfile.ZIP_DEFLATED: 20,
+                          zipfile.ZIP_BZIP2: 46, zipfile.ZIP_LZMA: 63}
+VERSION_ZIP64 = 45
+# Filtro LZMA de los miembros ZIP_LZMA (el mismo que usa zipfile)
+FILTRO_LZMA_ZIP = {'id': lzma.FILTER_LZMA1, 'dict_size': 1 << 23, 'lc': 3, 'lp': 0, 'pb': 2}
+
+# Manifiesto de ejecuciones anteriores (en la carpeta de salida)
+NOMBRE_MANIFIESTO = '.qgz_editor_manifest.json'
+VERSION_MANIFIESTO = 1
+
+# Diario del lote en curso: una línea por archivo terminado, que se agrega al
+# manifiesto al cargarlo (así un lote interrumpido retoma donde quedó). Al
+# guardar el manifiesto se borra; el modo --watch lo guarda cada tantas líneas
+NOMBRE_DIARIO = '.qgz_editor_manifest.journal'
+MAXIMO_LINEAS_DIARIO = 500
+
+# Los .qgs se leen, reemplazan y comprimen por bloques, con memoria acotada
+TAMANO_BLOQUE_QGS = 4 * 1024 * 1024
+
+# El .qgs ya reemplazado se guarda aparte antes de escribirlo en el .qgz (así,
+# si no hubo cambios, se copia el original sin comprimir nada): en memoria
+# hasta este tamaño y en un temporal de la carpeta de salida por encima
+MAXIMO_QGS_EN_MEMORIA = 64 * 1024 * 1024
+
+# Los .qgs más grandes que este umbral se escriben con extensiones ZIP64,
+# porque tras los reemplazos podrían superar el límite de 4 GB
+UMBRAL_FORZAR_ZIP64 = 1024 * 1024 * 1024
+
+# Políticas de compresión de los .qgs modificados (sección "compresion" de
+# config.json): método ZIP y nivel de deflate ('original' = el del miembro)
+POLITICAS_COMPRESION = {
+    'normal': (zipfile.ZIP_DEFLATED, zlib.Z_DEFAULT_COMPRESSION),
+    'rapida': (zipfile.ZIP_DEFLATED, 1),
+    'maxima': (zipfile.ZIP_DEFLATED, 9),
+    'sin_comprimir': (zipfile.ZIP_STORED, None),
+    'original': None,
+}
+COMPRESION_POR_DEFECTO = {'politica': 'normal', 'hilos': 0, 'umbral_paralelo_mb': 64}
+
+# Nivel de deflate según los bits 1 y 2 de la cabecera ZIP (normal, máxima, rápida, superrápida)
+NIVEL_DEFLATE_POR_BITS = {0: zlib.Z_DEFAULT_COMPRESSION, 1: 9, 2: 1, 3: 1}
+
+# Deflate en paralelo: tamaño de cada bloque y ventana que se usa como
+# diccionario para el bloque siguiente
+TAMANO_BLOQUE_DEFLATE = 1024 * 1024
+TAMANO_DICCIONARIO_DEFLATE = 32 * 1024
+
+# Nombres de elemento admitidos en los ámbitos de las reglas
+PATRON_NOMBRE_ELEMENTO = re.compile(r'[^\s/\[\]@()=\'"|*]+|\*')
+
+# Prólogo XML (<?xml version="1.0" encoding="..."?>) y bytes donde buscarlo
+PATRON_PROLOGO_XML = re.compile(rb'\s*<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z0-9._:-]+)["\']')
+TAMANO_PROLOGO_XML = 1024
+
+# Etapas que se miden al procesar cada archivo (segundos en los eventos de progreso)
+ETAPAS_PROCESO = ('lectura', 'descompresion', 'reemplazo', 'compresion', 'escritura')
+
+# Destino de los eventos de progreso del hilo actual (ver capturar_eventos)
+_destino_eventos = threading.local()
+
+# Modo --profile: opciones y carpeta de resultados (en la carpeta de salida)
+OPCIONES_PERFIL = ('tiempos', 'cprofile', 'memoria')
+CARPETA_PERFIL = '.qgz_editor_perfil'
+
+# Caché de motores compilados (ver motor_en_cache). En disco se guarda el
+# texto de la expresión regular ya armada, que con decenas de miles de reglas
+# lleva su tiempo; QGZ_CACHE_REGLAS cambia la carpeta
+VERSION_CACHE_REGLAS = 5
+EXTENSION_CACHE_REGLAS = '.patron.json'
+CARPETA_CACHE_REGLAS = (os.environ.get('QGZ_CACHE_REGLAS') or
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.qgz_editor_reglas'))
+# Con menos reglas, compilar es más rápido que leer el archivo
+MINIMO_REGLAS_CACHE_DISCO = 200
+MAXIMO_ARCHIVOS_CACHE_REGLAS = 20
+MAXIMO_MOTORES_EN_MEMORIA = 16
+_motores_en_memoria = collections.OrderedDict()
+_bloqueo_motores = threading.Lock()
+
+# Reglas 'regex': cantidad máxima de caracteres que puede abarcar una
+# coincidencia (también es el solapamiento entre bloques) y cantidad máxima de
+# caminos que el motor puede probar desde cada posición del documento
+LARGO_MAXIMO_REGEX = 1024
+PRESUPUESTO_REGEX = 10000
+
+# Referencias a grupos en el reemplazo de una regla 'regex': \1, \g<1>, \\
+PATRON_PLANTILLA_REGEX = re.compile(r'\\(?:g<(\d+)>|(\d\d?)|(\\))')
+
+# Reglas 'ip': dirección IPv4 completa (no parte de un número más largo ni de
+# una versión como 1.2.3.4.5). El solapamiento cubre la dirección más larga y
+# los dos bytes que se miran después
+PATRON_TOKEN_IP = r'(?<![0-9.])([0-9]{1,3}(?:\.[0-9]{1,3}){3})(?![0-9]|\.[0-9])'
+SOLAPAMIENTO_TOKEN_IP = 17
+
+# Tablas de reglas (sección 'tablas' de reemplazo_texto): separador según la
+# extensión (también con .gz), y filas de ejemplo que se muestran de cada
+# error o advertencia
+SEPARADORES_TABLA = {'.csv': ',', '.tsv': '\t', '.tab': '\t'}
+EJEMPLOS_TABLA = 10
+
+# Con más reglas que esto, la tabla de --dry-run solo muestra las que coinciden
+MAXIMO_COLUMNAS_MATRIZ = 20
+
+# Modo --watch: segundos entre revisiones de la carpeta de entrada, y segundos
+# que un archivo tiene que quedar sin cambiar de tamaño ni de fecha (para no
+# tomar archivos que todavía se están copiando)
+INTERVALO_VIGILANCIA = 1.0
+ESPERA_ARCHIVO_ESTABLE = 2.0
+
+# Configuración y motores compilados de cada proceso del modo --watch
+# (los prepara iniciar_proceso_vigilancia una sola vez por proceso)
+_config_vigilancia = None
+_motores_vigilancia = None
+
+
+def enviar_evento(evento):
+    """
+    Envía un evento ya armado al destino del hilo actual.
+    
+    Si no hay ningún destino (capturar_eventos), el evento se descarta.
+    
+    Args:
+        evento: Diccionario del evento (debe poder convertirse a JSON)
+    """
+    destino = getattr(_destino_eventos, 'destino', None)
+    if destino is not None:
+        destino(evento)
+
+
+def emitir_evento(tipo, **datos):
+    """
+    Crea un evento de progreso estructurado y lo envía (enviar_evento).
+    
+    Args:
+        tipo: Nombre del evento ('lote_inicio', 'archivo_fin', ...)
+        **datos: Campos del evento
+    """
+    enviar_evento(dict(evento=tipo, tiempo=round(time.time(), 3), **datos))
+
+
+@contextlib.contextmanager
+def capturar_eventos(al_recibir_evento):
+    """
+    Envía los eventos de progreso del hilo actual a una función.
+    
+    Args:
+        al_recibir_evento: Función que recibe cada evento como diccionario
+    """
+    anterior = getattr(_destino_eventos, 'destino', None)
+    _destino_eventos.destino = al_recibir_evento
+    try:
+        yield
+    finally:
+        _destino_eventos.destino = anterior
+
+
+@contextlib.contextmanager
+def medir_etapa(etapas, etapa):
+    """
+    Suma a etapas[etapa] los segundos que tarda el bloque with.
+    
+    Args:
+        etapas: Diccionario de segundos por etapa
+        etapa: Etapa a la que se suma el tiempo
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        etapas[etapa] += time.perf_counter() - inicio
+
+
+class ArchivoMedido:
+    """
+    Envoltorio de un archivo binario que mide sus lecturas o escrituras.
+    
+    Al leer un miembro del .qgz el tiempo incluye la lectura del disco y la
+    descompresión; al escribir, la compresión y la escritura al disco.
+    """
+    
+    def __init__(self, archivo, etapas, etapa):
+        self.archivo = archivo
+        self.etapas = etapas
+        self.etapa = etapa
+        self.bytes = 0
+    
+    def read(self, cantidad=-1):
+        with medir_etapa(self.etapas, self.etapa):
+            datos = self.archivo.read(cantidad)
+        self.bytes += len(datos)
+        return datos
+    
+    def peek(self, cantidad=1):
+        with medir_etapa(self.etapas, self.etapa):
+            return self.archivo.peek(cantidad)
+    
+    def write(self, datos):
+        with medir_etapa(self.etapas, self.etapa):
+            escritos = self.archivo.write(datos)
+        self.bytes += len(datos)
+        return escritos
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *excepcion):
+        with medir_etapa(self.etapas, self.etapa):
+            self.archivo.close()
 
 
 def es_ip_valida(ip):
@@ -50,23 +309,397 @@ def es_ip_valida(ip):
     return True
 
 
+def leer_red_ip(texto):
+    """
+    Convierte una IP o una red CIDR (IPv4) en un entero y un prefijo.
+    
+    Una IP sin prefijo es una red /32. La red no puede tener bits de host
+    (10.1.0.0/16 sí, 10.1.2.3/16 no).
+    
+    Args:
+        texto: IP ('10.1.2.3') o red CIDR ('10.1.0.0/16')
+        
+    Returns:
+        tuple: (dirección como entero de 32 bits, largo del prefijo)
+        
+    Raises:
+        ValueError: Si el texto no es una IP o una red válida
+    """
+    ip, barra, prefijo = texto.strip().partition('/')
+    if not es_ip_valida(ip):
+        raise ValueError(f"IP inválida: {ip}")
+    if barra:
+        if not prefijo.isdigit() or int(prefijo) > 32:
+            raise ValueError(f"Prefijo inválido: /{prefijo} (debe estar entre 0 y 32)")
+        prefijo = int(prefijo)
+    else:
+        prefijo = 32
+    
+    numero = 0
+    for octeto in ip.strip().split('.'):
+        numero = (numero << 8) | int(octeto)
+    if numero & ~mascara_ip(prefijo) & 0xFFFFFFFF:
+        raise ValueError(f"La red {texto.strip()} tiene bits de host: "
+                         f"usa {texto_ip(numero & mascara_ip(prefijo))}/{prefijo}")
+    return numero, prefijo
+
+
+def mascara_ip(prefijo):
+    """Máscara de red de un prefijo como entero (/24 → 0xFFFFFF00)"""
+    return (0xFFFFFFFF << (32 - prefijo)) & 0xFFFFFFFF
+
+
+def texto_ip(numero):
+    """Dirección IPv4 en formato XXX.XXX.XXX.XXX a partir de un entero"""
+    return f"{numero >> 24}.{(numero >> 16) & 255}.{(numero >> 8) & 255}.{numero & 255}"
+
+
+def es_ip_o_red_valida(texto):
+    """
+    Valida que una cadena sea una IP o una red CIDR (IPv4).
+    
+    Args:
+        texto: Cadena a validar
+        
+    Returns:
+        bool: True si es válida, False si no
+    """
+    try:
+        leer_red_ip(texto)
+    except ValueError:
+        return False
+    return True
+
+
 # Tipos de validación soportados
 TIPOS_VALIDACION = {
     'ip': {
         'nombre': 'Dirección IP',
-        'validador': es_ip_valida,
+        'validador': es_ip_o_red_valida,
         'ejemplo': '192.168.1.100',
-        'descripcion': 'Dirección IPv4 (formato: XXX.XXX.XXX.XXX)'
+        'descripcion': 'Dirección IPv4 (formato: XXX.XXX.XXX.XXX) o red CIDR (10.1.0.0/16)'
     },
     'texto': {
         'nombre': 'Texto libre',
         'validador': lambda x: len(x.strip()) > 0,
         'ejemplo': 'cualquier texto',
         'descripcion': 'Cualquier texto (no puede estar vacío)'
+    },
+    'regex': {
+        'nombre': 'Expresión regular',
+        'validador': lambda x: es_regex_valida(x),
+        'ejemplo': r'host=10\.0\.0\.1:([0-9]{2,5})',
+        'descripcion': 'Expresión regular ASCII de largo acotado, sin *, + ni anclas '
+                       '(el reemplazo puede usar \\1, \\2...)'
     }
 }
 
 
+# Opciones locales admitidas en (?i:...); x cambia cómo se lee la expresión
+OPCIONES_LOCALES_REGEX = set('aimsL-')
+
+
+def leer_regex(patron):
+    """
+    Lee una expresión regular del subconjunto admitido a una lista de elementos.
+    
+    Cada elemento es ('texto', 1) para un carácter, clase o punto, ('borde', 0)
+    para \\b o \\B, ('grupo', elementos), ('alternativa', [ramas]) o
+    ('repeticion', minimo, maximo, elementos), con maximo None si no tiene
+    tope. La sintaxis ya fue validada por re.compile: aquí solo se reconoce
+    la forma de la expresión y se rechaza lo que queda fuera del subconjunto.
+    
+    Args:
+        patron: Expresión regular ASCII
+        
+    Returns:
+        list: Elementos de la expresión
+        
+    Raises:
+        ValueError: Si la expresión usa algo fuera del subconjunto admitido
+    """
+    posicion = 0
+    
+    def leer_alternativa():
+        nonlocal posicion
+        ramas = [leer_secuencia()]
+        while posicion < len(patron) and patron[posicion] == '|':
+            posicion += 1
+            ramas.append(leer_secuencia())
+        return ramas[0] if len(ramas) == 1 else [('alternativa', ramas)]
+    
+    def leer_secuencia():
+        nonlocal posicion
+        elementos = []
+        while posicion < len(patron) and patron[posicion] not in '|)':
+            elemento = leer_atomo()
+            repeticion = leer_cuantificador()
+            if repeticion is not None:
+                elemento = ('repeticion', repeticion[0], repeticion[1], [elemento])
+            elementos.append(elemento)
+        return elementos
+    
+    def leer_cuantificador():
+        nonlocal posicion
+        if posicion >= len(patron):
+            return None
+        caracter = patron[posicion]
+        if caracter in '*+?':
+            posicion += 1
+            limites = {'*': (0, None), '+': (1, None), '?': (0, 1)}[caracter]
+        elif caracter == '{':
+            llaves = re.match(r'\{(\d*)(?:,(\d*))?\}', patron[posicion:])
+            if not llaves or llaves.group(0) == '{}':
+                return None
+            posicion += len(llaves.group(0))
+            minimo = int(llaves.group(1)) if llaves.group(1) else 0
+            if llaves.group(2) is None:
+                maximo = minimo
+            else:
+                maximo = int(llaves.group(2)) if llaves.group(2) else None
+            limites = (minimo, maximo)
+        else:
+            return None
+        # Versión perezosa (?) o posesiva (+): mismos caminos como cota
+        if posicion < len(patron) and patron[posicion] in '?+':
+            posicion += 1
+        return limites
+    
+    def leer_atomo():
+        nonlocal posicion
+        caracter = patron[posicion]
+        posicion += 1
+        if caracter == '(':
+            return leer_grupo()
+        if caracter == '[':
+            leer_clase()
+            return ('texto', 1)
+        if caracter == '\\':
+            return leer_escape()
+        if caracter in '^$':
+            raise ValueError("no se admiten anclas (^, $, \\A, \\Z): el documento se procesa por bloques")
+        return ('texto', 1)
+    
+    def leer_grupo():
+        nonlocal posicion
+        if patron.startswith('?', posicion):
+            resto = patron[posicion + 1:]
+            if resto.startswith(('P<', '<')) and not resto.startswith(('<=', '<!')):
+                raise ValueError("no se admiten grupos con nombre; usa grupos numerados y \\1, \\2...")
+            if resto.startswith(('=', '!', '<=', '<!')):
+                raise ValueError("no se admiten lookahead ni lookbehind ((?=...), (?!...), (?<=...), (?<!...))")
+            if resto.startswith('#'):
+                posicion = patron.index(')', posicion) + 1
+                return ('grupo', [])
+            if resto.startswith(('(', 'P=')):
+                raise ValueError("no se admiten referencias a grupos dentro de la expresión (\\1, (?(1)...))")
+            opciones = re.match(r'[a-zA-Z-]*', resto).group(0)
+            siguiente = resto[len(opciones):len(opciones) + 1]
+            if opciones and siguiente == ')':
+                raise ValueError("no se admiten opciones globales como (?i); usa (?i:...) en la parte que corresponda")
+            if siguiente not in (':', '>') or not set(opciones) <= OPCIONES_LOCALES_REGEX:
+                raise ValueError(f"construcción no admitida: (?{opciones}{siguiente}")
+            posicion += 1 + len(opciones) + 1
+        elementos = leer_alternativa()
+        posicion += 1  # ')'
+        return ('grupo', elementos)
+    
+    def leer_clase():
+        nonlocal posicion
+        if patron.startswith('^', posicion):
+            posicion += 1
+        if patron.startswith(']', posicion):
+            posicion += 1
+        while patron[posicion] != ']':
+            posicion += 2 if patron[posicion] == '\\' else 1
+        posicion += 1
+    
+    def leer_escape():
+        nonlocal posicion
+        caracter = patron[posicion]
+        posicion += 1
+        if caracter in 'bB':
+            return ('borde', 0)
+        if caracter in 'AZ':
+            raise ValueError("no se admiten anclas (^, $, \\A, \\Z): el documento se procesa por bloques")
+        if caracter == '0':
+            posicion += len(re.match(r'[0-7]{0,2}', patron[posicion:]).group(0))
+            return ('texto', 1)
+        if caracter.isdigit():
+            if caracter in '01234567' and re.match(r'[0-7]{2}', patron[posicion:]):
+                posicion += 2
+                return ('texto', 1)
+            raise ValueError("no se admiten referencias a grupos dentro de la expresión (\\1, (?(1)...))")
+        if caracter == 'x':
+            posicion += 2
+        return ('texto', 1)
+    
+    return leer_alternativa()
+
+
+def ancho_regex(elementos):
+    """
+    Largo mínimo y máximo de una coincidencia de la expresión.
+    
+    Args:
+        elementos: Expresión leída por leer_regex
+        
+    Returns:
+        tuple: (mínimo, máximo), con máximo None si no tiene tope
+    """
+    minimo, maximo = 0, 0
+    for elemento in elementos:
+        tipo = elemento[0]
+        if tipo in ('texto', 'borde'):
+            parcial_minimo = parcial_maximo = elemento[1]
+        elif tipo == 'grupo':
+            parcial_minimo, parcial_maximo = ancho_regex(elemento[1])
+        elif tipo == 'alternativa':
+            anchos = [ancho_regex(rama) for rama in elemento[1]]
+            parcial_minimo = min(ancho[0] for ancho in anchos)
+            maximos = [ancho[1] for ancho in anchos]
+            parcial_maximo = None if None in maximos else max(maximos)
+        else:
+            _, veces_minimo, veces_maximo, cuerpo = elemento
+            cuerpo_minimo, cuerpo_maximo = ancho_regex(cuerpo)
+            parcial_minimo = veces_minimo * cuerpo_minimo
+            if cuerpo_maximo == 0:
+                parcial_maximo = 0
+            elif veces_maximo is None or cuerpo_maximo is None:
+                parcial_maximo = None
+            else:
+                parcial_maximo = veces_maximo * cuerpo_maximo
+        minimo += parcial_minimo
+        maximo = None if maximo is None or parcial_maximo is None else maximo + parcial_maximo
+    return minimo, maximo
+
+
+def costo_regex(elementos):
+    """
+    Cota de los caminos que el motor de 're' puede probar para una expresión.
+    
+    Una secuencia multiplica los caminos de sus partes, una alternativa los
+    suma, y una repetición de hasta N veces de algo con k caminos suma
+    k^0 + k^1 + ... + k^N (con k = 1, N + 1). Si la cota está acotada, el
+    trabajo por posición del documento también, y la búsqueda completa es
+    lineal en el tamaño del documento.
+    
+    Args:
+        elementos: Expresión leída por leer_regex
+        
+    Returns:
+        int: Cota de caminos (PRESUPUESTO_REGEX + 1 si lo supera)
+    """
+    costo = 1
+    for elemento in elementos:
+        tipo = elemento[0]
+        if tipo in ('texto', 'borde'):
+            parcial = 1
+        elif tipo == 'grupo':
+            parcial = costo_regex(elemento[1])
+        elif tipo == 'alternativa':
+            parcial = sum(costo_regex(rama) for rama in elemento[1])
+        else:
+            _, _, maximo, cuerpo = elemento
+            base = costo_regex(cuerpo)
+            if maximo is None:
+                parcial = PRESUPUESTO_REGEX + 1
+            elif base == 1:
+                parcial = maximo + 1
+            else:
+                parcial, termino = 0, 1
+                for _ in range(maximo + 1):
+                    parcial += termino
+                    termino *= base
+                    if parcial > PRESUPUESTO_REGEX:
+                        break
+        costo = min(costo * parcial, PRESUPUESTO_REGEX + 1)
+    return costo
+
+
+def analizar_regex(patron):
+    """
+    Comprueba que la expresión de una regla 'regex' tenga búsqueda en tiempo lineal.
+    
+    El motor de 're' prueba alternativas hacia atrás (backtracking), y una
+    expresión como (a|aa)* puede tardar un tiempo exponencial. Por eso se
+    admite un subconjunto: texto ASCII, clases, grupos, alternativas y
+    repeticiones acotadas ({m,n}, ?), con un largo máximo de coincidencia
+    (LARGO_MAXIMO_REGEX) y una cota de caminos por posición
+    (PRESUPUESTO_REGEX, ver costo_regex). No se admiten *, +, anclas,
+    lookaround, referencias, grupos con nombre ni opciones globales como (?i)
+    (sí las locales: (?i:...)).
+    
+    Args:
+        patron: Expresión regular de la regla
+        
+    Returns:
+        tuple: (cantidad de grupos, largo máximo de una coincidencia)
+        
+    Raises:
+        ValueError: Con el motivo, si la expresión no se admite
+    """
+    if not isinstance(patron, str) or not patron.isascii():
+        raise ValueError("solo se admiten caracteres ASCII (usa \\xNN para otros bytes)")
+    try:
+        compilado = re.compile(patron.encode('ascii'))
+    except re.error as e:
+        raise ValueError(f"expresión inválida: {e}") from e
+    elementos = leer_regex(patron)
+    minimo, maximo = ancho_regex(elementos)
+    if minimo == 0:
+        raise ValueError("la expresión puede coincidir con un texto vacío")
+    if maximo is None or maximo > LARGO_MAXIMO_REGEX:
+        raise ValueError(f"una coincidencia puede superar {LARGO_MAXIMO_REGEX} caracteres; "
+                         "usa repeticiones acotadas como {1,50} en lugar de * o +")
+    if costo_regex(elementos) > PRESUPUESTO_REGEX:
+        raise ValueError("la expresión tiene demasiadas formas de coincidir (repeticiones anidadas o "
+                         "alternativas dentro de repeticiones) y podría volver lento el proceso")
+    return compilado.groups, maximo
+
+
+def es_regex_valida(patron):
+    """Indica si una expresión está en el subconjunto de analizar_regex"""
+    try:
+        analizar_regex(patron)
+        return True
+    except ValueError:
+        return False
+
+
+def leer_plantilla_regex(plantilla, grupos):
+    """
+    Separa el reemplazo de una regla 'regex' en texto y referencias a grupos.
+    
+    Se admiten \\1 a \\99 y \\g<N> (\\g<0> es la coincidencia completa);
+    \\\\ es una barra invertida. El resto del texto se copia tal cual.
+    
+    Args:
+        plantilla: Texto de 'reemplazar_por'
+        grupos: Cantidad de grupos de la expresión
+        
+    Returns:
+        list: Partes: textos (str) y números de grupo (int)
+        
+    Raises:
+        ValueError: Si se usa un grupo que la expresión no tiene
+    """
+    partes = []
+    posicion = 0
+    for referencia in PATRON_PLANTILLA_REGEX.finditer(plantilla):
+        partes.append(plantilla[posicion:referencia.start()])
+        if referencia.group(3):
+            partes.append('\\')
+        else:
+            grupo = int(referencia.group(1) or referencia.group(2))
+            if grupo > grupos:
+                raise ValueError(f"el reemplazo usa el grupo {grupo} y la expresión tiene {grupos}")
+            partes.append(grupo)
+        posicion = referencia.end()
+    partes.append(plantilla[posicion:])
+    return [parte for parte in partes if parte != '']
+
+
 def validar_valor_por_tipo(valor, tipo, campo_nombre, numero_reemplazo):
     """
     Valida un valor según su tipo configurado.
@@ -110,6 +743,262 @@ def mostrar_banner():
     print("")
 
 
+def error_regla(buscar, reemplazar, tipo):
+    """
+    Valida los valores de una regla sin imprimir nada (para tablas de reglas).
+    
+    Args:
+        buscar: Valor a buscar
+        reemplazar: Valor de reemplazo
+        tipo: Tipo de validación ('ip', 'texto', 'regex')
+        
+    Returns:
+        str: Motivo por el que la regla no es válida, o None si es válida
+    """
+    if tipo == 'regex':
+        try:
+            grupos, _ = analizar_regex(buscar)
+            leer_plantilla_regex(reemplazar, grupos)
+        except ValueError as e:
+            return str(e)
+        return None
+    
+    if tipo == 'ip':
+        try:
+            _, prefijo_buscar = leer_red_ip(buscar)
+            _, prefijo_destino = leer_red_ip(reemplazar)
+        except ValueError as e:
+            return f"{e} ('{buscar}' → '{reemplazar}')"
+        if prefijo_destino not in (prefijo_buscar, 32):
+            return f"cambia el tamaño de la red: '{buscar}' → '{reemplazar}'"
+        return None
+    
+    info_tipo = TIPOS_VALIDACION[tipo]
+    if not info_tipo['validador'](buscar):
+        return f"valor a buscar no válido ({info_tipo['nombre']}): '{buscar}'"
+    if not info_tipo['validador'](reemplazar):
+        return f"valor de reemplazo no válido ({info_tipo['nombre']}): '{reemplazar}'"
+    return None
+
+
+def normalizar_tablas(tablas):
+    """
+    Convierte la sección 'tablas' de reemplazo_texto en una lista de diccionarios.
+    
+    Args:
+        tablas: Ruta (str), diccionario con 'archivo', lista de ellos, o None
+        
+    Returns:
+        list: Diccionarios con 'archivo' y, opcionalmente, 'tipo', 'ambito' y 'separador'
+        
+    Raises:
+        ValueError: Si alguna tabla no indica su archivo o tiene un tipo desconocido
+    """
+    if not tablas:
+        return []
+    if isinstance(tablas, (str, dict)):
+        tablas = [tablas]
+    resultado = []
+    for tabla in tablas:
+        if isinstance(tabla, str):
+            tabla = {'archivo': tabla}
+        if not isinstance(tabla, dict) or not isinstance(tabla.get('archivo'), str) or not tabla['archivo'].strip():
+            raise ValueError(f"Cada tabla debe ser una ruta o un objeto con 'archivo': {tabla!r}")
+        if tabla.get('tipo', 'texto') not in TIPOS_VALIDACION:
+            raise ValueError(f"Tipo desconocido en la tabla {tabla['archivo']}: '{tabla['tipo']}'")
+        resultado.append(tabla)
+    return resultado
+
+
+def abrir_tabla(ruta, separador=None):
+    """
+    Abre una tabla CSV/TSV de reglas (comprimida o no con gzip) para leerla por filas.
+    
+    Args:
+        ruta: Ruta del archivo (.csv, .tsv o .tab, con .gz opcional)
+        separador: Separador de columnas (por defecto, según la extensión)
+        
+    Returns:
+        tuple: (lector csv, archivo abierto)
+        
+    Raises:
+        ValueError: Si no se indica el separador y la extensión no es conocida
+        OSError: Si no se puede abrir el archivo
+    """
+    nombre = ruta.lower()
+    comprimida = nombre.endswith('.gz')
+    if comprimida:
+        nombre = nombre[:-3]
+    if separador is None:
+        separador = SEPARADORES_TABLA.get(os.path.splitext(nombre)[1])
+        if separador is None:
+            raise ValueError(f"No se reconoce la extensión de {ruta} (usa .csv, .tsv o .tab, "
+                             f"o indica 'separador')")
+    
+    # utf-8-sig: las tablas exportadas desde Excel empiezan con BOM
+    if comprimida:
+        archivo = gzip.open(ruta, 'rt', encoding='utf-8-sig', newline='')
+    else:
+        archivo = open(ruta, 'r', encoding='utf-8-sig', newline='')
+    return csv.reader(archivo, delimiter=separador), archivo
+
+
+def leer_tabla_reglas(tabla, directorio_base, errores):
+    """
+    Lee las reglas de una tabla fila por fila, validando cada una.
+    
+    Cada fila tiene dos columnas: valor a buscar y reemplazo. Se ignoran las
+    filas vacías, las que empiezan con '#' y una cabecera
+    'buscar,reemplazar_por'. Los errores no se imprimen: se agregan a
+    'errores' para informarlos todos juntos.
+    
+    Args:
+        tabla: Diccionario de normalizar_tablas
+        directorio_base: Directorio desde el que se resuelven las rutas relativas
+        errores: Lista donde se agregan los errores como (origen, motivo)
+        
+    Yields:
+        tuple: (origen 'archivo:línea', regla)
+    """
+    ruta = os.path.join(directorio_base, tabla['archivo'])
+    tipo = tabla.get('tipo', 'texto')
+    ambito = tabla.get('ambito')
+    try:
+        lector, archivo = abrir_tabla(ruta, tabla.get('separador'))
+    except (OSError, ValueError) as e:
+        errores.append((tabla['archivo'], str(e)))
+        return
+    
+    with archivo:
+        primera = True
+        try:
+            for fila in lector:
+                origen = f"{tabla['archivo']}:{lector.line_num}"
+                if not any(valor.strip() for valor in fila) or fila[0].lstrip().startswith('#'):
+                    continue
+                if primera:
+                    primera = False
+                    if [valor.strip().lower() for valor in fila[:2]] == ['buscar', 'reemplazar_por']:
+                        continue
+                if len(fila) < 2 or any(valor.strip() for valor in fila[2:]):
+                    errores.append((origen, f"se esperaban 2 columnas y hay {len(fila)}"))
+                    continue
+                
+                buscar, reemplazar = fila[0], fila[1]
+                motivo = error_regla(buscar, reemplazar, tipo)
+                if motivo is not None:
+                    errores.append((origen, motivo))
+                    continue
+                regla = {'buscar': buscar, 'reemplazar_por': reemplazar, 'tipo': tipo}
+                if ambito:
+                    regla['ambito'] = ambito
+                yield origen, regla
+        except (csv.Error, UnicodeDecodeError, OSError, EOFError) as e:
+            errores.append((f"{tabla['archivo']}:{lector.line_num}", f"no se pudo leer: {e}"))
+
+
+def clave_regla(regla):
+    """Identidad de una regla para detectar repetidas (las IP, por red)"""
+    tipo = regla.get('tipo', 'texto')
+    if tipo == 'ip':
+        return ('ip',) + leer_red_ip(regla['buscar'])
+    return (tipo, regla['buscar'])
+
+
+def mostrar_ejemplos(ejemplos, total):
+    """Imprime los primeros ejemplos de un error o advertencia, y cuántos más hay"""
+    for ejemplo in ejemplos[:EJEMPLOS_TABLA]:
+        print(f"   {ejemplo}")
+    if total > EJEMPLOS_TABLA:
+        print(f"   ... y {total - EJEMPLOS_TABLA} más")
+
+
+def cargar_tablas_reglas(tablas, reglas, directorio_base):
+    """
+    Carga las tablas de reglas y las revisa en conjunto.
+    
+    Las filas se leen y validan una por una, sin imprimir nada, y al final
+    se informa un solo resumen: todos los errores (con archivo y línea),
+    las reglas repetidas y las que se superponen. Una regla que repite el
+    valor a buscar de otra (de la configuración o de una tabla) con otro
+    reemplazo es un error; con el mismo reemplazo se ignora. Los textos
+    que son el comienzo de otro y las redes dentro de otra red solo se
+    advierten: gana el más largo y la más específica.
+    
+    Args:
+        tablas: Lista de normalizar_tablas
+        reglas: Reglas de la configuración (van antes que las de las tablas)
+        directorio_base: Directorio desde el que se resuelven las rutas relativas
+        
+    Returns:
+        tuple: (lista de reglas de las tablas, lista de (archivo, cantidad de
+               reglas)), o None si hay errores
+    """
+    errores = []
+    vistos = {}
+    for i, regla in enumerate(reglas, 1):
+        vistos.setdefault(clave_regla(regla), (regla['reemplazar_por'], f"regla #{i}"))
+    
+    cargadas = []
+    resumen = []
+    repetidas = []
+    for tabla in tablas:
+        cantidad = 0
+        for origen, regla in leer_tabla_reglas(tabla, directorio_base, errores):
+            clave = clave_regla(regla)
+            anterior = vistos.get(clave)
+            if anterior is not None:
+                if anterior[0] != regla['reemplazar_por']:
+                    errores.append((origen, f"'{regla['buscar']}' ya tiene otro reemplazo en {anterior[1]}: "
+                                            f"'{anterior[0]}' / '{regla['reemplazar_por']}'"))
+                else:
+                    repetidas.append(f"{origen}: '{regla['buscar']}' (igual que {anterior[1]})")
+                continue
+            vistos[clave] = (regla['reemplazar_por'], origen)
+            cargadas.append(regla)
+            cantidad += 1
+        resumen.append((tabla['archivo'], cantidad))
+    
+    if errores:
+        print(f"\n❌ ERROR: Las tablas de reglas tienen {len(errores)} error(es)")
+        mostrar_ejemplos([f"{origen}: {motivo}" for origen, motivo in errores[:EJEMPLOS_TABLA]], len(errores))
+        print("   👉 Cada fila debe tener 2 columnas: valor a buscar y reemplazo")
+        return None
+    
+    if repetidas:
+        print(f"\n⚠️ ADVERTENCIA: {len(repetidas)} fila(s) repiten una regla anterior (se ignoran)")
+        mostrar_ejemplos(repetidas, len(repetidas))
+    
+    # Textos que empiezan a otro: en orden, el siguiente de cada texto es el
+    # único candidato a empezar con él
+    textos = sorted(clave[1] for clave in vistos if clave[0] == 'texto')
+    prefijos = [f"'{texto}' / '{siguiente}'" for texto, siguiente in zip(textos, textos[1:])
+                if siguiente.startswith(texto)]
+    if prefijos:
+        print(f"\n⚠️ ADVERTENCIA: {len(prefijos)} texto(s) a buscar son el comienzo de otro "
+              f"(gana el más largo)")
+        mostrar_ejemplos(prefijos, len(prefijos))
+    
+    redes = {}
+    for clave in vistos:
+        if clave[0] == 'ip':
+            redes.setdefault(clave[2], set()).add(clave[1])
+    contenidas = []
+    for prefijo, numeros in redes.items():
+        mayores = [p for p in redes if p < prefijo]
+        for numero in numeros:
+            for p in mayores:
+                if numero & mascara_ip(p) in redes[p]:
+                    contenidas.append(f"{texto_ip(numero)}/{prefijo} dentro de "
+                                      f"{texto_ip(numero & mascara_ip(p))}/{p}")
+                    break
+    if contenidas:
+        print(f"\n⚠️ ADVERTENCIA: {len(contenidas)} red(es) están dentro de otra (gana la más específica)")
+        mostrar_ejemplos(sorted(contenidas), len(contenidas))
+    
+    return cargadas, resumen
+
+
 def cargar_configuracion(ruta_config):
     """
     Carga el archivo de configuración JSON.
@@ -132,28 +1021,69 @@ def cargar_configuracion(ruta_config):
         with open(ruta_config, 'r', encoding='utf-8') as f:
             config = json.load(f)
         
-        # Validar campos requeridos
-        campos_requeridos = ['modulos', 'postfijo', 'carpeta_entrada', 'carpeta_salida']
-        for campo in campos_requeridos:
-            if campo not in config:
-                print(f"\n❌ ERROR: Falta el campo '{campo}' en config.json")
-                return None
-        
-        # Verificar que hay al menos un módulo activo
-        modulos_activos = [nombre for nombre, mod in config['modulos'].items() if mod.get('activo', False)]
-        if not modulos_activos:
-            print("\n❌ ERROR: No hay módulos activos en config.json")
-            print("   👉 Activa al menos un módulo poniendo 'activo': true")
-            return None
-        
-        print(f"   ✅ Módulos activos: {', '.join(modulos_activos)}")
-        
-        # Validar módulo de reemplazo_texto si está activo
-        if 'reemplazo_texto' in config['modulos'] and config['modulos']['reemplazo_texto'].get('activo', False):
-            modulo_reemplazo = config['modulos']['reemplazo_texto']
+    except json.JSONDecodeError as e:
+        print(f"\n❌ ERROR: El archivo config.json tiene un formato JSON inválido")
+        print(f"   Detalle: {str(e)}")
+        print("   👉 Revisa que las comas, comillas y llaves estén bien colocadas")
+        return None
+    except Exception as e:
+        print(f"\n❌ ERROR inesperado al cargar configuración: {str(e)}")
+        return None
+    
+    return validar_configuracion(config, os.path.dirname(os.path.abspath(ruta_config)))
+
+
+def validar_configuracion(config, directorio_base=None):
+    """
+    Valida una configuración ya cargada (campos, módulos y reglas).
+    
+    Si reemplazo_texto tiene 'tablas', sus reglas se cargan y se agregan
+    después de las de 'reglas' (ver cargar_tablas_reglas). La sección
+    'tablas' se reemplaza por 'tablas_cargadas' con la cantidad de reglas
+    de cada archivo.
+    
+    Args:
+        config: Diccionario de configuración
+        directorio_base: Directorio desde el que se resuelven las rutas de
+                         las tablas (por defecto, el de este script)
+        
+    Returns:
+        dict: La misma configuración si es válida, o None si hay error
+    """
+    try:
+        if not isinstance(config, dict):
+            print("\n❌ ERROR: La configuración debe ser un objeto JSON")
+            return None
+        
+        # Validar campos requeridos
+        campos_requeridos = ['modulos', 'postfijo', 'carpeta_entrada', 'carpeta_salida']
+        for campo in campos_requeridos:
+            if campo not in config:
+                print(f"\n❌ ERROR: Falta el campo '{campo}' en config.json")
+                return None
+        
+        # Verificar que hay al menos un módulo activo
+        modulos_activos = [nombre for nombre, mod in config['modulos'].items() if mod.get('activo', False)]
+        if not modulos_activos:
+            print("\n❌ ERROR: No hay módulos activos en config.json")
+            print("   👉 Activa al menos un módulo poniendo 'activo': true")
+            return None
+        
+        print(f"   ✅ Módulos activos: {', '.join(modulos_activos)}")
+        
+        # Validar módulo de reemplazo_texto si está activo
+        if 'reemplazo_texto' in config['modulos'] and config['modulos']['reemplazo_texto'].get('activo', False):
+            modulo_reemplazo = config['modulos']['reemplazo_texto']
             reglas = modulo_reemplazo.get('reglas', [])
+            try:
+                tablas = normalizar_tablas(modulo_reemplazo.get('tablas'))
+            except ValueError as e:
+                print("\n❌ ERROR: La sección 'tablas' de 'reemplazo_texto' no es válida")
+                print(f"   Detalle: {str(e)}")
+                print("   👉 Usa rutas a archivos .csv/.tsv o objetos como {\"archivo\": \"hosts.csv\", \"tipo\": \"texto\"}")
+                return None
             
-            if not reglas:
+            if not reglas and not tablas:
                 print("\n❌ ERROR: El módulo 'reemplazo_texto' no tiene reglas configuradas")
                 print("   👉 Agrega al menos una regla con 'buscar' y 'reemplazar_por'")
                 return None
@@ -171,27 +1101,91 @@ def cargar_configuracion(ruta_config):
                 valor_reemplazar = regla['reemplazar_por']
                 
                 # Validar según el tipo
-                if not validar_valor_por_tipo(valor_buscar, tipo, "valor a buscar", i+1):
+                if tipo == 'regex':
+                    # El reemplazo puede quedar vacío y usar grupos de la expresión
+                    try:
+                        grupos, _ = analizar_regex(valor_buscar)
+                        leer_plantilla_regex(valor_reemplazar, grupos)
+                    except ValueError as e:
+                        print(f"\n❌ ERROR: La expresión regular de la regla #{i+1} no es válida")
+                        print(f"   Expresión: '{valor_buscar}'")
+                        print(f"   Detalle: {str(e)}")
+                        print(f"   👉 {TIPOS_VALIDACION['regex']['descripcion']} "
+                              f"(ej: {TIPOS_VALIDACION['regex']['ejemplo']})")
+                        return None
+                elif not validar_valor_por_tipo(valor_buscar, tipo, "valor a buscar", i+1):
+                    return None
+                elif not validar_valor_por_tipo(valor_reemplazar, tipo, "valor de reemplazo", i+1):
                     return None
                 
-                if not validar_valor_por_tipo(valor_reemplazar, tipo, "valor de reemplazo", i+1):
+                if tipo == 'ip':
+                    # Una red se traslada a otra del mismo tamaño, o se junta en una sola IP
+                    _, prefijo_buscar = leer_red_ip(valor_buscar)
+                    _, prefijo_destino = leer_red_ip(valor_reemplazar)
+                    if prefijo_destino not in (prefijo_buscar, 32):
+                        print(f"\n❌ ERROR: La regla #{i+1} cambia el tamaño de la red")
+                        print(f"   Buscar: '{valor_buscar}' → Reemplazar por: '{valor_reemplazar}'")
+                        print(f"   👉 Usa una red con el mismo prefijo (/{prefijo_buscar}) o una sola IP")
+                        return None
+                
+                # Validar el ámbito (opcional)
+                try:
+                    for expresion in normalizar_ambito(regla.get('ambito')):
+                        compilar_expresion_ambito(expresion)
+                except (ValueError, AttributeError, TypeError) as e:
+                    print(f"\n❌ ERROR: El ámbito de la regla #{i+1} no es válido")
+                    print(f"   Detalle: {str(e)}")
+                    print("   👉 Usa nombres de elemento o rutas como '//maplayer/datasource'")
                     return None
                 
                 if valor_buscar == valor_reemplazar:
                     print(f"\n⚠️ ADVERTENCIA: La regla #{i+1} tiene el mismo valor para buscar y reemplazar")
                     print(f"   Valor: '{valor_buscar}'")
+            
+            if tablas:
+                for tabla in tablas:
+                    try:
+                        for expresion in normalizar_ambito(tabla.get('ambito')):
+                            compilar_expresion_ambito(expresion)
+                    except (ValueError, AttributeError, TypeError) as e:
+                        print(f"\n❌ ERROR: El ámbito de la tabla {tabla['archivo']} no es válido")
+                        print(f"   Detalle: {str(e)}")
+                        return None
+                
+                if directorio_base is None:
+                    directorio_base = os.path.dirname(os.path.abspath(__file__))
+                cargadas = cargar_tablas_reglas(tablas, reglas, directorio_base)
+                if cargadas is None:
+                    return None
+                reglas_tablas, resumen = cargadas
+                if not reglas and not reglas_tablas:
+                    print("\n❌ ERROR: Las tablas de 'reemplazo_texto' no tienen ninguna regla")
+                    return None
+                print(f"   ✅ Tablas de reglas: {len(reglas_tablas)} regla(s) de {len(resumen)} archivo(s)")
+                
+                # Las reglas de las tablas quedan como cualquier otra regla, sin
+                # modificar los diccionarios de quien pasó la configuración
+                modulo_reemplazo = {clave: valor for clave, valor in modulo_reemplazo.items() if clave != 'tablas'}
+                modulo_reemplazo['reglas'] = list(reglas) + reglas_tablas
+                modulo_reemplazo['tablas_cargadas'] = [{'archivo': archivo, 'reglas': cantidad}
+                                                       for archivo, cantidad in resumen]
+                config['modulos'] = dict(config['modulos'], reemplazo_texto=modulo_reemplazo)
+        
+        # Validar la política de compresión (opcional)
+        try:
+            resolver_compresion(config)
+        except ValueError as e:
+            print("\n❌ ERROR: La sección 'compresion' no es válida")
+            print(f"   Detalle: {str(e)}")
+            print(f"   👉 'politica' puede ser: {', '.join(POLITICAS_COMPRESION)}")
+            return None
         
         print("   ✅ Configuración cargada correctamente")
         print("   ✅ Todos los valores han sido validados")
         return config
         
-    except json.JSONDecodeError as e:
-        print(f"\n❌ ERROR: El archivo config.json tiene un formato JSON inválido")
-        print(f"   Detalle: {str(e)}")
-        print("   👉 Revisa que las comas, comillas y llaves estén bien colocadas")
-        return None
     except Exception as e:
-        print(f"\n❌ ERROR inesperado al cargar configuración: {str(e)}")
+        print(f"\n❌ ERROR inesperado al validar configuración: {str(e)}")
         return None
 
 
@@ -233,6 +1227,16 @@ def verificar_carpetas(config, directorio_base):
     return carpeta_entrada, carpeta_salida
 
 
+def es_archivo_qgz(nombre):
+    """
+    True si el nombre es el de un proyecto .qgz a procesar.
+    
+    Los archivos ocultos (que empiezan con '.') se ignoran: son temporales
+    de copias o subidas en curso.
+    """
+    return nombre.lower().endswith('.qgz') and not nombre.startswith('.')
+
+
 def obtener_archivos_qgz(carpeta_entrada):
     """
     Obtiene la lista de archivos .qgz en la carpeta de entrada.
@@ -248,7 +1252,7 @@ def obtener_archivos_qgz(carpeta_entrada):
     
     try:
         archivos = [f for f in os.listdir(carpeta_entrada) 
-                   if f.lower().endswith('.qgz') and os.path.isfile(os.path.join(carpeta_entrada, f))]
+                   if es_archivo_qgz(f) and os.path.isfile(os.path.join(carpeta_entrada, f))]
         
         if not archivos:
             print(f"\n⚠️ No se encontraron archivos .qgz en: {carpeta_entrada}")
@@ -266,220 +1270,2434 @@ def obtener_archivos_qgz(carpeta_entrada):
         return []
 
 
-def aplicar_reemplazos_seguro(contenido, reemplazos):
+def construir_patron_trie(textos):
     """
-    Aplica los reemplazos de forma segura evitando duplicaciones.
+    Construye una expresión regular con forma de árbol (trie) para un conjunto de textos.
     
-    Esta función usa un enfoque de "marcadores temporales" para evitar
-    que un reemplazo afecte a otro reemplazo posterior.
+    Los prefijos comunes se comparten y en cada bifurcación la rama más
+    larga se intenta primero, así que en cada posición el patrón encuentra
+    siempre la coincidencia más larga posible. La búsqueda avanza por el
+    árbol en vez de probar cada texto por separado.
     
     Args:
-        contenido: Texto donde hacer los reemplazos
-        reemplazos: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        textos: Lista de textos literales a buscar (no vacíos)
         
     Returns:
-        tuple: (contenido_modificado, dict_con_conteos)
+        str: Patrón de expresión regular equivalente a la alternativa de todos los textos
     """
-    conteos = {}
-    contenido_modificado = contenido
+    raiz = {}
+    for texto in textos:
+        nodo = raiz
+        for caracter in texto:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = True
     
-    # Primero, reemplazamos cada patrón por un marcador único temporal
-    marcadores = {}
-    for i, reemplazo in enumerate(reemplazos):
-        buscar = reemplazo['buscar']
-        reemplazar = reemplazo['reemplazar_por']
-        
-        # Crear un marcador único que no debería existir en el contenido
-        marcador = f"<<<MARCADOR_TEMP_{i}_{hash(buscar)}>>>"
-        marcadores[marcador] = reemplazar
+    def nodo_a_patron(nodo):
+        ramas = []
+        for caracter in sorted(c for c in nodo if c != ''):
+            # Comprimir los tramos sin bifurcaciones en un solo literal
+            tramo = caracter
+            hijo = nodo[caracter]
+            while len(hijo) == 1 and '' not in hijo:
+                siguiente = next(iter(hijo))
+                tramo += siguiente
+                hijo = hijo[siguiente]
+            ramas.append(re.escape(tramo) + nodo_a_patron(hijo))
         
-        # Contar ocurrencias antes del reemplazo
-        conteo = contenido_modificado.count(buscar)
-        conteos[buscar] = conteo
+        if not ramas:
+            return ''
+        if len(ramas) == 1 and '' not in nodo:
+            return ramas[0]
+        patron = '(?:' + '|'.join(ramas) + ')'
+        if '' in nodo:
+            # Opcional codicioso: prefiere seguir el texto más largo
+            patron += '?'
+        return patron
+    
+    return nodo_a_patron(raiz)
+
+
+def detectar_codificacion_xml(datos):
+    """
+    Lee la codificación declarada en el prólogo XML de un documento.
+    
+    Solo se examinan los primeros bytes del documento.
+    
+    Args:
+        datos: Bytes del documento (basta con el comienzo)
         
-        # Reemplazar por el marcador temporal
-        if conteo > 0:
-            contenido_modificado = contenido_modificado.replace(buscar, marcador)
+    Returns:
+        str: Nombre normalizado de la codificación ('utf-8' si no se declara)
+    """
+    if datos.startswith(codecs.BOM_UTF8):
+        return 'utf-8'
     
-    # Ahora reemplazamos todos los marcadores por sus valores finales
-    for marcador, valor_final in marcadores.items():
-        contenido_modificado = contenido_modificado.replace(marcador, valor_final)
+    coincidencia = PATRON_PROLOGO_XML.match(datos[:TAMANO_PROLOGO_XML])
+    if not coincidencia:
+        return 'utf-8'
     
-    return contenido_modificado, conteos
+    try:
+        return codecs.lookup(coincidencia.group(1).decode('ascii')).name
+    except LookupError:
+        return 'utf-8'
 
 
-def procesar_archivo_qgz(archivo_qgz, carpeta_entrada, carpeta_salida, config):
+def reglas_son_ascii(reglas):
     """
-    Procesa un archivo .qgz individual.
+    Indica si todas las reglas usan solo caracteres ASCII.
+    
+    Las reglas ASCII se pueden aplicar sobre los bytes de cualquier
+    documento compatible con ASCII (UTF-8, latin-1...) sin conocer su
+    codificación.
     
     Args:
-        archivo_qgz: Nombre del archivo .qgz
-        carpeta_entrada: Ruta a la carpeta de entrada
-        carpeta_salida: Ruta a la carpeta de salida
-        config: Diccionario de configuración
+        reglas: Lista de diccionarios con 'buscar' y 'reemplazar_por'
         
     Returns:
-        bool: True si se procesó correctamente, False si hubo error
+        bool: True si ninguna regla tiene caracteres fuera de ASCII
     """
-    ruta_entrada = os.path.join(carpeta_entrada, archivo_qgz)
-    
-    # Crear nombre de archivo de salida con postfijo
-    nombre_base = os.path.splitext(archivo_qgz)[0]
-    nombre_salida = f"{nombre_base}{config['postfijo']}.qgz"
-    ruta_salida = os.path.join(carpeta_salida, nombre_salida)
+    return all(regla['buscar'].isascii() and regla['reemplazar_por'].isascii()
+               for regla in reglas)
+
+
+def guardar_patron_cache(ruta, huella, patron):
+    """
+    Guarda el texto de la expresión de un motor en la caché de reglas.
     
-    # Verificar si el archivo de salida ya existe
-    if os.path.exists(ruta_salida):
-        print(f"   ⚠️ El archivo de salida ya existe, será sobrescrito: {nombre_salida}")
+    Se guarda el patrón ya armado (el árbol de textos y las alternativas),
+    no el programa compilado: al leerlo se compila con re.compile. El
+    archivo es un JSON con la huella de las reglas, la versión de Python y
+    un SHA-256 del patrón para comprobarlo al leerlo. Se escribe a un
+    temporal y se renombra, así que varios procesos pueden guardar el mismo
+    a la vez.
     
-    # Crear directorio temporal para trabajar
-    temp_dir = tempfile.mkdtemp()
+    Args:
+        ruta: Archivo de destino
+        huella: Huella de las reglas (huella_reglas)
+        patron: Expresión regular (str, o bytes para motores de bytes)
+    """
+    texto = patron.decode('latin-1') if isinstance(patron, bytes) else patron
+    datos = {'version': VERSION_CACHE_REGLAS, 'python': sys.version, 'huella': huella,
+             'bytes': isinstance(patron, bytes),
+             'sha256': hashlib.sha256(texto.encode('utf-8', 'surrogatepass')).hexdigest(),
+             'patron': texto}
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(ruta_temporal, 'w', encoding='utf-8', errors='surrogatepass') as f:
+        json.dump(datos, f, ensure_ascii=False)
+    os.replace(ruta_temporal, ruta)
     
-    try:
-        # Paso 1: Descomprimir el archivo .qgz
-        print(f"      → Descomprimiendo archivo .qgz...")
+    # Conservar solo los más usados recientemente
+    carpeta = os.path.dirname(ruta)
+    with os.scandir(carpeta) as entradas:
+        guardados = sorted((e for e in entradas if e.name.endswith(EXTENSION_CACHE_REGLAS)),
+                           key=lambda e: e.stat().st_mtime, reverse=True)
+    for entrada in guardados[MAXIMO_ARCHIVOS_CACHE_REGLAS:]:
         try:
-            with zipfile.ZipFile(ruta_entrada, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            print(f"      ✓ Archivo descomprimido correctamente")
-        except zipfile.BadZipFile:
-            print(f"      ✗ ERROR: El archivo no es un ZIP válido")
-            return False
-        except Exception as e:
-            print(f"      ✗ ERROR al descomprimir: {str(e)}")
-            return False
+            os.remove(entrada.path)
+        except OSError:
+            pass
+
+
+def leer_patron_cache(ruta, huella, en_bytes):
+    """
+    Lee el texto de la expresión de un motor de la caché de reglas.
+    
+    Solo se acepta si el archivo es de esta versión de la caché y de
+    Python, corresponde a estas reglas (huella) y el patrón no cambió desde
+    que se guardó (SHA-256).
+    
+    Args:
+        ruta: Archivo escrito por guardar_patron_cache
+        huella: Huella de las reglas que se están compilando
+        en_bytes: True si el motor trabaja sobre bytes
         
-        # Paso 2: Buscar archivo .qgs dentro del contenido descomprimido
-        print(f"      → Buscando archivos de proyecto (.qgs) dentro del .qgz...")
-        archivos_qgs = []
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                if file.lower().endswith('.qgs'):
-                    archivos_qgs.append(os.path.join(root, file))
+    Returns:
+        str o bytes: Patrón a compilar, o None si no existe o no sirve
+    """
+    try:
+        with open(ruta, 'r', encoding='utf-8', errors='surrogatepass') as f:
+            datos = json.load(f)
+        texto = datos['patron']
+        if (datos.get('version') != VERSION_CACHE_REGLAS or datos.get('python') != sys.version or
+                datos.get('huella') != huella or datos.get('bytes') != en_bytes or
+                datos.get('sha256') != hashlib.sha256(texto.encode('utf-8', 'surrogatepass')).hexdigest()):
+            return None
+        # Marcar como usado recientemente
+        os.utime(ruta)
+        return texto.encode('latin-1') if en_bytes else texto
+    except Exception:
+        return None
+
+
+def huella_reglas(reglas, codificacion):
+    """
+    Hash de un conjunto de reglas para una codificación (clave de la caché).
+    
+    Incluye la versión de Python: la caché en disco de otra versión no se usa.
+    
+    Args:
+        reglas: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        codificacion: Codificación del motor (o None para texto)
         
-        if not archivos_qgs:
-            print(f"      ✗ ERROR: No se encontró ningún archivo .qgs dentro del proyecto")
-            return False
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    datos = json.dumps([VERSION_CACHE_REGLAS, sys.version, codificacion,
+                        [[regla['buscar'], regla['reemplazar_por'], regla.get('tipo', 'texto')]
+                         for regla in reglas]])
+    return hashlib.sha256(datos.encode('ascii')).hexdigest()
+
+
+def motor_en_cache(reglas, codificacion):
+    """
+    Devuelve el motor compilado de unas reglas, compilándolo una sola vez.
+    
+    Los motores quedan en memoria (para los siguientes archivos del mismo
+    proceso) y, con MINIMO_REGLAS_CACHE_DISCO reglas o más, también en
+    CARPETA_CACHE_REGLAS: los demás procesos del lote y las ejecuciones
+    siguientes leen el patrón ya armado en lugar de armarlo de nuevo.
+    La clave es el hash de las reglas, así que cualquier cambio en ellas
+    genera un motor nuevo.
+    
+    Args:
+        reglas: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        codificacion: Codificación de los documentos (ver compilar_reglas)
         
-        print(f"      ✓ Se encontraron {len(archivos_qgs)} archivo(s) de proyecto")
+    Returns:
+        dict: Motor compilado con compilar_reglas
+    """
+    huella = huella_reglas(reglas, codificacion)
+    with _bloqueo_motores:
+        motor = _motores_en_memoria.get(huella)
+        if motor is not None:
+            _motores_en_memoria.move_to_end(huella)
+            return motor
+    
+    ruta_cache = None
+    if len(reglas) >= MINIMO_REGLAS_CACHE_DISCO and CARPETA_CACHE_REGLAS:
+        ruta_cache = os.path.join(CARPETA_CACHE_REGLAS, huella + EXTENSION_CACHE_REGLAS)
+    motor = compilar_reglas(reglas, codificacion, ruta_cache)
+    
+    with _bloqueo_motores:
+        _motores_en_memoria[huella] = motor
+        while len(_motores_en_memoria) > MAXIMO_MOTORES_EN_MEMORIA:
+            _motores_en_memoria.popitem(last=False)
+    return motor
+
+
+def precompilar_reglas(config):
+    """
+    Compila por adelantado el motor de las reglas sin ámbito si son ASCII.
+    
+    Así el motor ya está en memoria (modo secuencial) y en la caché en
+    disco (modo paralelo) antes de que empiecen los procesos de trabajo,
+    que entonces no lo compilan cada uno por su cuenta.
+    
+    Args:
+        config: Diccionario de configuración validado
+    """
+    modulo = config['modulos'].get('reemplazo_texto', {})
+    reglas = modulo.get('reglas', []) if modulo.get('activo', False) else []
+    if reglas and reglas_son_ascii(reglas) and not any(normalizar_ambito(regla.get('ambito'))
+                                                        for regla in reglas):
+        motor_en_cache(reglas, 'ascii')
+
+
+def compilar_reglas(reglas, codificacion=None, ruta_cache=None):
+    """
+    Compila las reglas de reemplazo en un motor de búsqueda de una sola pasada.
+    
+    Si dos reglas buscan el mismo texto, gana la primera. Las reglas
+    'regex' se agregan al mismo patrón como alternativas, cada una en su
+    propio grupo: en una misma posición, los textos literales tienen
+    prioridad y después las expresiones, en el orden de las reglas.
+    
+    Las reglas 'ip' no se buscan como texto: una sola alternativa, la
+    última, encuentra las direcciones IPv4 completas del documento, y cada
+    una se traslada con aritmética entera según la red más específica que
+    la contenga (si dos reglas tienen la misma red, gana la primera). Al
+    ser la última, un texto o una expresión que coincide en la misma
+    posición tiene prioridad, y buscar_coincidencias descarta las
+    direcciones que ninguna red incluye.
+    
+    Args:
+        reglas: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        codificacion: Codificación de los documentos a procesar. Si se indica,
+                      el motor trabaja sobre bytes en esa codificación; si es
+                      None, trabaja sobre texto (str)
+        ruta_cache: Archivo de la caché de reglas de donde leer el texto de
+                    la expresión, o donde guardarlo si no existe (opcional)
         
-        # Paso 3: Procesar cada archivo .qgs encontrado
-        total_reemplazos = {}
-        for ruta_qgs in archivos_qgs:
-            nombre_qgs = os.path.basename(ruta_qgs)
-            print(f"      → Leyendo contenido de: {nombre_qgs}")
-            
+    Returns:
+        dict: Motor compilado con 'patron' (expresión regular o None si no hay
+              nada que buscar), 'reemplazos' (valor buscado → reemplazo),
+              'claves' (valor buscado → texto de la regla, para los conteos),
+              'expresiones' (grupo → (texto de la regla, partes del
+              reemplazo), para las reglas 'regex'), 'redes_ip' (prefijo →
+              red → (destino, prefijo destino, texto de la regla)),
+              'prefijos_ip' (de mayor a menor), 'grupo_ip' (grupo de las
+              direcciones IP, o None), 'solapamiento' (bytes
+              que se conservan entre bloques), 'contexto' (bytes anteriores
+              que se necesitan para \\b) y 'orden' (textos buscados en el
+              orden de las reglas)
+    """
+    # Las expresiones y los tokens IP son ASCII: solo se buscan así en
+    # codificaciones compatibles con ASCII
+    compatible_ascii = codificacion is None or 'a'.encode(codificacion) == b'a'
+    reemplazos = {}
+    claves = {}
+    reglas_regex = []
+    redes_ip = {}
+    for regla in reglas:
+        if regla.get('tipo') == 'regex':
+            if compatible_ascii:
+                reglas_regex.append(regla)
+            continue
+        if regla.get('tipo') == 'ip' and compatible_ascii:
             try:
-                # Leer contenido del archivo .qgs
-                with open(ruta_qgs, 'r', encoding='utf-8') as f:
-                    contenido = f.read()
-                print(f"        ✓ Archivo leído ({len(contenido):,} caracteres)")
-            except UnicodeDecodeError:
-                # Intentar con otra codificación
-                print(f"        → Reintentando con codificación alternativa...")
-                try:
-                    with open(ruta_qgs, 'r', encoding='latin-1') as f:
-                        contenido = f.read()
-                    print(f"        ✓ Archivo leído con codificación latin-1")
-                except Exception as e:
-                    print(f"        ✗ ERROR al leer: {str(e)}")
-                    continue
-            
-            # Aplicar módulo de reemplazo_texto si está activo
-            if 'reemplazo_texto' in config['modulos'] and config['modulos']['reemplazo_texto'].get('activo', False):
-                reglas = config['modulos']['reemplazo_texto'].get('reglas', [])
-                print(f"      → Aplicando {len(reglas)} regla(s) de reemplazo...")
-                contenido_nuevo, conteos = aplicar_reemplazos_seguro(contenido, reglas)
-                
-                # Acumular conteos
-                for clave, valor in conteos.items():
-                    total_reemplazos[clave] = total_reemplazos.get(clave, 0) + valor
-                    if valor > 0:
-                        print(f"        ✓ '{clave}': {valor} coincidencia(s) encontrada(s)")
+                red, prefijo = leer_red_ip(regla['buscar'])
+                destino, prefijo_destino = leer_red_ip(regla['reemplazar_por'])
+            except ValueError:
+                # No es una IP: se busca como texto
+                pass
             else:
-                contenido_nuevo = contenido
-            
-            # Guardar archivo modificado
-            print(f"      → Guardando cambios en {nombre_qgs}...")
+                redes_ip.setdefault(prefijo, {}).setdefault(red, (destino, prefijo_destino, regla['buscar']))
+                continue
+        buscar = regla['buscar']
+        reemplazar = regla['reemplazar_por']
+        if codificacion is not None:
             try:
-                with open(ruta_qgs, 'w', encoding='utf-8') as f:
-                    f.write(contenido_nuevo)
-                print(f"        ✓ Cambios guardados")
-            except Exception as e:
-                print(f"        ✗ ERROR al guardar: {str(e)}")
-                return False
-        
-        # Mostrar resumen de reemplazos (solo si el módulo está activo)
-        total_cambios = sum(total_reemplazos.values())
-        if 'reemplazo_texto' in config['modulos'] and config['modulos']['reemplazo_texto'].get('activo', False):
-            reglas = config['modulos']['reemplazo_texto'].get('reglas', [])
-            print(f"")
-            print(f"      ┌─ RESUMEN DE REEMPLAZOS ─┐")
-            hay_reemplazos = False
-            for regla in reglas:
-                buscar = regla['buscar']
-                conteo = total_reemplazos.get(buscar, 0)
-                if conteo > 0:
-                    hay_reemplazos = True
-                    print(f"      │ '{buscar}' → '{regla['reemplazar_por']}': {conteo} veces")
-            
-            if not hay_reemplazos:
-                print(f"      │ Sin coincidencias encontradas")
-            else:
-                print(f"      │ Total: {total_cambios} reemplazo(s)")
-            print(f"      └──────────────────────────┘")
+                buscar = buscar.encode(codificacion)
+            except UnicodeEncodeError:
+                # El texto no puede aparecer literalmente en esta codificación
+                continue
+            # Los caracteres no representables se escriben como referencias XML
+            reemplazar = reemplazar.encode(codificacion, 'xmlcharrefreplace')
+        if buscar and buscar not in reemplazos:
+            reemplazos[buscar] = reemplazar
+            claves[buscar] = regla['buscar']
+    
+    expresiones = {}
+    alternativas = []
+    grupo = 1
+    largo_maximo = 0
+    for regla in reglas_regex:
+        grupos, largo = analizar_regex(regla['buscar'])
+        partes = leer_plantilla_regex(regla['reemplazar_por'], grupos)
+        if codificacion is not None:
+            partes = [parte if isinstance(parte, int) else parte.encode(codificacion, 'xmlcharrefreplace')
+                      for parte in partes]
+        expresiones[grupo] = (regla['buscar'], partes)
+        alternativas.append('(' + regla['buscar'] + ')')
+        grupo += grupos + 1
+        largo_maximo = max(largo_maximo, largo)
+    grupo_ip = None
+    if redes_ip:
+        alternativas.append(PATRON_TOKEN_IP)
+        grupo_ip = grupo
+        grupo += 1
+    
+    patron = None
+    if (reemplazos or alternativas) and ruta_cache:
+        huella = huella_reglas(reglas, codificacion)
+        texto_patron = leer_patron_cache(ruta_cache, huella, codificacion is not None)
+        if texto_patron is not None:
+            # La huella de las reglas ya es parte del nombre y del contenido
+            # del archivo: solo se comprueba que los grupos sean los esperados
+            patron = re.compile(texto_patron)
+            if patron.groups != grupo - 1:
+                patron = None
+    if (reemplazos or alternativas) and patron is None:
+        if not reemplazos:
+            texto_patron = ''
+        elif codificacion is None:
+            texto_patron = '(?:' + construir_patron_trie(reemplazos) + ')'
+        else:
+            # Cada byte se representa como un carácter latin-1 para construir el árbol
+            textos = [buscar.decode('latin-1') for buscar in reemplazos]
+            texto_patron = '(?:' + construir_patron_trie(textos) + ')'
+        texto_patron = '|'.join(([texto_patron] if texto_patron else []) + alternativas)
+        if codificacion is not None:
+            texto_patron = texto_patron.encode('latin-1')
+        patron = re.compile(texto_patron)
+        if ruta_cache:
+            try:
+                guardar_patron_cache(ruta_cache, huella, texto_patron)
+            except OSError:
+                pass
+    
+    # Con expresiones, se conserva un byte más al final de cada bloque (y uno
+    # antes del siguiente) para que \\b y las repeticiones vean su entorno
+    solapamiento = max((len(buscar) for buscar in reemplazos), default=1) - 1
+    if expresiones:
+        solapamiento = max(solapamiento, largo_maximo)
+    if redes_ip:
+        solapamiento = max(solapamiento, SOLAPAMIENTO_TOKEN_IP)
+    
+    return {
+        'patron': patron,
+        'reemplazos': reemplazos,
+        'claves': claves,
+        'expresiones': expresiones,
+        'redes_ip': redes_ip,
+        'prefijos_ip': sorted(redes_ip, reverse=True),
+        'grupo_ip': grupo_ip,
+        'solapamiento': solapamiento,
+        'contexto': 1 if alternativas else 0,
+        'orden': [regla['buscar'] for regla in reglas],
+    }
+
+
+def trasladar_ip(ip, motor):
+    """
+    Nueva dirección de una IP según las reglas 'ip' de un motor.
+    
+    Se busca la red más específica que contiene a la IP. Si el destino es
+    una red del mismo tamaño, se conservan los bits de host (10.1.2.3 con
+    10.1.0.0/16 → 172.20.0.0/16 queda 172.20.2.3); si es una sola IP,
+    todas las direcciones de la red pasan a ser esa IP.
+    
+    Args:
+        ip: Dirección encontrada (str, XXX.XXX.XXX.XXX)
+        motor: Motor compilado con compilar_reglas
         
-        # Paso 4: Crear nuevo archivo .qgz comprimido
-        print(f"      → Comprimiendo proyecto modificado...")
-        try:
-            with zipfile.ZipFile(ruta_salida, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        ruta_completa = os.path.join(root, file)
-                        ruta_relativa = os.path.relpath(ruta_completa, temp_dir)
-                        zipf.write(ruta_completa, ruta_relativa)
-            print(f"      ✓ Proyecto comprimido correctamente")
-        except Exception as e:
-            print(f"      ✗ ERROR al crear archivo de salida: {str(e)}")
-            return False
+    Returns:
+        tuple: (texto de la regla, nueva IP), o (None, None) si ninguna
+               regla la incluye o no es una IP válida
+    """
+    octetos = ip.split('.')
+    numero = 0
+    for octeto in octetos:
+        # Con ceros a la izquierda (010.0.0.1) no está claro qué dirección es: se deja igual
+        if int(octeto) > 255 or (len(octeto) > 1 and octeto[0] == '0'):
+            return None, None
+        numero = (numero << 8) | int(octeto)
+    
+    redes_ip = motor['redes_ip']
+    for prefijo in motor['prefijos_ip']:
+        mascara = mascara_ip(prefijo)
+        destino = redes_ip[prefijo].get(numero & mascara)
+        if destino is not None:
+            red_destino, prefijo_destino, clave = destino
+            if prefijo_destino == prefijo:
+                return clave, texto_ip(red_destino | (numero & ~mascara & 0xFFFFFFFF))
+            return clave, texto_ip(red_destino)
+    return None, None
+
+
+def expandir_reemplazo_grupo(coincidencia, motor):
+    """
+    Reemplazo de una coincidencia de una regla 'regex' o 'ip' de un motor.
+    
+    Args:
+        coincidencia: re.Match del patrón del motor (con lastindex)
+        motor: Motor compilado con compilar_reglas
         
-        print(f"")
-        print(f"   ✅ COMPLETADO → {nombre_salida}")
-        return True
+    Returns:
+        tuple: (texto de la regla, reemplazo con los grupos sustituidos), o
+               (None, None) si es una IP que no cambia
+    """
+    grupo = coincidencia.lastindex
+    if grupo == motor['grupo_ip']:
+        ip = coincidencia.group(grupo)
+        if isinstance(ip, str):
+            return trasladar_ip(ip, motor)
+        clave, nueva = trasladar_ip(ip.decode('ascii'), motor)
+        return clave, None if nueva is None else nueva.encode('ascii')
+    clave, partes = motor['expresiones'][grupo]
+    vacio = coincidencia.string[:0]
+    return clave, vacio.join(parte if not isinstance(parte, int) else (coincidencia.group(grupo + parte) or vacio)
+                             for parte in partes)
+
+
+def obtener_motor(motores, reglas, inicio_documento):
+    """
+    Devuelve el motor compilado adecuado para un documento.
+    
+    Si todas las reglas son ASCII se usa el mismo motor para cualquier
+    documento; si no, se lee la codificación del prólogo XML. Los motores
+    salen de motor_en_cache y se guardan en 'motores' para no volver a
+    buscarlos en el mismo documento.
+    
+    Args:
+        motores: Diccionario de motores ya compilados (se actualiza)
+        reglas: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        inicio_documento: Primeros bytes del documento
         
-    except Exception as e:
-        print(f"   ❌ ERROR inesperado: {str(e)}")
-        return False
+    Returns:
+        dict: Motor compilado con compilar_reglas
+    """
+    if 'ascii' in motores:
+        return motores['ascii']
+    if not motores and reglas_son_ascii(reglas):
+        motores['ascii'] = motor_en_cache(reglas, 'ascii')
+        return motores['ascii']
+    
+    codificacion = detectar_codificacion_xml(inicio_documento)
+    if codificacion not in motores:
+        motores[codificacion] = motor_en_cache(reglas, codificacion)
+    return motores[codificacion]
+
+
+def buscar_coincidencias(motor, contenido, inicio=0, fin=None):
+    """
+    Recorre las coincidencias de las reglas de un motor, con su reemplazo.
+    
+    Como finditer: de izquierda a derecha y sin solaparse. Una dirección IP
+    que ninguna red de las reglas incluye no es una coincidencia: queda
+    igual y la búsqueda sigue dentro de ella, así que los textos y las
+    expresiones que contiene (por ejemplo '0.0.1' en 10.0.0.1) se
+    reemplazan igual que si no hubiera reglas 'ip'.
+    
+    Args:
+        motor: Motor compilado con compilar_reglas (con patrón)
+        contenido: Texto o bytes donde buscar
+        inicio: Posición desde la que se busca
+        fin: Posición donde termina la búsqueda (por defecto, el final)
         
-    finally:
-        # Limpiar directorio temporal
-        try:
-            shutil.rmtree(temp_dir)
-        except:
-            pass
+    Yields:
+        tuple: (re.Match, texto de la regla, reemplazo)
+    """
+    patron = motor['patron']
+    tabla = motor['reemplazos']
+    claves = motor['claves']
+    if fin is None:
+        fin = len(contenido)
+    posicion = inicio
+    while True:
+        coincidencia = patron.search(contenido, posicion, fin)
+        if coincidencia is None:
+            return
+        if coincidencia.lastindex is None:
+            encontrado = coincidencia.group()
+            yield coincidencia, claves[encontrado], tabla[encontrado]
+        else:
+            clave, reemplazo = expandir_reemplazo_grupo(coincidencia, motor)
+            if clave is None:
+                # IP sin regla: dentro no puede empezar otra IP, pero sí un texto
+                posicion = coincidencia.start() + 1
+                continue
+            yield coincidencia, clave, reemplazo
+        posicion = coincidencia.end()
 
 
-def main():
-    """Función principal del programa."""
-    mostrar_banner()
+def aplicar_reemplazos_seguro(contenido, reemplazos, motor=None):
+    """
+    Aplica los reemplazos de forma segura evitando duplicaciones.
     
-    # Determinar directorio base (donde está el script)
-    directorio_base = os.path.dirname(os.path.abspath(__file__))
-    ruta_config = os.path.join(directorio_base, 'config.json')
+    Todas las reglas se buscan a la vez en un único recorrido del texto y
+    el resultado se construye en ese mismo recorrido. En cada posición se
+    elige la coincidencia más larga, y el texto ya reemplazado no se vuelve
+    a examinar, así que un reemplazo nunca afecta a otro.
     
-    print(f"📍 Directorio de trabajo: {directorio_base}\n")
+    El contenido puede ser texto (str) o bytes. Con bytes, todo lo que no
+    es un reemplazo queda idéntico al original, sin decodificar ni volver
+    a codificar el documento.
     
-    # Paso 1: Cargar configuración
-    config = cargar_configuracion(ruta_config)
-    if config is None:
-        print("\n" + "=" * 70)
-        print("❌ El programa no puede continuar debido a errores en la configuración.")
-        print("=" * 70)
-        if sys.stdin.isatty():
-            input("\nPresiona ENTER para cerrar...")
-        sys.exit(1)
+    Args:
+        contenido: Texto o bytes donde hacer los reemplazos
+        reemplazos: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        motor: Motor ya compilado con compilar_reglas (opcional). Si no se
+               indica, los bytes se tratan como UTF-8
+        
+    Returns:
+        tuple: (contenido_modificado, dict_con_conteos)
+    """
+    if motor is None:
+        codificacion = None if isinstance(contenido, str) else 'utf-8'
+        motor = compilar_reglas(reemplazos, codificacion)
     
-    # Mostrar módulos activos y su configuración
+    conteos = dict.fromkeys(motor['orden'], 0)
+    if motor['patron'] is None:
+        return contenido, conteos
+    
+    partes = []
+    posicion = 0
+    for coincidencia, clave, reemplazo in buscar_coincidencias(motor, contenido):
+        partes.append(contenido[posicion:coincidencia.start()])
+        partes.append(reemplazo)
+        conteos[clave] += 1
+        posicion = coincidencia.end()
+    partes.append(contenido[posicion:])
+    return contenido[:0].join(partes), conteos
+
+
+def aplicar_reemplazos_en_bloques(origen, destino, reemplazos, motor=None,
+                                  tamano_bloque=TAMANO_BLOQUE_QGS, longitud=None, tramos=None):
+    """
+    Aplica los reemplazos leyendo y escribiendo por bloques de tamaño fijo.
+    
+    Equivale a aplicar_reemplazos_seguro sobre el documento completo, pero
+    la memoria usada no depende del tamaño del documento. Entre un bloque
+    y el siguiente se conserva el final del anterior (tantos bytes como el
+    texto buscado más largo) para encontrar también las coincidencias que
+    quedan partidas entre dos bloques.
+    
+    Con 'tramos', cada parte del documento usa su propio motor (las reglas
+    con ámbito activas en esa parte), pero el recorrido sigue siendo uno
+    solo: una coincidencia que empieza en un tramo se aplica completa
+    aunque termine en el siguiente, y \\b y los tokens IP ven los bytes
+    del tramo anterior.
+    
+    Args:
+        origen: Archivo binario abierto para lectura
+        destino: Archivo binario abierto para escritura, o None para solo
+                 contar las coincidencias sin generar el resultado
+        reemplazos: Lista de diccionarios con 'buscar' y 'reemplazar_por'
+        motor: Motor compilado con compilar_reglas para bytes (opcional,
+               por defecto UTF-8)
+        tamano_bloque: Bytes a leer en cada bloque
+        longitud: Bytes a procesar desde la posición actual de origen
+                  (por defecto, hasta el final)
+        tramos: Lista de (fin, motor) en orden, con 'fin' contado desde la
+                posición actual de origen; el último tiene fin None (hasta
+                el final). También puede ser un AmbitosEnStreaming, que
+                entonces tiene que ser además 'origen'. Si se indica,
+                reemplaza a 'motor'
+        
+    Returns:
+        dict: Conteo de coincidencias por regla
+    """
+    if tramos is None:
+        if motor is None:
+            motor = compilar_reglas(reemplazos, 'utf-8')
+        tramos = [(None, motor)]
+    # Con ámbitos en streaming los tramos se conocen a medida que se lee
+    ambitos = tramos if isinstance(tramos, AmbitosEnStreaming) else None
+    if ambitos is not None:
+        tramos = ambitos.tramos
+        posibles = [ambitos.motor_completo]
+    else:
+        posibles = [motor_tramo for _, motor_tramo in tramos]
+    
+    conteos = {}
+    for motor_tramo in posibles:
+        conteos.update((clave, 0) for clave in motor_tramo['orden'] if clave not in conteos)
+    hay_patron = any(motor_tramo['patron'] is not None for motor_tramo in posibles)
+    # Bytes del final de un bloque que todavía podrían formar parte de una coincidencia
+    solapamiento = max(motor_tramo['solapamiento'] for motor_tramo in posibles)
+    contexto = max(motor_tramo['contexto'] for motor_tramo in posibles)
+    
+    restante = longitud
+    previo = b''
+    pendiente = b''
+    # Posición en el documento del primer byte de 'datos', y tramo actual
+    base = 0
+    indice = 0
+    while True:
+        if restante is None:
+            bloque = origen.read(tamano_bloque)
+        else:
+            bloque = origen.read(min(tamano_bloque, restante)) if restante > 0 else b''
+            restante -= len(bloque)
+        ultimo = not bloque
+        # 'previo' son bytes ya escritos: solo se usan como entorno de la búsqueda
+        datos = previo + pendiente + bloque
+        inicio = len(previo)
+        if not hay_patron:
+            if destino is not None:
+                destino.write(datos[inicio:])
+            if ultimo:
+                break
+            base += len(datos)
+            pendiente = b''
+            continue
+        
+        # Solo se confirman coincidencias que empiezan antes de este límite:
+        # a partir de ahí una coincidencia más larga podría seguir en el próximo bloque
+        limite = len(datos) if ultimo else len(datos) - solapamiento
+        # Ni después de lo que el parser XML ya dejó decidido
+        if ambitos is not None and ambitos.decidido is not None:
+            limite = min(limite, ambitos.decidido - base)
+        salida = []
+        posicion = inicio
+        # Fin del último reemplazo: puede pasar del límite o del tramo
+        consumido = inicio
+        actual = inicio
+        while actual < limite:
+            while tramos[indice][0] is not None and tramos[indice][0] <= base + actual:
+                indice += 1
+            fin_tramo, motor_tramo = tramos[indice]
+            # Coincidencias que empiezan en este tramo; pueden terminar después
+            tope = limite if fin_tramo is None else min(limite, fin_tramo - base)
+            if motor_tramo['patron'] is not None:
+                for coincidencia, clave, reemplazo in buscar_coincidencias(
+                        motor_tramo, datos, actual, min(len(datos), tope + solapamiento)):
+                    if coincidencia.start() >= tope:
+                        break
+                    consumido = coincidencia.end()
+                    if destino is not None:
+                        salida.append(datos[posicion:coincidencia.start()])
+                        salida.append(reemplazo)
+                    conteos[clave] += 1
+                    posicion = coincidencia.end()
+            actual = max(tope, consumido)
+        
+        corte = max(consumido, limite)
+        if destino is not None:
+            salida.append(datos[posicion:corte])
+            destino.write(b''.join(salida))
+        previo = datos[max(corte - contexto, 0):corte]
+        base += corte - len(previo)
+        pendiente = datos[corte:]
+        if ultimo:
+            break
+    
+    return conteos
+
+
+def normalizar_ambito(ambito):
+    """
+    Convierte el ámbito de una regla en una tupla de expresiones.
+    
+    Args:
+        ambito: Expresión (str), lista de expresiones, o None
+        
+    Returns:
+        tuple: Expresiones del ámbito (vacía si la regla no tiene ámbito)
+    """
+    if not ambito:
+        return ()
+    if isinstance(ambito, str):
+        ambito = [ambito]
+    return tuple(expresion.strip() for expresion in ambito)
+
+
+def compilar_expresion_ambito(expresion):
+    """
+    Compila una expresión de ámbito en un patrón sobre la ruta de elementos.
+    
+    Se admite un subconjunto de XPath: nombres de elemento o '*' separados
+    por '/' (hijo directo) o '//' (a cualquier profundidad). Un nombre solo,
+    como 'datasource', equivale a '//datasource'; una expresión que empieza
+    con un único '/' se cuenta desde la raíz del documento.
+    
+    Args:
+        expresion: Expresión de ámbito, p. ej. '//maplayer/datasource'
+        
+    Returns:
+        re.Pattern: Patrón que coincide con rutas como '/qgis/projectlayers/maplayer'
+        
+    Raises:
+        ValueError: Si la expresión está vacía o usa sintaxis no soportada
+    """
+    texto = expresion.strip()
+    if not texto:
+        raise ValueError("el ámbito está vacío")
+    if not texto.startswith('/'):
+        texto = '//' + texto
+    
+    pasos = re.findall(r'(//?)([^/]*)', texto)
+    if ''.join(eje + nombre for eje, nombre in pasos) != texto:
+        raise ValueError(f"ámbito no válido: '{expresion}'")
+    
+    patron = ''
+    for eje, nombre in pasos:
+        if not PATRON_NOMBRE_ELEMENTO.fullmatch(nombre):
+            raise ValueError(f"ámbito no soportado: '{expresion}' "
+                             f"(solo nombres de elemento, '*', '/' y '//')")
+        paso = '[^/]+' if nombre == '*' else re.escape(nombre)
+        patron += ('(?:/[^/]+)*/' if eje == '//' else '/') + paso
+    return re.compile(patron + r'\Z')
+
+
+class AmbitosEnStreaming:
+    """
+    Lector de un documento .qgs que localiza los ámbitos mientras se lee.
+    
+    Cada bloque que se lee pasa también por un parser XML en streaming
+    (expat), sin construir el árbol completo, así que el documento se
+    recorre (y, dentro de un .qgz, se descomprime) una sola vez. El
+    contenido de un ámbito es el rango de bytes entre el final de la
+    etiqueta de apertura del elemento y el comienzo de la de cierre.
+    
+    'tramos' es la lista de (fin, motor) de aplicar_reemplazos_en_bloques:
+    crece a medida que se lee, y 'decidido' indica hasta qué byte del
+    documento ya se sabe qué ámbitos están activos (None = hasta el final).
+    Si el documento no es XML válido, desde ese punto solo se aplican las
+    reglas sin ámbito y se avisa.
+    """
+    
+    def __init__(self, origen, reglas, ambitos, motores, inicio_documento):
+        self.origen = origen
+        self.reglas = reglas
+        self.motores = motores
+        self.inicio_documento = inicio_documento
+        self.patrones = {ambito: [compilar_expresion_ambito(e) for e in ambito] for ambito in ambitos}
+        # Motor con todas las reglas: define el solapamiento y los conteos
+        self.motor_completo = self.motor(frozenset(ambitos))
+        self.tramos = [(None, self.motor(frozenset()))]
+        self.decidido = 0
+        self.activos = {}
+        self.inicio_tramo = 0
+        self.profundidad = dict.fromkeys(ambitos, 0)
+        self.pendientes = []
+        self.ruta = ['']
+        self.abiertos = []
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.StartElementHandler = self.al_abrir
+        self.parser.EndElementHandler = self.al_cerrar
+        self.parser.CharacterDataHandler = self.marcar_inicio
+        self.parser.CommentHandler = self.marcar_inicio
+        self.parser.ProcessingInstructionHandler = self.marcar_inicio
+        self.parser.StartCdataSectionHandler = self.marcar_inicio
+    
+    def motor(self, activos):
+        """Motor de las reglas sin ámbito más las de los ámbitos activos"""
+        reglas = [regla for regla in self.reglas
+                  if not regla.get('ambito') or normalizar_ambito(regla.get('ambito')) in activos]
+        return obtener_motor(self.motores.setdefault(activos, {}), reglas, self.inicio_documento)
+    
+    def cambiar(self, posicion, ambito, cambio):
+        """Activar o desactivar un ámbito desde una posición del documento"""
+        if posicion > self.inicio_tramo:
+            self.tramos[-1] = (posicion, self.tramos[-1][1])
+            self.tramos.append((None, None))
+            self.inicio_tramo = posicion
+        self.activos[ambito] = self.activos.get(ambito, 0) + cambio
+        if self.activos[ambito] == 0:
+            del self.activos[ambito]
+        self.tramos[-1] = (None, self.motor(frozenset(self.activos)))
+    
+    def marcar_inicio(self, *args):
+        # Lo anterior al evento actual ya no puede cambiar de ámbito
+        self.decidido = self.parser.CurrentByteIndex
+        # El contenido empieza con el primer evento tras la etiqueta de apertura
+        if self.pendientes:
+            for ambito in self.pendientes:
+                self.cambiar(self.decidido, ambito, 1)
+            self.pendientes.clear()
+    
+    def al_abrir(self, nombre, atributos):
+        self.marcar_inicio()
+        self.ruta.append(nombre)
+        camino = '/'.join(self.ruta)
+        abre = []
+        for ambito, expresiones in self.patrones.items():
+            if any(patron.match(camino) for patron in expresiones):
+                if self.profundidad[ambito] == 0:
+                    self.pendientes.append(ambito)
+                self.profundidad[ambito] += 1
+                abre.append(ambito)
+        self.abiertos.append(abre)
+    
+    def al_cerrar(self, nombre):
+        self.marcar_inicio()
+        for ambito in self.abiertos.pop():
+            self.profundidad[ambito] -= 1
+            if self.profundidad[ambito] == 0:
+                self.cambiar(self.decidido, ambito, -1)
+        self.ruta.pop()
+    
+    def read(self, cantidad=-1):
+        bloque = self.origen.read(cantidad)
+        if self.parser is None:
+            return bloque
+        try:
+            self.parser.Parse(bloque, not bloque)
+        except xml.parsers.expat.ExpatError as e:
+            print(f"   ⚠️ El .qgs no es un XML válido ({e}): las reglas con ámbito "
+                  f"no se aplican desde el byte {self.decidido:,}")
+            # Lo que sigue queda sin ámbitos
+            for ambito in list(self.activos):
+                self.cambiar(self.decidido, ambito, -self.activos[ambito])
+            self.parser = None
+        if self.parser is None or not bloque:
+            self.decidido = None
+        return bloque
+
+
+def aplicar_reglas_documento(abrir_origen, destino, reglas, motores,
+                             tamano_bloque=TAMANO_BLOQUE_QGS):
+    """
+    Aplica todas las reglas (con y sin ámbito) a un documento .qgs por bloques.
+    
+    El documento se lee una sola vez. Con reglas con ámbito, los ámbitos se
+    localizan con un parser XML en streaming mientras se lee (ver
+    AmbitosEnStreaming). Cada regla con ámbito solo actúa dentro de los
+    elementos de su ámbito; las reglas sin ámbito se aplican en un recorrido
+    continuo, igual que si no hubiera ámbitos, aunque el documento no sea
+    XML válido.
+    
+    Args:
+        abrir_origen: Función sin argumentos que abre el documento para
+                      lectura binaria
+        destino: Archivo binario abierto para escritura, o None para solo contar
+        reglas: Lista de diccionarios con 'buscar', 'reemplazar_por' y
+                opcionalmente 'ambito'
+        motores: Diccionario de motores ya compilados (se actualiza)
+        tamano_bloque: Bytes a leer en cada bloque
+        
+    Returns:
+        dict: Conteo de coincidencias por regla
+    """
+    ambitos = list(dict.fromkeys(normalizar_ambito(regla.get('ambito')) for regla in reglas))
+    ambitos = [ambito for ambito in ambitos if ambito]
+    
+    with abrir_origen() as origen:
+        inicio_documento = origen.peek(TAMANO_PROLOGO_XML)[:TAMANO_PROLOGO_XML]
+        if not ambitos:
+            motor = obtener_motor(motores.setdefault(frozenset(), {}), reglas, inicio_documento)
+            return aplicar_reemplazos_en_bloques(origen, destino, reglas, motor, tamano_bloque)
+        
+        lector = AmbitosEnStreaming(origen, reglas, ambitos, motores, inicio_documento)
+        parciales = aplicar_reemplazos_en_bloques(lector, destino, reglas, None, tamano_bloque,
+                                                  tramos=lector)
+    conteos = dict.fromkeys((regla['buscar'] for regla in reglas), 0)
+    for clave, valor in parciales.items():
+        conteos[clave] += valor
+    return conteos
+
+
+def resolver_compresion(config):
+    """
+    Lee la sección 'compresion' de la configuración, con sus valores por defecto.
+    
+    Args:
+        config: Diccionario de configuración
+        
+    Returns:
+        dict: 'politica', 'hilos' y 'umbral_paralelo_mb'
+        
+    Raises:
+        ValueError: Si algún valor no es válido
+    """
+    seccion = config.get('compresion') or {}
+    if not isinstance(seccion, dict):
+        raise ValueError("'compresion' debe ser un objeto")
+    compresion = dict(COMPRESION_POR_DEFECTO, **seccion)
+    
+    if compresion['politica'] not in POLITICAS_COMPRESION:
+        raise ValueError(f"política de compresión desconocida: {compresion['politica']!r}")
+    hilos = compresion['hilos']
+    if isinstance(hilos, bool) or not isinstance(hilos, int) or hilos < 0:
+        raise ValueError("'hilos' debe ser un número entero (0 = automático)")
+    umbral = compresion['umbral_paralelo_mb']
+    if isinstance(umbral, bool) or not isinstance(umbral, (int, float)) or umbral < 0:
+        raise ValueError("'umbral_paralelo_mb' debe ser un número de megabytes")
+    return compresion
+
+
+def metodo_compresion(compresion, miembro):
+    """
+    Método ZIP y nivel con que se escribe un .qgs modificado.
+    
+    Args:
+        compresion: Política resuelta con resolver_compresion
+        miembro: ZipInfo del miembro en el .qgz de entrada
+        
+    Returns:
+        tuple: (compress_type, nivel o None)
+    """
+    politica = POLITICAS_COMPRESION[compresion['politica']]
+    if politica is not None:
+        return politica
+    # 'original': mismo método; para deflate, el nivel que indica la cabecera
+    if miembro.compress_type == zipfile.ZIP_DEFLATED:
+        return zipfile.ZIP_DEFLATED, NIVEL_DEFLATE_POR_BITS[(miembro.flag_bits >> 1) & 0x03]
+    if miembro.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA):
+        return miembro.compress_type, None
+    return zipfile.ZIP_DEFLATED, zlib.Z_DEFAULT_COMPRESSION
+
+
+def comprimir_bloque_deflate(datos, diccionario, nivel, final):
+    """
+    Comprime un bloque como parte de un flujo deflate (sin cabecera zlib).
+    
+    Args:
+        datos: Bytes del bloque
+        diccionario: Final del bloque anterior (b'' para el primero)
+        nivel: Nivel de compresión de zlib
+        final: True si es el último bloque del flujo
+        
+    Returns:
+        bytes: Datos comprimidos del bloque
+    """
+    if diccionario:
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=diccionario)
+    else:
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compresor.compress(datos) + compresor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompresorDeflateParalelo:
+    """
+    Compresor deflate que reparte el trabajo entre varios hilos.
+    
+    Los datos se cortan en bloques que se comprimen por separado, cada uno
+    con los últimos 32 KB del anterior como diccionario y terminado con
+    Z_SYNC_FLUSH, así que concatenados forman un único flujo deflate válido
+    (como hace pigz). zlib libera el GIL mientras comprime. Tiene la misma
+    interfaz que zlib.compressobj, para usarlo con EscritorZip.abrir_miembro.
+    """
+    
+    def __init__(self, nivel, ejecutor, max_pendientes):
+        self.nivel = nivel
+        self.ejecutor = ejecutor
+        self.max_pendientes = max_pendientes
+        self.pendientes = collections.deque()
+        self.buffer = []
+        self.tamano_buffer = 0
+        self.diccionario = b''
+    
+    def _enviar(self, final):
+        datos = b''.join(self.buffer)
+        self.buffer = []
+        self.tamano_buffer = 0
+        self.pendientes.append(self.ejecutor.submit(
+            comprimir_bloque_deflate, datos, self.diccionario, self.nivel, final))
+        self.diccionario = datos[-TAMANO_DICCIONARIO_DEFLATE:]
+    
+    def _recoger(self, todos=False):
+        # Bloques ya comprimidos, en orden; espera si hay demasiados en vuelo
+        salida = []
+        while self.pendientes and (todos or self.pendientes[0].done() or
+                                   len(self.pendientes) > self.max_pendientes):
+            salida.append(self.pendientes.popleft().result())
+        return b''.join(salida)
+    
+    def compress(self, datos):
+        self.buffer.append(datos)
+        self.tamano_buffer += len(datos)
+        if self.tamano_buffer >= TAMANO_BLOQUE_DEFLATE:
+            self._enviar(final=False)
+        return self._recoger()
+    
+    def flush(self, modo=zlib.Z_FINISH):
+        self._enviar(final=True)
+        return self._recoger(todos=True)
+
+
+def fecha_hora_zip(fecha_hora):
+    """
+    Convierte una fecha (año, mes, día, hora, minuto, segundo) al formato de MS-DOS de los ZIP.
+    
+    Args:
+        fecha_hora: Tupla como ZipInfo.date_time
+        
+    Returns:
+        tuple: (fecha, hora) como enteros de 16 bits
+    """
+    anio, mes, dia, hora, minuto, segundo = fecha_hora
+    return (anio - 1980) << 9 | mes << 5 | dia, hora << 11 | minuto << 5 | segundo // 2
+
+
+class CompresorLzmaZip:
+    """
+    Compresor LZMA con la cabecera que piden los miembros ZIP.
+    
+    Antes de los datos va la versión del SDK de LZMA y las propiedades del
+    filtro (lc, lp, pb y diccionario), como escribe zipfile.
+    """
+    
+    def __init__(self):
+        self.compresor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[FILTRO_LZMA_ZIP])
+        propiedades = ((FILTRO_LZMA_ZIP['pb'] * 5 + FILTRO_LZMA_ZIP['lp']) * 9 + FILTRO_LZMA_ZIP['lc'])
+        self.cabecera = (struct.pack('<BBH', 9, 4, 5) + bytes([propiedades]) +
+                         struct.pack('<L', FILTRO_LZMA_ZIP['dict_size']))
+    
+    def compress(self, datos):
+        comprimidos = self.cabecera + self.compresor.compress(datos)
+        self.cabecera = b''
+        return comprimidos
+    
+    def flush(self, modo=None):
+        comprimidos = self.cabecera + self.compresor.flush()
+        self.cabecera = b''
+        return comprimidos
+
+
+def crear_compresor(metodo, nivel):
+    """
+    Crea el compresor de un método ZIP, con la interfaz de zlib.compressobj.
+    
+    Args:
+        metodo: Método ZIP (zipfile.ZIP_DEFLATED, ZIP_BZIP2, ZIP_LZMA o ZIP_STORED)
+        nivel: Nivel de compresión o None
+        
+    Returns:
+        Compresor, o None para ZIP_STORED
+    """
+    if metodo == zipfile.ZIP_STORED:
+        return None
+    if metodo == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if nivel is None else nivel,
+                                zlib.DEFLATED, -zlib.MAX_WBITS)
+    if metodo == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(nivel or 9)
+    if metodo == zipfile.ZIP_LZMA:
+        return CompresorLzmaZip()
+    raise ValueError(f"método de compresión no soportado: {metodo}")
+
+
+class MiembroZipAbierto:
+    """
+    Miembro de un EscritorZip que se está escribiendo por bloques.
+    
+    Comprime y escribe cada bloque al recibirlo, calculando el CRC y los
+    tamaños. Al cerrarlo se escribe el data descriptor con esos valores.
+    """
+    
+    def __init__(self, escritor, entrada, compresor):
+        self.escritor = escritor
+        self.entrada = entrada
+        self.compresor = compresor
+        self.crc = 0
+        self.tamano = 0
+        self.tamano_comprimido = 0
+        self.cerrado = False
+    
+    def _escribir_comprimido(self, datos):
+        self.escritor._escribir(datos)
+        self.tamano_comprimido += len(datos)
+    
+    def write(self, datos):
+        self.crc = zlib.crc32(datos, self.crc)
+        self.tamano += len(datos)
+        self._escribir_comprimido(self.compresor.compress(datos) if self.compresor else datos)
+        return len(datos)
+    
+    def close(self):
+        if self.cerrado:
+            return
+        self.cerrado = True
+        if self.compresor is not None:
+            self._escribir_comprimido(self.compresor.flush())
+        zip64 = self.entrada['zip64']
+        if not zip64 and max(self.tamano, self.tamano_comprimido) >= LIMITE_ZIP:
+            raise zipfile.LargeZipFile(f"'{self.entrada['miembro'].filename}' supera 4 GB sin extensiones ZIP64")
+        formato = '<4sLQQ' if zip64 else '<4sLLL'
+        self.escritor._escribir(struct.pack(formato, FIRMA_DATA_DESCRIPTOR, self.crc,
+                                            self.tamano_comprimido, self.tamano))
+        self.entrada.update(crc=self.crc, tamano=self.tamano, tamano_comprimido=self.tamano_comprimido)
+        self.escritor.directorio.append(self.entrada)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, tipo, *excepcion):
+        if tipo is None:
+            self.close()
+
+
+class EscritorZip:
+    """
+    Escritor mínimo de archivos ZIP (.qgz) que solo escribe hacia adelante.
+    
+    Escribe las cabeceras locales, los data descriptor y, al cerrar, el
+    directorio central, con las extensiones ZIP64 que hagan falta. A
+    diferencia de zipfile.ZipFile, acepta miembros ya comprimidos (para
+    copiarlos de otro .qgz sin recomprimirlos) y no necesita que el destino
+    admita seek. Se usa como bloque with: el directorio central solo se
+    escribe si el bloque termina sin errores.
+    """
+    
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.posicion = 0
+        self.directorio = []
+    
+    def _escribir(self, datos):
+        self.archivo.write(datos)
+        self.posicion += len(datos)
+    
+    def _cabecera_local(self, miembro, metodo, bits, version, zip64, crc=0, tamano_comprimido=0, tamano=0):
+        # Nombre en UTF-8 (bit 11) solo si no es ASCII; el data descriptor se decide aquí
+        bits &= ~(ZIP_FLAG_UTF8 | ZIP_FLAG_DATA_DESCRIPTOR)
+        if miembro.filename.isascii():
+            nombre = miembro.filename.encode('ascii')
+        else:
+            nombre = miembro.filename.encode('utf-8')
+            bits |= ZIP_FLAG_UTF8
+        extra = quitar_extra_zip64(miembro.extra)
+        extra_local = extra
+        if zip64:
+            extra_local = struct.pack('<HHQQ', ZIP_EXTRA_ZIP64, 16, tamano, tamano_comprimido) + extra
+            version = max(version, VERSION_ZIP64)
+        version = max(version, VERSION_ZIP_POR_METODO.get(metodo, VERSION_ZIP_POR_METODO[zipfile.ZIP_STORED]))
+        fecha, hora = fecha_hora_zip(miembro.date_time)
+        entrada = {'miembro': miembro, 'nombre': nombre, 'extra': extra, 'version': version, 'bits': bits,
+                   'metodo': metodo, 'fecha': fecha, 'hora': hora, 'crc': crc, 'tamano': tamano,
+                   'tamano_comprimido': tamano_comprimido, 'desplazamiento': self.posicion, 'zip64': zip64}
+        return entrada, nombre, extra_local
+    
+    def agregar_miembro(self, miembro, metodo, crc, tamano_comprimido, tamano, bloques, bits=0, version=0):
+        """
+        Agrega un miembro con sus datos ya comprimidos.
+        
+        Args:
+            miembro: ZipInfo con el nombre, la fecha, los atributos, el
+                     comentario y el campo extra del miembro
+            metodo: Método ZIP con que están comprimidos los datos
+            crc: CRC-32 de los datos sin comprimir
+            tamano_comprimido: Tamaño de los datos comprimidos, en bytes
+            tamano: Tamaño sin comprimir, en bytes
+            bloques: Iterable con los datos comprimidos
+            bits: Bits de opciones de la cabecera (cifrado, nivel de deflate...)
+            version: Versión mínima para extraer, además de la que pide el método
+            
+        Raises:
+            zipfile.BadZipFile: Si los bloques no suman tamano_comprimido
+        """
+        zip64 = max(tamano, tamano_comprimido) >= LIMITE_ZIP
+        entrada, nombre, extra_local = self._cabecera_local(miembro, metodo, bits, version, zip64,
+                                                            crc, tamano_comprimido, tamano)
+        self._escribir(struct.pack(FORMATO_CABECERA_LOCAL, FIRMA_CABECERA_LOCAL, entrada['version'],
+                                   entrada['bits'], metodo, entrada['hora'], entrada['fecha'], crc,
+                                   LIMITE_ZIP if zip64 else tamano_comprimido, LIMITE_ZIP if zip64 else tamano,
+                                   len(nombre), len(extra_local)))
+        self._escribir(nombre + extra_local)
+        escritos = 0
+        for bloque in bloques:
+            self._escribir(bloque)
+            escritos += len(bloque)
+        if escritos != tamano_comprimido:
+            raise zipfile.BadZipFile(f"Datos truncados en '{miembro.filename}'")
+        self.directorio.append(entrada)
+    
+    def abrir_miembro(self, miembro, metodo, compresor, bits=0, zip64=False):
+        """
+        Abre un miembro para escribirlo por bloques, comprimiéndolo al vuelo.
+        
+        El CRC y los tamaños se conocen al final: van en un data descriptor
+        después de los datos.
+        
+        Args:
+            miembro: ZipInfo con el nombre, la fecha y los atributos del miembro
+            metodo: Método ZIP que produce el compresor
+            compresor: Objeto con compress() y flush() (None para ZIP_STORED)
+            bits: Bits de opciones de la cabecera
+            zip64: True si el miembro puede superar los 4 GB
+            
+        Returns:
+            MiembroZipAbierto: Archivo para escribir los datos sin comprimir
+        """
+        entrada, nombre, extra_local = self._cabecera_local(miembro, metodo, bits, 0, zip64)
+        entrada['bits'] |= ZIP_FLAG_DATA_DESCRIPTOR
+        self._escribir(struct.pack(FORMATO_CABECERA_LOCAL, FIRMA_CABECERA_LOCAL, entrada['version'],
+                                   entrada['bits'], metodo, entrada['hora'], entrada['fecha'], 0,
+                                   LIMITE_ZIP if zip64 else 0, LIMITE_ZIP if zip64 else 0,
+                                   len(nombre), len(extra_local)))
+        self._escribir(nombre + extra_local)
+        return MiembroZipAbierto(self, entrada, compresor)
+    
+    def cerrar(self):
+        """Escribe el directorio central y el final del ZIP."""
+        inicio = self.posicion
+        for entrada in self.directorio:
+            miembro = entrada['miembro']
+            # Los valores que no entran en 32 bits van en el campo extra ZIP64
+            grandes = [valor for valor in (entrada['tamano'], entrada['tamano_comprimido'],
+                                           entrada['desplazamiento']) if valor >= LIMITE_ZIP]
+            extra = entrada['extra']
+            version = entrada['version']
+            if grandes:
+                extra = struct.pack(f'<HH{len(grandes)}Q', ZIP_EXTRA_ZIP64, 8 * len(grandes), *grandes) + extra
+                version = max(version, VERSION_ZIP64)
+            self._escribir(struct.pack(
+                FORMATO_DIRECTORIO_CENTRAL, FIRMA_DIRECTORIO_CENTRAL, max(version, miembro.create_version),
+                miembro.create_system, version, 0, entrada['bits'], entrada['metodo'], entrada['hora'],
+                entrada['fecha'], entrada['crc'], min(entrada['tamano_comprimido'], LIMITE_ZIP),
+                min(entrada['tamano'], LIMITE_ZIP), len(entrada['nombre']), len(extra), len(miembro.comment),
+                0, miembro.internal_attr, miembro.external_attr, min(entrada['desplazamiento'], LIMITE_ZIP)))
+            self._escribir(entrada['nombre'] + extra + miembro.comment)
+        
+        cantidad = len(self.directorio)
+        tamano_directorio = self.posicion - inicio
+        if cantidad >= LIMITE_MIEMBROS_ZIP or tamano_directorio >= LIMITE_ZIP or inicio >= LIMITE_ZIP:
+            inicio_zip64 = self.posicion
+            self._escribir(struct.pack(FORMATO_FIN_DIRECTORIO_ZIP64, FIRMA_FIN_DIRECTORIO_ZIP64,
+                                       struct.calcsize(FORMATO_FIN_DIRECTORIO_ZIP64) - 12, VERSION_ZIP64,
+                                       VERSION_ZIP64, 0, 0, cantidad, cantidad, tamano_directorio, inicio))
+            self._escribir(struct.pack(FORMATO_LOCALIZADOR_ZIP64, FIRMA_LOCALIZADOR_ZIP64, 0, inicio_zip64, 1))
+        self._escribir(struct.pack(FORMATO_FIN_DIRECTORIO, FIRMA_FIN_DIRECTORIO, 0, 0,
+                                   min(cantidad, LIMITE_MIEMBROS_ZIP), min(cantidad, LIMITE_MIEMBROS_ZIP),
+                                   min(tamano_directorio, LIMITE_ZIP), min(inicio, LIMITE_ZIP), 0))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, tipo, *excepcion):
+        if tipo is None:
+            self.cerrar()
+
+
+def bits_nivel_deflate(nivel):
+    """Bits 1 y 2 de la cabecera ZIP que indican el nivel de deflate (ver NIVEL_DEFLATE_POR_BITS)"""
+    if nivel == 9:
+        return 0x02
+    if nivel in (1, 2):
+        return 0x04
+    return 0
+
+
+@contextlib.contextmanager
+def abrir_miembro_salida(zip_salida, miembro, tamano, compresion):
+    """
+    Abre un .qgs del .qgz de salida para escribirlo por bloques.
+    
+    El método y el nivel salen de la política de compresión. Si el miembro
+    usa deflate y supera el umbral de la política, se comprime en paralelo
+    con CompresorDeflateParalelo.
+    
+    Args:
+        zip_salida: EscritorZip del .qgz de salida
+        miembro: ZipInfo del miembro en el .qgz de entrada
+        tamano: Tamaño sin comprimir, en bytes
+        compresion: Política resuelta con resolver_compresion
+        
+    Yields:
+        MiembroZipAbierto: Archivo binario abierto para escritura
+    """
+    metodo, nivel = metodo_compresion(compresion, miembro)
+    bits = bits_nivel_deflate(nivel) if metodo == zipfile.ZIP_DEFLATED else 0
+    if metodo == zipfile.ZIP_LZMA:
+        # Los datos LZMA terminan con marca de fin
+        bits |= 0x02
+    hilos = compresion['hilos'] or os.cpu_count() or 1
+    paralelo = (metodo == zipfile.ZIP_DEFLATED and hilos > 1 and
+                tamano >= compresion['umbral_paralelo_mb'] * 1024 * 1024)
+    
+    with contextlib.ExitStack() as pila:
+        if paralelo:
+            ejecutor = pila.enter_context(ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='deflate'))
+            compresor = CompresorDeflateParalelo(zlib.Z_DEFAULT_COMPRESSION if nivel is None else nivel,
+                                                 ejecutor, 2 * hilos)
+        else:
+            compresor = crear_compresor(metodo, nivel)
+        with zip_salida.abrir_miembro(miembro, metodo, compresor, bits,
+                                      zip64=tamano > UMBRAL_FORZAR_ZIP64) as escritor:
+            yield escritor
+
+
+def quitar_extra_zip64(extra):
+    """
+    Elimina el campo extra ZIP64 de una cabecera ZIP.
+    
+    EscritorZip vuelve a generar este campo al escribir la cabecera si hace
+    falta, por lo que hay que quitar el que venía del archivo original.
+    
+    Args:
+        extra: Bytes del campo extra del miembro original
+        
+    Returns:
+        bytes: Campo extra sin el bloque ZIP64
+    """
+    resultado = b''
+    posicion = 0
+    while posicion + 4 <= len(extra):
+        identificador, longitud = struct.unpack('<HH', extra[posicion:posicion + 4])
+        fin = posicion + 4 + longitud
+        if identificador != ZIP_EXTRA_ZIP64:
+            resultado += extra[posicion:fin]
+        posicion = fin
+    return resultado
+
+
+def leer_datos_comprimidos(origen, miembro):
+    """
+    Lee los bytes comprimidos de un miembro de un .qgz, por bloques.
+    
+    Args:
+        origen: Archivo .qgz de entrada abierto en modo binario
+        miembro: ZipInfo del miembro (de zipfile.ZipFile.infolist)
+        
+    Yields:
+        bytes: Bloques de los datos comprimidos, tal cual están en el archivo
+        
+    Raises:
+        zipfile.BadZipFile: Si la cabecera local no es válida o los datos están truncados
+    """
+    origen.seek(miembro.header_offset)
+    cabecera = origen.read(struct.calcsize(FORMATO_CABECERA_LOCAL))
+    if len(cabecera) < struct.calcsize(FORMATO_CABECERA_LOCAL) or not cabecera.startswith(FIRMA_CABECERA_LOCAL):
+        raise zipfile.BadZipFile(f"Cabecera local inválida en '{miembro.filename}'")
+    campos = struct.unpack(FORMATO_CABECERA_LOCAL, cabecera)
+    # Saltar nombre y campo extra de la cabecera local original
+    origen.seek(campos[-2] + campos[-1], os.SEEK_CUR)
+    restante = miembro.compress_size
+    while restante > 0:
+        bloque = origen.read(min(TAMANO_BLOQUE_COPIA, restante))
+        if not bloque:
+            raise zipfile.BadZipFile(f"Datos truncados en '{miembro.filename}'")
+        restante -= len(bloque)
+        yield bloque
+
+
+def copiar_miembro_sin_recomprimir(origen, miembro, zip_salida):
+    """
+    Copia un miembro de un .qgz a otro sin descomprimirlo.
+    
+    Los datos comprimidos, el CRC y el método de compresión se copian
+    byte a byte, así que los miembros que no se modifican (.qgd, SVG,
+    imágenes...) no pasan por zlib.
+    
+    Args:
+        origen: Archivo .qgz de entrada abierto en modo binario
+        miembro: ZipInfo del miembro a copiar
+        zip_salida: EscritorZip del .qgz de salida
+    """
+    zip_salida.agregar_miembro(miembro, miembro.compress_type, miembro.CRC, miembro.compress_size,
+                               miembro.file_size, leer_datos_comprimidos(origen, miembro),
+                               bits=miembro.flag_bits, version=miembro.extract_version)
+
+
+def contar_coincidencias_qgz(archivo_qgz, carpeta_entrada, config):
+    """
+    Cuenta las coincidencias de cada regla en un .qgz sin modificar nada.
+    
+    Solo se descomprimen los miembros .qgs, por bloques, y no se escribe
+    ningún archivo de salida.
+    
+    Args:
+        archivo_qgz: Nombre del archivo .qgz
+        carpeta_entrada: Ruta a la carpeta de entrada
+        config: Diccionario de configuración
+        
+    Returns:
+        tuple: (archivo_qgz, dict_con_conteos o None, mensaje_de_error o None)
+    """
+    reglas = config['modulos']['reemplazo_texto'].get('reglas', [])
+    conteos = dict.fromkeys((regla['buscar'] for regla in reglas), 0)
+    motores = {}
+    try:
+        with zipfile.ZipFile(os.path.join(carpeta_entrada, archivo_qgz), 'r') as zip_entrada:
+            miembros_qgs = [m for m in zip_entrada.infolist()
+                            if not m.is_dir() and m.filename.lower().endswith('.qgs')]
+            if not miembros_qgs:
+                return archivo_qgz, None, "No se encontró ningún archivo .qgs dentro del proyecto"
+            
+            for miembro in miembros_qgs:
+                parciales = aplicar_reglas_documento(
+                    lambda: zip_entrada.open(miembro, 'r'), None, reglas, motores)
+                for clave, valor in parciales.items():
+                    conteos[clave] += valor
+    except zipfile.BadZipFile:
+        return archivo_qgz, None, "El archivo no es un ZIP válido"
+    except Exception as e:
+        return archivo_qgz, None, str(e)
+    
+    return archivo_qgz, conteos, None
+
+
+def mostrar_matriz_conteos(resultados, reglas):
+    """
+    Muestra una tabla de coincidencias por archivo y por regla.
+    
+    Args:
+        resultados: Lista de tuplas (archivo, conteos o None, error o None)
+        reglas: Lista de reglas configuradas (definen las columnas)
+    """
+    claves = list(dict.fromkeys(regla['buscar'] for regla in reglas))
+    ocultas = 0
+    if len(claves) > MAXIMO_COLUMNAS_MATRIZ:
+        # Con tablas de miles de reglas, solo las que aparecen en algún archivo
+        con_coincidencias = {clave for _, conteos, _ in resultados if conteos
+                             for clave, valor in conteos.items() if valor}
+        ocultas = sum(1 for clave in claves if clave not in con_coincidencias)
+        claves = [clave for clave in claves if clave in con_coincidencias]
+    ancho_nombre = max([len('Archivo')] + [len(archivo) for archivo, _, _ in resultados])
+    ancho_columna = max([len('Total')] + [len(f"R{i}") for i in range(1, len(claves) + 1)]) + 1
+    
+    print("")
+    print("   Reglas:")
+    for i, clave in enumerate(claves, 1):
+        print(f"      R{i}: '{clave}'")
+    if ocultas:
+        print(f"      ({ocultas} regla(s) sin coincidencias no se muestran)")
+    print("")
+    
+    cabecera = "Archivo".ljust(ancho_nombre)
+    for i in range(1, len(claves) + 1):
+        cabecera += f"R{i}".rjust(ancho_columna)
+    cabecera += "Total".rjust(ancho_columna + 1)
+    print(f"   {cabecera}")
+    print(f"   {'─' * len(cabecera)}")
+    
+    totales = dict.fromkeys(claves, 0)
+    for archivo, conteos, error in resultados:
+        fila = archivo.ljust(ancho_nombre)
+        if conteos is None:
+            print(f"   {fila}  ✗ ERROR: {error}")
+            continue
+        for clave in claves:
+            fila += f"{conteos.get(clave, 0)}".rjust(ancho_columna)
+            totales[clave] += conteos.get(clave, 0)
+        fila += f"{sum(conteos.values())}".rjust(ancho_columna + 1)
+        print(f"   {fila}")
+    
+    print(f"   {'─' * len(cabecera)}")
+    fila = "Total".ljust(ancho_nombre)
+    for clave in claves:
+        fila += f"{totales[clave]}".rjust(ancho_columna)
+    fila += f"{sum(totales.values())}".rjust(ancho_columna + 1)
+    print(f"   {fila}")
+
+
+def ejecutar_simulacion(archivos_qgz, carpeta_entrada, config, trabajos, ejecutor=None):
+    """
+    Cuenta las coincidencias de todos los archivos sin escribir salidas.
+    
+    Args:
+        archivos_qgz: Lista de nombres de archivos .qgz
+        carpeta_entrada: Ruta a la carpeta de entrada
+        config: Diccionario de configuración
+        trabajos: Valor de --jobs (0 = automático)
+        ejecutor: ProcessPoolExecutor ya creado para reutilizar (opcional)
+        
+    Returns:
+        int: Cantidad de archivos que no se pudieron leer
+    """
+    print("")
+    print("=" * 70)
+    print("[PASO 4/4] 🔎 SIMULACIÓN: CONTANDO COINCIDENCIAS (no se escribe nada)")
+    print("=" * 70)
+    
+    if not config['modulos'].get('reemplazo_texto', {}).get('activo', False):
+        print("   ⚠️ El módulo 'reemplazo_texto' no está activo: no hay reglas que contar")
+        return 0
+    
+    trabajos = resolver_trabajos(trabajos, len(archivos_qgz))
+    if trabajos > 1:
+        print(f"   ⚙️ Analizando en paralelo con {trabajos} proceso(s)")
+        with usar_ejecutor(ejecutor, trabajos) as ejecutor_lote:
+            resultados = list(ejecutor_lote.map(contar_coincidencias_qgz, archivos_qgz,
+                                           [carpeta_entrada] * len(archivos_qgz),
+                                           [config] * len(archivos_qgz)))
+    else:
+        resultados = [contar_coincidencias_qgz(archivo, carpeta_entrada, config)
+                      for archivo in archivos_qgz]
+    
+    for archivo, conteos, error in resultados:
+        emitir_evento('simulacion_archivo', archivo=archivo, exito=conteos is not None,
+                      conteos=conteos or {}, error=error)
+    mostrar_matriz_conteos(resultados, config['modulos']['reemplazo_texto'].get('reglas', []))
+    return sum(1 for _, conteos, _ in resultados if conteos is None)
+
+
+def nombre_archivo_salida(archivo_qgz, config):
+    """
+    Calcula el nombre del archivo de salida (nombre original + postfijo).
+    
+    Args:
+        archivo_qgz: Nombre del archivo .qgz de entrada
+        config: Diccionario de configuración
+        
+    Returns:
+        str: Nombre del archivo .qgz de salida
+    """
+    nombre_base = os.path.splitext(archivo_qgz)[0]
+    return f"{nombre_base}{config['postfijo']}.qgz"
+
+
+def calcular_hash_configuracion(config):
+    """
+    Calcula un hash de los módulos configurados (y de la compresión, si la hay).
+    
+    Cualquier cambio en las reglas o en los módulos activos cambia el hash,
+    así que sirve para saber si una salida anterior sigue siendo válida.
+    
+    Args:
+        config: Diccionario de configuración
+        
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    datos = config['modulos']
+    if config.get('compresion'):
+        # Cambiar la compresión también invalida las salidas anteriores
+        datos = {'modulos': config['modulos'], 'compresion': config['compresion']}
+    texto = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def firma_archivo(ruta):
+    """
+    Obtiene la firma rápida de un archivo (tamaño y fecha de modificación).
+    
+    Args:
+        ruta: Ruta al archivo
+        
+    Returns:
+        dict: {'tamano': bytes, 'mtime_ns': fecha de modificación en nanosegundos}
+    """
+    estado = os.stat(ruta)
+    return {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+
+
+@contextlib.contextmanager
+def escribir_atomico(ruta, modo='wb', **opciones):
+    """
+    Escribe un archivo de forma atómica: o queda completo, o no cambia.
+    
+    El bloque with escribe en un archivo temporal oculto de la misma
+    carpeta. Si termina sin errores, el contenido se baja a disco y el
+    temporal se renombra al nombre definitivo (os.replace, atómico dentro
+    de una carpeta); si no, o si el proceso se interrumpe, el temporal se
+    borra y el archivo anterior, si había, queda como estaba.
+    
+    Args:
+        ruta: Archivo de destino
+        modo, opciones: Como en open() ('wb' por defecto)
+        
+    Yields:
+        Archivo temporal abierto para escritura
+    """
+    carpeta, nombre = os.path.split(ruta)
+    ruta_temporal = os.path.join(carpeta, f".{nombre}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(ruta_temporal, modo, **opciones) as archivo:
+            yield archivo
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(ruta_temporal, ruta)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(ruta_temporal)
+        raise
+
+
+def limpiar_temporales(carpeta_salida, nombres_salida):
+    """
+    Borra los temporales de escribir_atomico que dejó un proceso cortado de golpe.
+    
+    Args:
+        carpeta_salida: Ruta a la carpeta de salida
+        nombres_salida: Nombres de salida cuyos temporales se borran
+    """
+    prefijos = tuple(f".{nombre}." for nombre in nombres_salida)
+    try:
+        with os.scandir(carpeta_salida) as entradas:
+            temporales = [e.path for e in entradas if e.name.endswith('.tmp') and e.name.startswith(prefijos)]
+    except OSError:
+        return
+    for ruta in temporales:
+        with contextlib.suppress(OSError):
+            os.remove(ruta)
+
+
+def leer_diario(carpeta_salida):
+    """
+    Lee el diario del último lote (archivos terminados que todavía no están en el manifiesto).
+    
+    Si el proceso se cortó mientras escribía una línea, esa línea se ignora.
+    
+    Args:
+        carpeta_salida: Ruta a la carpeta de salida
+        
+    Returns:
+        list: Tuplas (nombre de salida, entrada del manifiesto), en orden
+    """
+    entradas = []
+    try:
+        with open(os.path.join(carpeta_salida, NOMBRE_DIARIO), 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    datos = json.loads(linea)
+                    entradas.append((datos['salida'], datos['entrada']))
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return entradas
+
+
+def registrar_en_diario(carpeta_salida, nombre_salida, entrada):
+    """
+    Agrega un archivo terminado al diario del lote, ya bajado a disco.
+    
+    Args:
+        carpeta_salida: Ruta a la carpeta de salida
+        nombre_salida: Nombre del archivo de salida
+        entrada: Entrada del manifiesto (ver entrada_manifiesto)
+    """
+    linea = json.dumps({'salida': nombre_salida, 'entrada': entrada}, ensure_ascii=False)
+    with open(os.path.join(carpeta_salida, NOMBRE_DIARIO), 'a', encoding='utf-8') as f:
+        f.write(linea + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def cargar_manifiesto(carpeta_salida, diario=None):
+    """
+    Carga el manifiesto de ejecuciones anteriores de la carpeta de salida.
+    
+    Incluye los archivos del diario de un lote que se interrumpió antes de
+    guardar el manifiesto.
+    
+    Args:
+        carpeta_salida: Ruta a la carpeta de salida
+        diario: Entradas ya leídas con leer_diario (por defecto, se lee)
+        
+    Returns:
+        dict: Entradas del manifiesto por nombre de archivo de salida
+              (vacío si no existe o no se puede leer)
+    """
+    ruta = os.path.join(carpeta_salida, NOMBRE_MANIFIESTO)
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        if datos.get('version') != VERSION_MANIFIESTO:
+            manifiesto = {}
+        else:
+            manifiesto = datos.get('archivos', {})
+    except (OSError, ValueError, AttributeError):
+        manifiesto = {}
+    manifiesto.update(leer_diario(carpeta_salida) if diario is None else diario)
+    return manifiesto
+
+
+def guardar_manifiesto(carpeta_salida, manifiesto):
+    """
+    Guarda el manifiesto en la carpeta de salida y borra el diario.
+    
+    Se escribe primero a un archivo temporal y luego se renombra, para que
+    una interrupción nunca deje un manifiesto a medio escribir.
+    
+    Args:
+        carpeta_salida: Ruta a la carpeta de salida
+        manifiesto: Entradas del manifiesto por nombre de archivo de salida
+    """
+    ruta = os.path.join(carpeta_salida, NOMBRE_MANIFIESTO)
+    with escribir_atomico(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'version': VERSION_MANIFIESTO, 'archivos': manifiesto}, f,
+                  indent=1, ensure_ascii=False)
+    # Todo lo del diario ya está en el manifiesto
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(carpeta_salida, NOMBRE_DIARIO))
+
+
+def entrada_manifiesto(archivo_qgz, carpeta_entrada, carpeta_salida, config, hash_config):
+    """
+    Crea la entrada del manifiesto para un archivo recién procesado.
+    
+    Args:
+        archivo_qgz: Nombre del archivo .qgz de entrada
+        carpeta_entrada: Ruta a la carpeta de entrada
+        carpeta_salida: Ruta a la carpeta de salida
+        config: Diccionario de configuración
+        hash_config: Hash de la configuración (calcular_hash_configuracion)
+        
+    Returns:
+        tuple: (nombre_salida, entrada)
+    """
+    nombre_salida = nombre_archivo_salida(archivo_qgz, config)
+    return nombre_salida, {
+        'entrada': archivo_qgz,
+        'firma_entrada': firma_archivo(os.path.join(carpeta_entrada, archivo_qgz)),
+        'firma_salida': firma_archivo(os.path.join(carpeta_salida, nombre_salida)),
+        'hash_config': hash_config,
+    }
+
+
+def esta_actualizado(manifiesto, archivo_qgz, carpeta_entrada, carpeta_salida, config, hash_config):
+    """
+    Indica si la salida de un archivo sigue siendo válida según el manifiesto.
+    
+    Es válida si la entrada y la configuración no cambiaron desde que se
+    generó, y el archivo de salida sigue ahí sin modificar.
+    
+    Args:
+        manifiesto: Entradas del manifiesto por nombre de archivo de salida
+        (el resto, como en entrada_manifiesto)
+        
+    Returns:
+        bool: True si se puede omitir el archivo
+    """
+    nombre_salida = nombre_archivo_salida(archivo_qgz, config)
+    entrada = manifiesto.get(nombre_salida)
+    if not entrada or entrada.get('hash_config') != hash_config or entrada.get('entrada') != archivo_qgz:
+        return False
+    try:
+        return (entrada.get('firma_entrada') == firma_archivo(os.path.join(carpeta_entrada, archivo_qgz)) and
+                entrada.get('firma_salida') == firma_archivo(os.path.join(carpeta_salida, nombre_salida)))
+    except OSError:
+        return False
+
+
+def procesar_archivo_qgz(archivo_qgz, carpeta_entrada, carpeta_salida, config, metricas=None,
+                         motores=None):
+    """
+    Procesa un archivo .qgz individual.
+    
+    El archivo se procesa en una sola pasada: cada miembro del .qgz de
+    entrada se lee y se escribe directamente en el .qgz de salida, y los
+    archivos .qgs se transforman al vuelo. No se usa ningún directorio
+    temporal.
+    
+    Args:
+        archivo_qgz: Nombre del archivo .qgz
+        carpeta_entrada: Ruta a la carpeta de entrada
+        carpeta_salida: Ruta a la carpeta de salida
+        config: Diccionario de configuración
+        metricas: Diccionario donde se guardan los segundos por etapa
+                  ('etapas'), los conteos por regla ('conteos') y los bytes
+                  del .qgs leídos y escritos (opcional)
+        motores: Motores ya compilados para estas reglas, para reutilizarlos
+                 entre archivos (opcional; se actualiza)
+        
+    Returns:
+        bool: True si se procesó correctamente, False si hubo error
+    """
+    ruta_entrada = os.path.join(carpeta_entrada, archivo_qgz)
+    
+    # Crear nombre de archivo de salida con postfijo
+    nombre_salida = nombre_archivo_salida(archivo_qgz, config)
+    ruta_salida = os.path.join(carpeta_salida, nombre_salida)
+    
+    # Verificar si el archivo de salida ya existe
+    if os.path.exists(ruta_salida):
+        print(f"   ⚠️ El archivo de salida ya existe, será sobrescrito: {nombre_salida}")
+    
+    modulo_reemplazo_activo = ('reemplazo_texto' in config['modulos'] and
+                               config['modulos']['reemplazo_texto'].get('activo', False))
+    reglas = config['modulos']['reemplazo_texto'].get('reglas', []) if modulo_reemplazo_activo else []
+    # Motores compilados por codificación de documento
+    if motores is None:
+        motores = {}
+    compresion = resolver_compresion(config)
+    
+    if metricas is None:
+        metricas = {}
+    etapas = metricas['etapas'] = dict.fromkeys(ETAPAS_PROCESO, 0.0)
+    total_reemplazos = metricas['conteos'] = {}
+    metricas['bytes_qgs_leidos'] = 0
+    metricas['bytes_qgs_escritos'] = 0
+    
+    try:
+        # Paso 1: Abrir el archivo .qgz
+        print(f"      → Abriendo archivo .qgz...")
+        try:
+            with medir_etapa(etapas, 'lectura'):
+                zip_entrada = zipfile.ZipFile(ruta_entrada, 'r')
+        except zipfile.BadZipFile:
+            print(f"      ✗ ERROR: El archivo no es un ZIP válido")
+            return False
+        except Exception as e:
+            print(f"      ✗ ERROR al abrir: {str(e)}")
+            return False
+        
+        with zip_entrada:
+            # Paso 2: Buscar archivos .qgs dentro del .qgz (solo el índice del ZIP)
+            print(f"      → Buscando archivos de proyecto (.qgs) dentro del .qgz...")
+            with medir_etapa(etapas, 'lectura'):
+                miembros = zip_entrada.infolist()
+            miembros_qgs = [m for m in miembros
+                            if not m.is_dir() and m.filename.lower().endswith('.qgs')]
+            
+            if not miembros_qgs:
+                print(f"      ✗ ERROR: No se encontró ningún archivo .qgs dentro del proyecto")
+                return False
+            
+            print(f"      ✓ Se encontraron {len(miembros_qgs)} archivo(s) de proyecto")
+            
+            # Paso 3: Copiar cada miembro al .qgz de salida, transformando los .qgs
+            print(f"      → Escribiendo proyecto modificado...")
+            inicio_escritura = time.perf_counter()
+            try:
+                # Se escribe en un temporal que se renombra al terminar: si el
+                # proceso se corta, en la carpeta de salida no queda un .qgz a medias.
+                # Los bytes comprimidos de las copias se leen con un archivo propio
+                with open(ruta_entrada, 'rb') as origen, \
+                        escribir_atomico(ruta_salida) as archivo_salida, \
+                        EscritorZip(archivo_salida) as zip_salida:
+                    for miembro in miembros:
+                        if miembro not in miembros_qgs:
+                            # Miembro sin cambios: se copian sus bytes comprimidos
+                            copiar_miembro_sin_recomprimir(origen, miembro, zip_salida)
+                            continue
+                        
+                        nombre_qgs = os.path.basename(miembro.filename)
+                        if not modulo_reemplazo_activo:
+                            copiar_miembro_sin_recomprimir(origen, miembro, zip_salida)
+                            continue
+                        
+                        # Leer y reemplazar por bloques. El resultado se guarda aparte
+                        # y solo se comprime si hubo reemplazos; si no, se copia el
+                        # original sin recomprimir
+                        print(f"      → Procesando: {nombre_qgs} ({miembro.file_size:,} bytes)")
+                        print(f"      → Aplicando {len(reglas)} regla(s) de reemplazo...")
+                        inicio_qgs = time.perf_counter()
+                        medido_antes = etapas['descompresion']
+                        lecturas = []
+                        
+                        def abrir_qgs():
+                            lecturas.append(ArchivoMedido(zip_entrada.open(miembro, 'r'),
+                                                          etapas, 'descompresion'))
+                            return lecturas[-1]
+                        
+                        with tempfile.SpooledTemporaryFile(max_size=MAXIMO_QGS_EN_MEMORIA,
+                                                           dir=carpeta_salida) as transformado:
+                            conteos = aplicar_reglas_documento(abrir_qgs, transformado, reglas, motores)
+                            # El reemplazo es lo que no se fue en leer
+                            etapas['reemplazo'] += (time.perf_counter() - inicio_qgs -
+                                                    (etapas['descompresion'] - medido_antes))
+                            metricas['bytes_qgs_leidos'] += sum(lectura.bytes for lectura in lecturas)
+                            
+                            # Acumular conteos
+                            hubo_cambios = False
+                            for clave, valor in conteos.items():
+                                total_reemplazos[clave] = total_reemplazos.get(clave, 0) + valor
+                                if valor > 0:
+                                    hubo_cambios = True
+                                    print(f"        ✓ '{clave}': {valor} coincidencia(s) encontrada(s)")
+                            
+                            if hubo_cambios:
+                                tamano_transformado = transformado.tell()
+                                transformado.seek(0)
+                                with abrir_miembro_salida(zip_salida, miembro, tamano_transformado,
+                                                          compresion) as escritor, \
+                                        ArchivoMedido(escritor, etapas, 'compresion') as destino:
+                                    shutil.copyfileobj(transformado, destino, TAMANO_BLOQUE_COPIA)
+                                print(f"        ✓ Cambios guardados")
+                                metricas['bytes_qgs_escritos'] += destino.bytes
+                            else:
+                                # Sin reemplazos: se conserva el miembro original tal cual
+                                print(f"        ✓ Sin cambios, se copia el original")
+                                copiar_miembro_sin_recomprimir(origen, miembro, zip_salida)
+                                metricas['bytes_qgs_escritos'] += miembro.file_size
+                # Escritura: copias sin recomprimir y directorio central del ZIP
+                etapas['escritura'] = (time.perf_counter() - inicio_escritura -
+                                       etapas['descompresion'] - etapas['reemplazo'] - etapas['compresion'])
+                print(f"      ✓ Proyecto comprimido correctamente")
+            except Exception as e:
+                print(f"      ✗ ERROR al crear archivo de salida: {str(e)}")
+                return False
+        
+        # Mostrar resumen de reemplazos (solo si el módulo está activo)
+        total_cambios = sum(total_reemplazos.values())
+        if modulo_reemplazo_activo:
+            print(f"")
+            print(f"      ┌─ RESUMEN DE REEMPLAZOS ─┐")
+            hay_reemplazos = False
+            for regla in reglas:
+                buscar = regla['buscar']
+                conteo = total_reemplazos.get(buscar, 0)
+                if conteo > 0:
+                    hay_reemplazos = True
+                    print(f"      │ '{buscar}' → '{regla['reemplazar_por']}': {conteo} veces")
+            
+            if not hay_reemplazos:
+                print(f"      │ Sin coincidencias encontradas")
+            else:
+                print(f"      │ Total: {total_cambios} reemplazo(s)")
+            print(f"      └──────────────────────────┘")
+        
+        print(f"")
+        print(f"   ✅ COMPLETADO → {nombre_salida}")
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ ERROR inesperado: {str(e)}")
+        return False
+
+
+def procesar_archivo_seguro(indice, total, archivo_qgz, carpeta_entrada, carpeta_salida, config,
+                            motores=None):
+    """
+    Muestra la cabecera de un archivo y lo procesa sin dejar escapar excepciones.
+    
+    Args:
+        indice: Posición del archivo en el lote (empezando en 1)
+        total: Cantidad de archivos del lote
+        archivo_qgz: Nombre del archivo .qgz
+        carpeta_entrada: Ruta a la carpeta de entrada
+        carpeta_salida: Ruta a la carpeta de salida
+        config: Diccionario de configuración
+        motores: Motores ya compilados (ver procesar_archivo_qgz)
+        
+    Returns:
+        bool: True si se procesó correctamente, False si hubo error
+    """
+    print("")
+    print(f"   ┌────────────────────────────────────────────────────────────────")
+    print(f"   │ ARCHIVO {indice} de {total}: {archivo_qgz}")
+    print(f"   └────────────────────────────────────────────────────────────────")
+    
+    ruta_entrada = os.path.join(carpeta_entrada, archivo_qgz)
+    ruta_salida = os.path.join(carpeta_salida, nombre_archivo_salida(archivo_qgz, config))
+    bytes_entrada = os.path.getsize(ruta_entrada) if os.path.isfile(ruta_entrada) else 0
+    emitir_evento('archivo_inicio', archivo=archivo_qgz, indice=indice, total=total,
+                  bytes_entrada=bytes_entrada)
+    
+    metricas = {}
+    # Con --profile memoria, pico de memoria de este archivo
+    medir_memoria = tracemalloc.is_tracing()
+    if medir_memoria:
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    try:
+        exito = procesar_archivo_qgz(archivo_qgz, carpeta_entrada, carpeta_salida, config, metricas,
+                                     motores)
+    except Exception as e:
+        print(f"      ✗ ERROR no manejado: {str(e)}")
+        exito = False
+    
+    if medir_memoria:
+        metricas['memoria_pico'] = tracemalloc.get_traced_memory()[1]
+    etapas = {etapa: round(segundos, 4) for etapa, segundos in metricas.get('etapas', {}).items()}
+    emitir_evento('archivo_fin', archivo=archivo_qgz, indice=indice, total=total, exito=exito,
+                  duracion=round(time.perf_counter() - inicio, 4), etapas=etapas,
+                  bytes_entrada=bytes_entrada,
+                  bytes_salida=os.path.getsize(ruta_salida) if exito else 0,
+                  bytes_qgs_leidos=metricas.get('bytes_qgs_leidos', 0),
+                  bytes_qgs_escritos=metricas.get('bytes_qgs_escritos', 0),
+                  conteos=metricas.get('conteos', {}),
+                  **({'memoria_pico': metricas['memoria_pico']} if medir_memoria else {}))
+    return exito
+
+
+def procesar_archivo_con_log(indice, total, archivo_qgz, carpeta_entrada, carpeta_salida, config,
+                             perfil=None, motores=None):
+    """
+    Procesa un archivo guardando sus mensajes en memoria.
+    
+    Se usa en los procesos del modo paralelo: el registro completo y los
+    eventos de progreso se devuelven al proceso principal, que los emite
+    de una sola vez para que los mensajes de distintos archivos no se mezclen.
+    
+    Args:
+        (los mismos que procesar_archivo_seguro)
+        perfil: Opciones de --profile para este proceso (ver perfilar_lote)
+        motores: Motores ya compilados (ver procesar_archivo_qgz)
+        
+    Returns:
+        tuple: (exito, texto_del_registro, lista_de_eventos)
+    """
+    registro = io.StringIO()
+    eventos = []
+    with contextlib.redirect_stdout(registro), capturar_eventos(eventos.append), \
+            perfilar_archivo(perfil, archivo_qgz):
+        exito = procesar_archivo_seguro(indice, total, archivo_qgz,
+                                        carpeta_entrada, carpeta_salida, config, motores)
+    return exito, registro.getvalue(), eventos
+
+
+def resolver_trabajos(trabajos, cantidad_archivos):
+    """
+    Calcula cuántos procesos usar para un lote.
+    
+    Args:
+        trabajos: Valor de --jobs (0 = automático)
+        cantidad_archivos: Cantidad de archivos a procesar
+        
+    Returns:
+        int: Cantidad de procesos (al menos 1, nunca más que archivos)
+    """
+    if trabajos <= 0:
+        trabajos = os.cpu_count() or 1
+    return max(1, min(trabajos, cantidad_archivos))
+
+
+def parsear_argumentos(argv=None):
+    """
+    Lee los argumentos de la línea de comandos.
+    
+    Args:
+        argv: Lista de argumentos (por defecto, sys.argv)
+        
+    Returns:
+        argparse.Namespace: Argumentos leídos
+    """
+    parser = argparse.ArgumentParser(
+        description="Edita de forma masiva proyectos QGIS (.qgz) según config.json")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=0, metavar='N',
+        help="cantidad de procesos para procesar archivos en paralelo "
+             "(0 = automático según los núcleos disponibles, 1 = secuencial)")
+    parser.add_argument(
+        '--dry-run', '--simular', dest='simular', action='store_true',
+        help="solo contar las coincidencias de cada regla en cada archivo, sin escribir salidas")
+    parser.add_argument(
+        '--forzar', action='store_true',
+        help="procesar todos los archivos, aunque no hayan cambiado desde la última ejecución")
+    parser.add_argument(
+        '--profile', '--perfil', dest='perfil', nargs='?', const='tiempos', type=leer_opciones_perfil,
+        metavar='OPCIONES',
+        help="medir el lote: tabla de tiempos por etapa y por archivo; agrega 'cprofile' y/o "
+             "'memoria' (separadas por comas, o 'todo') para cProfile y tracemalloc")
+    parser.add_argument(
+        '--watch', '--vigilar', dest='vigilar', action='store_true',
+        help="quedarse vigilando la carpeta de entrada y procesar cada .qgz nuevo o modificado "
+             "en cuanto termina de copiarse (Ctrl+C para salir)")
+    parser.add_argument(
+        '--intervalo', type=float, default=INTERVALO_VIGILANCIA, metavar='SEG',
+        help=f"con --watch, segundos entre revisiones de la carpeta (por defecto {INTERVALO_VIGILANCIA:g})")
+    parser.add_argument(
+        '--espera', type=float, default=ESPERA_ARCHIVO_ESTABLE, metavar='SEG',
+        help="con --watch, segundos que un archivo tiene que quedar sin cambios antes de "
+             f"procesarlo (por defecto {ESPERA_ARCHIVO_ESTABLE:g})")
+    parser.add_argument(
+        '--eventos', metavar='ARCHIVO',
+        help="escribir eventos de progreso en JSON (uno por línea) en ARCHIVO "
+             "('-' = salida de errores)")
+    
+    subcomandos = parser.add_subparsers(dest='comando', metavar='COMANDO')
+    indexar = subcomandos.add_parser(
+        'indexar', help="crear o actualizar el índice de búsqueda de los proyectos de entrada")
+    indexar.add_argument(
+        '-j', '--jobs', type=int, default=0, metavar='N',
+        help="cantidad de procesos para leer archivos en paralelo (0 = automático)")
+    buscar = subcomandos.add_parser(
+        'buscar', help="buscar en el índice qué proyectos contienen un host, IP, ruta o fuente de datos")
+    buscar.add_argument('texto', help="texto a buscar (sin distinguir mayúsculas)")
+    buscar.add_argument(
+        '--tipo', choices=['datasource', 'host', 'ip', 'ruta'],
+        help="buscar solo valores de este tipo")
+    buscar.add_argument(
+        '--exacto', action='store_true',
+        help="el valor tiene que coincidir completo (por defecto basta con que lo contenga)")
+    
+    args = parser.parse_args(argv)
+    if args.vigilar and (args.simular or args.perfil or args.comando):
+        parser.error("--watch no se puede combinar con --dry-run, --profile ni con subcomandos")
+    if args.intervalo <= 0 or args.espera < 0:
+        parser.error("--intervalo tiene que ser mayor que 0 y --espera no puede ser negativo")
+    return args
+
+
+@contextlib.contextmanager
+def usar_ejecutor(ejecutor, trabajos):
+    """
+    Devuelve el ejecutor indicado o crea uno temporal para el lote.
+    
+    Args:
+        ejecutor: ProcessPoolExecutor ya creado, o None
+        trabajos: Cantidad de procesos del ejecutor temporal
+        
+    Yields:
+        concurrent.futures.Executor: Ejecutor a usar
+    """
+    if ejecutor is not None:
+        yield ejecutor
+        return
+    with ProcessPoolExecutor(max_workers=trabajos) as temporal:
+        yield temporal
+
+
+def procesar_lote(archivos_qgz, carpeta_entrada, carpeta_salida, config,
+                  trabajos=0, forzar=False, ejecutor=None, perfil=None, incremental=True):
+    """
+    Procesa un lote de archivos .qgz (paso 4), en serie o en paralelo.
+    
+    Args:
+        archivos_qgz: Lista de nombres de archivos .qgz
+        carpeta_entrada: Ruta a la carpeta de entrada
+        carpeta_salida: Ruta a la carpeta de salida
+        config: Diccionario de configuración
+        trabajos: Cantidad de procesos (0 = automático, 1 = secuencial)
+        forzar: Procesar también los archivos que no cambiaron
+        ejecutor: ProcessPoolExecutor ya creado para reutilizar (opcional)
+        perfil: Opciones de --profile para los procesos (ver perfilar_lote)
+        incremental: Usar el manifiesto y el diario de carpeta_salida para
+                     omitir los archivos sin cambios y retomar un lote
+                     cortado. Con False se procesa todo y no se escriben
+                     (para carpetas de salida que no se reutilizan)
+        
+    Returns:
+        dict: Cantidades 'exitosos', 'fallidos' y 'omitidos'
+    """
+    exitosos = 0
+    fallidos = 0
+    omitidos = 0
+    
+    # Omitir los archivos que no cambiaron desde la última ejecución
+    hash_config = calcular_hash_configuracion(config)
+    diario = leer_diario(carpeta_salida) if incremental else []
+    interrumpido = len(diario)
+    manifiesto = cargar_manifiesto(carpeta_salida, diario) if incremental else {}
+    pendientes = archivos_qgz
+    if interrumpido and not forzar:
+        print(f"   ♻️ Se retoma un lote interrumpido ({interrumpido} archivo(s) ya terminados)")
+    if incremental and not forzar:
+        pendientes = [archivo for archivo in archivos_qgz
+                      if not esta_actualizado(manifiesto, archivo, carpeta_entrada,
+                                              carpeta_salida, config, hash_config)]
+        omitidos = len(archivos_qgz) - len(pendientes)
+        if omitidos:
+            print(f"   ⏭️ {omitidos} archivo(s) sin cambios desde la última ejecución, se omiten")
+            print("      (usa --forzar para procesarlos de nuevo)")
+    
+    if pendientes:
+        limpiar_temporales(carpeta_salida, [nombre_archivo_salida(archivo, config) for archivo in pendientes])
+    
+    inicio = time.perf_counter()
+    emitir_evento('lote_inicio', total=len(pendientes), omitidos=omitidos, archivos=pendientes,
+                  bytes_entrada=sum(os.path.getsize(os.path.join(carpeta_entrada, archivo))
+                                    for archivo in pendientes))
+    for archivo in archivos_qgz:
+        if archivo not in pendientes:
+            emitir_evento('archivo_omitido', archivo=archivo)
+    
+    def registrar_exito(archivo):
+        # Cada archivo terminado queda en el diario: si el lote se corta, no se repite
+        if not incremental:
+            return
+        try:
+            nombre_salida, entrada = entrada_manifiesto(archivo, carpeta_entrada, carpeta_salida,
+                                                        config, hash_config)
+            manifiesto[nombre_salida] = entrada
+            registrar_en_diario(carpeta_salida, nombre_salida, entrada)
+        except OSError:
+            pass
+    
+    try:
+        trabajos = resolver_trabajos(trabajos, len(pendientes))
+        if pendientes:
+            # En paralelo, los procesos leen el motor de la caché en lugar de compilarlo cada uno
+            precompilar_reglas(config)
+        if trabajos > 1:
+            print(f"   ⚙️ Procesando en paralelo con {trabajos} proceso(s)")
+            print("      (el registro de cada archivo se muestra completo al terminar)")
+            with usar_ejecutor(ejecutor, trabajos) as ejecutor_lote:
+                futuros = {
+                    ejecutor_lote.submit(procesar_archivo_con_log, i, len(pendientes), archivo,
+                                    carpeta_entrada, carpeta_salida, config, perfil): archivo
+                    for i, archivo in enumerate(pendientes, 1)
+                }
+                for futuro in as_completed(futuros):
+                    try:
+                        exito, registro, eventos = futuro.result()
+                    except Exception as e:
+                        exito = False
+                        registro = f"\n      ✗ ERROR en el proceso de {futuros[futuro]}: {str(e)}\n"
+                        eventos = [dict(evento='archivo_fin', tiempo=round(time.time(), 3),
+                                        archivo=futuros[futuro], exito=False)]
+                    print(registro, end='')
+                    for evento in eventos:
+                        enviar_evento(evento)
+                    if exito:
+                        exitosos += 1
+                        registrar_exito(futuros[futuro])
+                    else:
+                        fallidos += 1
+        else:
+            for i, archivo in enumerate(pendientes, 1):
+                if procesar_archivo_seguro(i, len(pendientes), archivo,
+                                           carpeta_entrada, carpeta_salida, config):
+                    exitosos += 1
+                    registrar_exito(archivo)
+                else:
+                    fallidos += 1
+    finally:
+        try:
+            if incremental:
+                guardar_manifiesto(carpeta_salida, manifiesto)
+        except OSError as e:
+            print(f"   ⚠️ No se pudo guardar el manifiesto: {str(e)}")
+    
+    emitir_evento('lote_fin', exitosos=exitosos, fallidos=fallidos, omitidos=omitidos,
+                  duracion=round(time.perf_counter() - inicio, 4))
+    return {'exitosos': exitosos, 'fallidos': fallidos, 'omitidos': omitidos}
+
+
+def leer_opciones_perfil(texto):
+    """
+    Lee el valor de --profile ('tiempos', 'cprofile', 'memoria', 'todo' o
+    varias separadas por comas).
+    
+    Args:
+        texto: Valor recibido
+        
+    Returns:
+        frozenset: Opciones (siempre incluye 'tiempos')
+        
+    Raises:
+        argparse.ArgumentTypeError: Si alguna opción no existe
+    """
+    opciones = {opcion.strip().lower() for opcion in texto.split(',') if opcion.strip()}
+    if 'todo' in opciones:
+        opciones = set(OPCIONES_PERFIL)
+    desconocidas = opciones - set(OPCIONES_PERFIL)
+    if desconocidas:
+        raise argparse.ArgumentTypeError(
+            f"opción desconocida: {', '.join(sorted(desconocidas))} "
+            f"(usa {', '.join(OPCIONES_PERFIL)} o todo)")
+    return frozenset(opciones | {'tiempos'})
+
+
+@contextlib.contextmanager
+def perfilar_archivo(perfil, archivo_qgz):
+    """
+    En un proceso del modo paralelo, perfila el procesamiento de un archivo.
+    
+    El perfil de cProfile se guarda en la carpeta del perfil para que el
+    proceso principal lo combine con los demás al terminar el lote.
+    
+    Args:
+        perfil: Opciones de perfilar_lote, o None para no hacer nada
+        archivo_qgz: Nombre del archivo .qgz
+    """
+    if not perfil:
+        yield
+        return
+    
+    iniciar_memoria = perfil['memoria'] and not tracemalloc.is_tracing()
+    if iniciar_memoria:
+        tracemalloc.start()
+    perfilador = cProfile.Profile() if perfil['cprofile'] else None
+    if perfilador:
+        perfilador.enable()
+    try:
+        yield
+    finally:
+        if perfilador:
+            perfilador.disable()
+            perfilador.dump_stats(os.path.join(perfil['carpeta'], f"{archivo_qgz}.{os.getpid()}.prof"))
+        if iniciar_memoria:
+            tracemalloc.stop()
+
+
+def formatear_tabla_perfil(eventos, con_memoria):
+    """
+    Arma la tabla de tiempos por archivo del modo --profile.
+    
+    Args:
+        eventos: Eventos 'archivo_fin' del lote
+        con_memoria: Agregar la columna de memoria máxima
+        
+    Returns:
+        list: Líneas de la tabla
+    """
+    ancho = max([len(evento['archivo']) for evento in eventos] + [7])
+    cabecera = (f"{'archivo':<{ancho}} {'total':>9} " +
+                ' '.join(f"{etapa[:10]:>10}" for etapa in ETAPAS_PROCESO) + f" {'MB/s':>8}")
+    if con_memoria:
+        cabecera += f" {'mem_MB':>8}"
+    lineas = [cabecera, '─' * len(cabecera)]
+    for evento in sorted(eventos, key=lambda e: e['archivo']):
+        etapas = evento.get('etapas', {})
+        duracion = evento.get('duracion', 0)
+        mb_por_segundo = evento.get('bytes_qgs_leidos', 0) / (1024 * 1024) / duracion if duracion else 0
+        linea = (f"{evento['archivo']:<{ancho}} {duracion:>9.4f} " +
+                 ' '.join(f"{etapas.get(etapa, 0):>10.4f}" for etapa in ETAPAS_PROCESO) +
+                 f" {mb_por_segundo:>8.1f}")
+        if con_memoria:
+            linea += f" {evento.get('memoria_pico', 0) / (1024 * 1024):>8.1f}"
+        if not evento.get('exito'):
+            linea += "  ✗ error"
+        lineas.append(linea)
+    return lineas
+
+
+@contextlib.contextmanager
+def perfilar_lote(opciones, carpeta_salida):
+    """
+    Modo --profile: mide el lote y guarda los resultados al terminar.
+    
+    Siempre arma una tabla de tiempos por etapa y por archivo (a partir de
+    los eventos 'archivo_fin'). Con 'cprofile' perfila el lote (y cada
+    archivo en los procesos del modo paralelo) y combina todo en un solo
+    perfil.prof, que se puede abrir con pstats, snakeviz, etc. Con
+    'memoria' usa tracemalloc para medir el pico de memoria de cada archivo.
+    Todo se guarda en <carpeta_salida>/.qgz_editor_perfil/.
+    
+    Args:
+        opciones: Opciones de --profile (ver leer_opciones_perfil)
+        carpeta_salida: Ruta a la carpeta de salida
+        
+    Yields:
+        dict: Opciones para los procesos del modo paralelo (procesar_lote)
+    """
+    carpeta = os.path.join(carpeta_salida, CARPETA_PERFIL)
+    os.makedirs(carpeta, exist_ok=True)
+    for nombre in os.listdir(carpeta):
+        if nombre.endswith('.prof'):
+            os.remove(os.path.join(carpeta, nombre))
+    perfil = {'carpeta': carpeta, 'cprofile': 'cprofile' in opciones, 'memoria': 'memoria' in opciones}
+    
+    # Los eventos siguen llegando también al destino que ya hubiera
+    eventos = []
+    anterior = getattr(_destino_eventos, 'destino', None)
+    
+    def recibir(evento):
+        if evento['evento'] == 'archivo_fin':
+            eventos.append(evento)
+        if anterior is not None:
+            anterior(evento)
+    
+    iniciar_memoria = perfil['memoria'] and not tracemalloc.is_tracing()
+    if iniciar_memoria:
+        tracemalloc.start()
+    perfilador = cProfile.Profile() if perfil['cprofile'] else None
+    inicio = time.perf_counter()
+    try:
+        with capturar_eventos(recibir):
+            if perfilador:
+                perfilador.enable()
+            try:
+                yield perfil
+            finally:
+                if perfilador:
+                    perfilador.disable()
+    finally:
+        duracion = time.perf_counter() - inicio
+        asignaciones = []
+        if perfil['memoria']:
+            asignaciones = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            if iniciar_memoria:
+                tracemalloc.stop()
+        
+        informe = [f"Perfil del lote: {len(eventos)} archivo(s) en {duracion:.3f} s", ""]
+        informe += formatear_tabla_perfil(eventos, perfil['memoria'])
+        
+        print("")
+        print("      ┌─ PERFIL POR ARCHIVO (segundos) ─┐")
+        for linea in informe[2:]:
+            print(f"      {linea}")
+        
+        if perfilador:
+            # Combinar el perfil del lote con los de cada proceso del modo paralelo
+            estadisticas = pstats.Stats(perfilador)
+            for nombre in sorted(os.listdir(carpeta)):
+                if nombre.endswith('.prof'):
+                    estadisticas.add(os.path.join(carpeta, nombre))
+                    os.remove(os.path.join(carpeta, nombre))
+            ruta_perfil = os.path.join(carpeta, 'perfil.prof')
+            estadisticas.dump_stats(ruta_perfil)
+            texto = io.StringIO()
+            estadisticas.stream = texto
+            estadisticas.sort_stats('cumulative').print_stats(25)
+            informe += ["", "cProfile (25 funciones con más tiempo acumulado):", texto.getvalue()]
+            print(f"      📊 Perfil de cProfile: {ruta_perfil}")
+            print(f"         (python -m pstats {ruta_perfil}, snakeviz, etc.)")
+        
+        if asignaciones:
+            informe += ["", "tracemalloc (memoria viva al terminar, 10 líneas con más memoria):"]
+            informe += [str(estadistica) for estadistica in asignaciones]
+        
+        ruta_informe = os.path.join(carpeta, 'perfil.txt')
+        with open(ruta_informe, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(informe) + '\n')
+        print(f"      📄 Informe del perfil: {ruta_informe}")
+
+
+def ejecutar_configuracion(config, directorio_base, trabajos=0, forzar=False,
+                          simular=False, ejecutor=None, perfil=None, incremental=True):
+    """
+    Ejecuta los pasos 2 a 4 con una configuración ya validada.
+    
+    Es el punto de entrada para usar el editor como biblioteca (por
+    ejemplo, desde el servidor web): recibe la configuración como
+    diccionario y no lee config.json.
+    
+    Args:
+        config: Diccionario de configuración validado
+        directorio_base: Directorio desde el que se resuelven las carpetas
+        trabajos: Cantidad de procesos (0 = automático, 1 = secuencial)
+        forzar: Procesar también los archivos que no cambiaron
+        simular: Solo contar coincidencias, sin escribir salidas
+        ejecutor: ProcessPoolExecutor ya creado para reutilizar (opcional)
+        perfil: Opciones de --profile (ver leer_opciones_perfil), o None
+        incremental: Omitir los archivos sin cambios y retomar lotes cortados
+                     (ver procesar_lote)
+        
+    Returns:
+        int: Código de salida (0 si todo salió bien, 1 si hubo errores graves
+             o algún archivo no se pudo procesar)
+    """
+    # Mostrar módulos activos y su configuración
     print("")
     print("   Módulos activos encontrados:")
     for nombre_modulo, modulo in config['modulos'].items():
@@ -488,9 +3706,18 @@ def main():
             print(f"   │      {modulo.get('descripcion', '')}")
             if nombre_modulo == 'reemplazo_texto':
                 reglas = modulo.get('reglas', [])
+                tablas = modulo.get('tablas_cargadas', [])
                 print(f"   │      Reglas configuradas: {len(reglas)}")
+                # Las reglas de las tablas van al final y solo se resumen
+                reglas = reglas[:len(reglas) - sum(tabla['reglas'] for tabla in tablas)]
                 for i, regla in enumerate(reglas, 1):
-                    print(f"   │        {i}. '{regla['buscar']}' → '{regla['reemplazar_por']}'")
+                    tipo_regex = ' (regex)' if regla.get('tipo') == 'regex' else ''
+                    print(f"   │        {i}. '{regla['buscar']}' → '{regla['reemplazar_por']}'{tipo_regex}")
+                    ambito = normalizar_ambito(regla.get('ambito'))
+                    if ambito:
+                        print(f"   │           (solo dentro de: {', '.join(ambito)})")
+                for tabla in tablas:
+                    print(f"   │        📄 {tabla['archivo']}: {tabla['reglas']} regla(s)")
     print(f"   └── Postfijo de salida: '{config['postfijo']}'")
     
     # Paso 2: Verificar carpetas
@@ -499,9 +3726,7 @@ def main():
         print("\n" + "=" * 70)
         print("❌ El programa no puede continuar debido a errores en las carpetas.")
         print("=" * 70)
-        if sys.stdin.isatty():
-            input("\nPresiona ENTER para cerrar...")
-        sys.exit(1)
+        return 1
     
     # Paso 3: Obtener lista de archivos .qgz
     archivos_qgz = obtener_archivos_qgz(carpeta_entrada)
@@ -509,9 +3734,16 @@ def main():
         print("\n" + "=" * 70)
         print("⚠️ No hay archivos para procesar.")
         print("=" * 70)
-        if sys.stdin.isatty():
-            input("\nPresiona ENTER para cerrar...")
-        sys.exit(0)
+        return 0
+    
+    # Modo simulación: solo contar coincidencias
+    if simular:
+        errores = ejecutar_simulacion(archivos_qgz, carpeta_entrada, config, trabajos, ejecutor)
+        print("")
+        print("=" * 70)
+        print("▶ SIMULACIÓN FINALIZADA (no se modificó ningún archivo)")
+        print("=" * 70)
+        return 1 if errores else 0
     
     # Paso 4: Procesar cada archivo
     print("")
@@ -519,23 +3751,10 @@ def main():
     print("[PASO 4/4] 🔄 PROCESANDO ARCHIVOS")
     print("=" * 70)
     
-    exitosos = 0
-    fallidos = 0
-    
-    for i, archivo in enumerate(archivos_qgz, 1):
-        print("")
-        print(f"   ┌────────────────────────────────────────────────────────────────")
-        print(f"   │ ARCHIVO {i} de {len(archivos_qgz)}: {archivo}")
-        print(f"   └────────────────────────────────────────────────────────────────")
-        
-        try:
-            if procesar_archivo_qgz(archivo, carpeta_entrada, carpeta_salida, config):
-                exitosos += 1
-            else:
-                fallidos += 1
-        except Exception as e:
-            print(f"      ✗ ERROR no manejado: {str(e)}")
-            fallidos += 1
+    medicion = perfilar_lote(perfil, carpeta_salida) if perfil else contextlib.nullcontext()
+    with medicion as opciones_perfil:
+        resultado = procesar_lote(archivos_qgz, carpeta_entrada, carpeta_salida, config,
+                                  trabajos, forzar, ejecutor, opciones_perfil, incremental)
     
     # Resumen final
     print("")
@@ -546,15 +3765,16 @@ def main():
     print("   ┌─────────────────────────────────────────────┐")
     print("   │            RESUMEN DE EJECUCIÓN            │")
     print("   ├─────────────────────────────────────────────┤")
-    print(f"   │  ✅ Procesados correctamente: {exitosos:>13} │")
-    print(f"   │  ❌ Con errores:              {fallidos:>13} │")
+    print(f"   │  ✅ Procesados correctamente: {resultado['exitosos']:>13} │")
+    print(f"   │  ❌ Con errores:              {resultado['fallidos']:>13} │")
+    print(f"   │  ⏭️ Omitidos (sin cambios):   {resultado['omitidos']:>13} │")
     print(f"   │  📁 Total archivos:           {len(archivos_qgz):>13} │")
     print("   └─────────────────────────────────────────────┘")
     print("")
     print(f"   📂 Los archivos modificados están en: {carpeta_salida}")
     print("")
     
-    if fallidos > 0:
+    if resultado['fallidos'] > 0:
         print("   ⚠️ Algunos archivos tuvieron errores. Revisa los mensajes anteriores.")
     else:
         print("   ✅ Todos los archivos se procesaron correctamente.")
@@ -562,9 +3782,412 @@ def main():
     print("")
     print("=" * 70)
     
+    return 1 if resultado['fallidos'] > 0 else 0
+
+
+def iniciar_proceso_vigilancia(config):
+    """
+    Prepara un proceso del modo --watch (initializer del ProcessPoolExecutor).
+    
+    La configuración llega una sola vez por proceso, y el motor de las
+    reglas sin ámbito se prepara por adelantado (de la caché de reglas, si
+    ya está); los demás se preparan con el primer archivo que los necesite
+    y se reutilizan para los siguientes.
+    
+    Args:
+        config: Diccionario de configuración validado
+    """
+    global _config_vigilancia, _motores_vigilancia
+    # Ctrl+C lo atiende el proceso principal, que deja terminar los archivos en curso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _config_vigilancia = config
+    _motores_vigilancia = {}
+    
+    modulo = config['modulos'].get('reemplazo_texto', {})
+    reglas = modulo.get('reglas', []) if modulo.get('activo', False) else []
+    if reglas and not any(normalizar_ambito(regla.get('ambito')) for regla in reglas):
+        obtener_motor(_motores_vigilancia.setdefault(frozenset(), {}), reglas, b'')
+
+
+def procesar_archivo_vigilado(indice, total, archivo_qgz, carpeta_entrada, carpeta_salida):
+    """
+    Procesa un archivo en un proceso del modo --watch (ver iniciar_proceso_vigilancia).
+    
+    Returns:
+        tuple: (exito, texto_del_registro, lista_de_eventos)
+    """
+    return procesar_archivo_con_log(indice, total, archivo_qgz, carpeta_entrada, carpeta_salida,
+                                    _config_vigilancia, motores=_motores_vigilancia)
+
+
+def firmas_carpeta(carpeta_entrada):
+    """
+    Firma (tamaño y fecha) de cada .qgz de una carpeta, con una sola lectura.
+    
+    Args:
+        carpeta_entrada: Ruta a la carpeta
+        
+    Returns:
+        dict: Nombre de archivo → firma (mismo formato que firma_archivo)
+    """
+    firmas = {}
+    with os.scandir(carpeta_entrada) as entradas:
+        for entrada in entradas:
+            if not es_archivo_qgz(entrada.name):
+                continue
+            try:
+                if entrada.is_file():
+                    estado = entrada.stat()
+                    firmas[entrada.name] = {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+            except FileNotFoundError:
+                continue
+    return firmas
+
+
+def vigilar_carpeta(config, directorio_base, trabajos=0, forzar=False,
+                    intervalo=INTERVALO_VIGILANCIA, espera=ESPERA_ARCHIVO_ESTABLE):
+    """
+    Modo --watch: procesa cada .qgz nuevo o modificado en cuanto deja de cambiar.
+    
+    La configuración se valida una sola vez y los procesos de trabajo se
+    crean al empezar y quedan vivos, con las reglas ya compiladas, así que
+    cada archivo que llega solo paga su propio procesamiento. Un archivo se
+    toma cuando su tamaño y su fecha no cambiaron durante 'espera'
+    segundos (así no se leen archivos a medio copiar). El manifiesto se
+    actualiza después de cada archivo: al reiniciar, no se repite nada.
+    
+    Args:
+        config: Diccionario de configuración validado
+        directorio_base: Directorio desde el que se resuelven las carpetas
+        trabajos: Cantidad de procesos (0 = automático)
+        forzar: Procesar también los archivos que ya estaban al día al empezar
+        intervalo: Segundos entre revisiones de la carpeta
+        espera: Segundos sin cambios antes de procesar un archivo
+        
+    Returns:
+        int: Código de salida (0 al detenerse con Ctrl+C, 1 si no se pudo empezar)
+    """
+    carpeta_entrada, carpeta_salida = verificar_carpetas(config, directorio_base)
+    if carpeta_entrada is None:
+        print("\n" + "=" * 70)
+        print("❌ El programa no puede continuar debido a errores en las carpetas.")
+        print("=" * 70)
+        return 1
+    
+    trabajos = resolver_trabajos(trabajos, os.cpu_count() or 1)
+    hash_config = calcular_hash_configuracion(config)
+    # Las líneas que dejó una ejecución interrumpida también se pasan al manifiesto al salir
+    diario = leer_diario(carpeta_salida)
+    lineas_diario = len(diario)
+    manifiesto = cargar_manifiesto(carpeta_salida, diario)
+    
+    print("")
+    print("=" * 70)
+    print("[VIGILANDO] 👀 Esperando archivos .qgz nuevos o modificados")
+    print("=" * 70)
+    print(f"   📂 Carpeta: {carpeta_entrada}")
+    print(f"   ⚙️ Procesos: {trabajos} · revisión cada {intervalo:g} s · "
+          f"archivos sin cambios durante {espera:g} s")
+    print("   (los cambios en config.json se toman al reiniciar; Ctrl+C para salir)")
+    emitir_evento('vigilancia_inicio', carpeta=carpeta_entrada, trabajos=trabajos)
+    
+    # Que los procesos lean el motor de la caché en lugar de compilarlo cada uno
+    precompilar_reglas(config)
+    
+    def crear_ejecutor():
+        return ProcessPoolExecutor(max_workers=trabajos, initializer=iniciar_proceso_vigilancia,
+                                   initargs=(config,))
+    
+    observados = {}   # nombre → (firma, momento desde el que no cambia)
+    procesados = {}   # nombre → firma con la que ya se procesó (o se omitió)
+    en_curso = {}     # futuro → (nombre, firma)
+    reintentados = {} # nombre → firma que ya se reintentó tras un proceso caído
+    enviados = exitosos = fallidos = 0
+    ejecutor = crear_ejecutor()
+    try:
+        while True:
+            ahora = time.monotonic()
+            try:
+                firmas = firmas_carpeta(carpeta_entrada)
+            except OSError as e:
+                print(f"   ⚠️ No se pudo leer la carpeta de entrada: {str(e)}")
+                firmas = {}
+            
+            for nombre in list(observados):
+                if nombre not in firmas:
+                    del observados[nombre]
+                    procesados.pop(nombre, None)
+            
+            ocupados = {nombre for nombre, _ in en_curso.values()}
+            for nombre, firma in sorted(firmas.items()):
+                anterior = observados.get(nombre)
+                if anterior is None or anterior[0] != firma:
+                    observados[nombre] = (firma, ahora)
+                    continue
+                if ahora - anterior[1] < espera or procesados.get(nombre) == firma or nombre in ocupados:
+                    continue
+                if not forzar and esta_actualizado(manifiesto, nombre, carpeta_entrada, carpeta_salida,
+                                                   config, hash_config):
+                    procesados[nombre] = firma
+                    continue
+                enviados += 1
+                print(f"\n   📥 {nombre} ({firma['tamano'] / (1024 * 1024):.1f} MB): en cola")
+                futuro = ejecutor.submit(procesar_archivo_vigilado, enviados, enviados, nombre,
+                                         carpeta_entrada, carpeta_salida)
+                en_curso[futuro] = (nombre, firma)
+            
+            if not en_curso:
+                time.sleep(intervalo)
+                continue
+            
+            terminados, _ = wait(en_curso, timeout=intervalo, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                if futuro not in en_curso:
+                    # Descartado junto con un pool roto: se vuelve a enviar
+                    continue
+                nombre, firma = en_curso.pop(futuro)
+                procesados[nombre] = firma
+                try:
+                    exito, registro, eventos = futuro.result()
+                except Exception as e:
+                    exito = False
+                    registro = f"\n      ✗ ERROR en el proceso de {nombre}: {str(e)}\n"
+                    eventos = [dict(evento='archivo_fin', tiempo=round(time.time(), 3),
+                                    archivo=nombre, exito=False)]
+                    if isinstance(e, BrokenProcessPool):
+                        # Un proceso murió: los pendientes se reintentan con procesos nuevos
+                        for pendiente, _ in en_curso.values():
+                            procesados.pop(pendiente, None)
+                        en_curso.clear()
+                        ejecutor.shutdown(wait=False, cancel_futures=True)
+                        ejecutor = crear_ejecutor()
+                        # Este archivo también, pero una sola vez: si fue él quien
+                        # tiró el proceso, no se lo reintenta para siempre
+                        if reintentados.get(nombre) != firma:
+                            reintentados[nombre] = firma
+                            procesados.pop(nombre, None)
+                            print(f"\n   🔁 {nombre}: un proceso de trabajo terminó inesperadamente, se reintenta")
+                            continue
+                print(registro, end='')
+                for evento in eventos:
+                    enviar_evento(evento)
+                if not exito:
+                    fallidos += 1
+                    continue
+                exitosos += 1
+                try:
+                    nombre_salida, entrada = entrada_manifiesto(nombre, carpeta_entrada, carpeta_salida,
+                                                                config, hash_config)
+                    manifiesto[nombre_salida] = entrada
+                    registrar_en_diario(carpeta_salida, nombre_salida, entrada)
+                    lineas_diario += 1
+                    if lineas_diario >= MAXIMO_LINEAS_DIARIO:
+                        guardar_manifiesto(carpeta_salida, manifiesto)
+                        lineas_diario = 0
+                except OSError as e:
+                    print(f"   ⚠️ No se pudo guardar el manifiesto: {str(e)}")
+    except KeyboardInterrupt:
+        print("\n   🛑 Deteniendo (se terminan los archivos en curso)...")
+    finally:
+        ejecutor.shutdown(wait=True, cancel_futures=True)
+        if lineas_diario:
+            try:
+                guardar_manifiesto(carpeta_salida, manifiesto)
+            except OSError as e:
+                print(f"   ⚠️ No se pudo guardar el manifiesto: {str(e)}")
+    
+    print("")
+    print("=" * 70)
+    print(f"▶ VIGILANCIA FINALIZADA: ✅ {exitosos} procesado(s) · ❌ {fallidos} con errores")
+    print("=" * 70)
+    emitir_evento('vigilancia_fin', exitosos=exitosos, fallidos=fallidos)
+    return 0
+
+
+class SalidaPorHilo(io.TextIOBase):
+    """
+    Reemplazo de sys.stdout que permite capturar los mensajes por hilo.
+    
+    Los hilos con una captura activa (capturar_salida) reciben sus propios
+    mensajes; el resto sigue escribiendo en la salida original. Así varios
+    trabajos pueden ejecutarse a la vez dentro del mismo proceso. Solo está
+    instalado mientras haya alguna captura activa.
+    """
+    
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+        # Capturas activas en todos los hilos (se cuenta con BLOQUEO_SALIDA)
+        self.capturas = 0
+    
+    def write(self, texto):
+        destino = getattr(self.local, 'destino', None)
+        if destino is None:
+            return self.original.write(texto)
+        destino(texto)
+        return len(texto)
+    
+    def flush(self):
+        if getattr(self.local, 'destino', None) is None:
+            self.original.flush()
+
+
+BLOQUEO_SALIDA = threading.Lock()
+
+
+@contextlib.contextmanager
+def capturar_salida(al_recibir_linea):
+    """
+    Envía los mensajes del hilo actual a una función, línea por línea.
+    
+    La primera captura instala SalidaPorHilo como sys.stdout y la última
+    en terminar vuelve a poner la salida original.
+    
+    Args:
+        al_recibir_linea: Función que recibe cada línea (sin el salto final)
+    """
+    with BLOQUEO_SALIDA:
+        if not isinstance(sys.stdout, SalidaPorHilo):
+            sys.stdout = SalidaPorHilo(sys.stdout)
+        salida = sys.stdout
+        salida.capturas += 1
+    
+    pendiente = []
+    
+    def recibir(texto):
+        partes = texto.split('\n')
+        if len(partes) == 1:
+            pendiente.append(texto)
+            return
+        pendiente.append(partes[0])
+        al_recibir_linea(''.join(pendiente))
+        for parte in partes[1:-1]:
+            al_recibir_linea(parte)
+        pendiente[:] = [partes[-1]] if partes[-1] else []
+    
+    anterior = getattr(salida.local, 'destino', None)
+    salida.local.destino = recibir
+    try:
+        yield
+    finally:
+        salida.local.destino = anterior
+        if pendiente:
+            al_recibir_linea(''.join(pendiente))
+        with BLOQUEO_SALIDA:
+            salida.capturas -= 1
+            # Si otro código ya reemplazó sys.stdout, no se lo pisa
+            if salida.capturas == 0 and sys.stdout is salida:
+                sys.stdout = salida.original
+
+
+@contextlib.contextmanager
+def escribir_eventos_jsonl(ruta):
+    """
+    Escribe los eventos de progreso del hilo actual en un archivo JSON Lines.
+    
+    Args:
+        ruta: Ruta del archivo ('-' = sys.stderr, None = no escribir eventos)
+    """
+    if not ruta:
+        yield
+        return
+    
+    archivo = sys.stderr if ruta == '-' else open(ruta, 'w', encoding='utf-8')
+    
+    def escribir(evento):
+        archivo.write(json.dumps(evento, ensure_ascii=False) + '\n')
+        archivo.flush()
+    
+    try:
+        with capturar_eventos(escribir):
+            yield
+    finally:
+        if archivo is not sys.stderr:
+            archivo.close()
+
+
+def ejecutar_trabajo(config, directorio_base, al_recibir_linea=None, trabajos=0,
+                     forzar=False, simular=False, ejecutor=None, al_recibir_evento=None,
+                     perfil=None, incremental=True):
+    """
+    Ejecuta el editor completo con una configuración recibida como diccionario.
+    
+    Valida la configuración y ejecuta los pasos 2 a 4 sin leer config.json
+    ni lanzar otro proceso de Python. Los mensajes se envían a
+    al_recibir_linea a medida que se generan.
+    
+    Args:
+        config: Diccionario de configuración (sin validar)
+        directorio_base: Directorio desde el que se resuelven las carpetas y
+                         las tablas de reglas
+        al_recibir_linea: Función que recibe cada línea de progreso
+                          (si es None, se imprime normalmente)
+        trabajos, forzar, simular, ejecutor, incremental: Como en ejecutar_configuracion
+        al_recibir_evento: Función que recibe cada evento de progreso
+                           estructurado (ver emitir_evento)
+        perfil: Opciones de --profile (ver leer_opciones_perfil), o None
+        
+    Returns:
+        int: Código de salida (0 si todo salió bien, ver ejecutar_configuracion)
+    """
+    with contextlib.ExitStack() as capturas:
+        if al_recibir_linea:
+            capturas.enter_context(capturar_salida(al_recibir_linea))
+        if al_recibir_evento:
+            capturas.enter_context(capturar_eventos(al_recibir_evento))
+        mostrar_banner()
+        print("[PASO 1/4] 📂 Validando configuración recibida...")
+        if validar_configuracion(config, directorio_base) is None:
+            print("\n" + "=" * 70)
+            print("❌ El programa no puede continuar debido a errores en la configuración.")
+            print("=" * 70)
+            return 1
+        return ejecutar_configuracion(config, directorio_base, trabajos, forzar, simular, ejecutor,
+                                      perfil, incremental)
+
+
+def main(argv=None):
+    """Función principal del programa."""
+    args = parsear_argumentos(argv)
+    
+    # Determinar directorio base (donde está el script)
+    directorio_base = os.path.dirname(os.path.abspath(__file__))
+    ruta_config = os.path.join(directorio_base, 'config.json')
+    
+    # Subcomandos del índice de búsqueda
+    if args.comando == 'indexar':
+        import qgz_indice
+        sys.exit(qgz_indice.main_indexar(directorio_base, ruta_config, args.jobs))
+    if args.comando == 'buscar':
+        import qgz_indice
+        sys.exit(qgz_indice.main_buscar(directorio_base, ruta_config, args.texto, args.tipo, args.exacto))
+    
+    mostrar_banner()
+    
+    print(f"📍 Directorio de trabajo: {directorio_base}\n")
+    
+    # Paso 1: Cargar configuración
+    config = cargar_configuracion(ruta_config)
+    if config is None:
+        print("\n" + "=" * 70)
+        print("❌ El programa no puede continuar debido a errores en la configuración.")
+        print("=" * 70)
+        if sys.stdin.isatty():
+            input("\nPresiona ENTER para cerrar...")
+        sys.exit(1)
+    
+    with escribir_eventos_jsonl(args.eventos):
+        if args.vigilar:
+            # Modo daemon: no hay nadie para presionar ENTER al terminar
+            sys.exit(vigilar_carpeta(config, directorio_base, args.jobs, args.forzar,
+                                     args.intervalo, args.espera))
+        codigo = ejecutar_configuracion(config, directorio_base, args.jobs, args.forzar, args.simular,
+                                        perfil=args.perfil)
+    
     # Solo pedir ENTER si estamos en modo interactivo (no desde web)
     if sys.stdin.isatty():
         input("\nPresiona ENTER para cerrar...")
+    sys.exit(codigo)
 
 
 if __name__ == "__main__":
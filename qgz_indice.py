@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de búsqueda de QGZ Editor
+
+Guarda en una base SQLite las fuentes de datos, hosts, IPs y rutas de
+archivo que aparecen en cada proyecto .qgz de la carpeta de entrada, para
+responder preguntas como "¿qué proyectos siguen apuntando al host X?" sin
+abrir ningún archivo.
+
+Uso:
+    python qgz_editor.py indexar          # crea o actualiza el índice
+    python qgz_editor.py buscar 10.1.2.3  # consulta el índice
+"""
+
+import os
+import re
+import json
+import hashlib
+import sqlite3
+import zipfile
+import xml.parsers.expat
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import qgz_editor
+
+
+# Nombre de la base de datos del índice (en la carpeta de salida)
+NOMBRE_INDICE = '.qgz_editor_indice.sqlite'
+VERSION_INDICE = 1
+
+# Tipos de valores que se guardan en el índice
+TIPOS_REFERENCIA = {
+    'datasource': 'Fuente de datos',
+    'host': 'Host',
+    'ip': 'Dirección IP',
+    'ruta': 'Ruta de archivo',
+}
+
+# Elementos del .qgs cuyo texto es la fuente de datos de una capa
+ELEMENTOS_FUENTE = {'datasource'}
+
+# Direcciones IPv4 en cualquier parte del documento (se validan con es_ip_valida):
+# el mismo token que las reglas 'ip' del editor
+PATRON_IP = re.compile(qgz_editor.PATRON_TOKEN_IP.encode('ascii'))
+SOLAPAMIENTO_IP = qgz_editor.SOLAPAMIENTO_TOKEN_IP
+
+# Hosts dentro de una fuente de datos
+PATRON_HOST_CLAVE = re.compile(r"\b(?:host|hostaddr)\s*=\s*'?([^\s'&;|]+)", re.IGNORECASE)
+PATRON_HOST_URL = re.compile(r"\b[a-zA-Z][\w+.-]*://(?:[^/@\s'\"]*@)?(\[[0-9a-fA-F:]+\]|[^/:\s'\"?#&|]+)")
+
+# Rutas de archivo dentro de una fuente de datos
+PATRON_RUTA_DBNAME = re.compile(r"\bdbname\s*=\s*'([^']+)'")
+PATRON_RUTA_ABSOLUTA = re.compile(r'^(?:/|\.{1,2}/|[A-Za-z]:[\\/]|\\\\)')
+
+ESQUEMA_INDICE = """
+CREATE TABLE IF NOT EXISTS metadatos (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS archivos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT UNIQUE NOT NULL,
+    tamano INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    indexado TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS valores (
+    id INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    valor_minusculas TEXT NOT NULL,
+    UNIQUE (tipo, valor)
+);
+CREATE INDEX IF NOT EXISTS valores_minusculas ON valores (valor_minusculas);
+CREATE TABLE IF NOT EXISTS apariciones (
+    valor_id INTEGER NOT NULL REFERENCES valores (id),
+    archivo_id INTEGER NOT NULL REFERENCES archivos (id) ON DELETE CASCADE,
+    cantidad INTEGER NOT NULL,
+    PRIMARY KEY (valor_id, archivo_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS apariciones_archivo ON apariciones (archivo_id);
+"""
+
+
+def calcular_sha256(ruta):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo.
+    
+    Args:
+        ruta: Ruta al archivo
+    
+    Returns:
+        str: Hash en hexadecimal
+    """
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(qgz_editor.TAMANO_BLOQUE_COPIA), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def referencias_de_fuente(fuente):
+    """
+    Obtiene los hosts, IPs y rutas de archivo de una fuente de datos de QGIS.
+    
+    Args:
+        fuente: Texto de un elemento <datasource>
+    
+    Returns:
+        list: Tuplas (tipo, valor)
+    """
+    referencias = [('datasource', fuente)]
+    
+    for patron in (PATRON_HOST_CLAVE, PATRON_HOST_URL):
+        for coincidencia in patron.finditer(fuente):
+            host = coincidencia.group(1).strip('[]')
+            # Las IPv4 se cuentan al recorrer todo el documento
+            if not qgz_editor.es_ip_valida(host):
+                referencias.append(('host', host))
+    
+    for coincidencia in PATRON_RUTA_DBNAME.finditer(fuente):
+        if PATRON_RUTA_ABSOLUTA.match(coincidencia.group(1)):
+            referencias.append(('ruta', coincidencia.group(1)))
+    
+    # Capas de archivo: la ruta va antes de las opciones separadas por '|' o '?'
+    ruta = fuente.split('|', 1)[0]
+    if ruta.startswith('file://'):
+        ruta = ruta[len('file://'):].split('?', 1)[0]
+    if PATRON_RUTA_ABSOLUTA.match(ruta):
+        referencias.append(('ruta', ruta))
+    
+    return referencias
+
+
+def extraer_referencias_documento(origen, referencias, tamano_bloque=qgz_editor.TAMANO_BLOQUE_QGS):
+    """
+    Recorre un documento .qgs en streaming y acumula sus referencias.
+    
+    Las IPs se buscan por bloques como en aplicar_reemplazos_en_bloques: se
+    conserva el byte anterior a lo pendiente para que un número cortado
+    entre dos bloques no parezca una dirección.
+    
+    Args:
+        origen: Archivo binario abierto para lectura
+        referencias: Diccionario (tipo, valor) → cantidad (se actualiza)
+        tamano_bloque: Bytes a leer en cada bloque
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    dentro_de_fuente = []
+    textos = []
+    
+    def al_abrir(nombre, atributos):
+        if nombre in ELEMENTOS_FUENTE:
+            dentro_de_fuente.append(nombre)
+            textos.clear()
+    
+    def al_cerrar(nombre):
+        if dentro_de_fuente and nombre == dentro_de_fuente[-1]:
+            dentro_de_fuente.pop()
+            fuente = ''.join(textos).strip()
+            if fuente:
+                for referencia in referencias_de_fuente(fuente):
+                    referencias[referencia] = referencias.get(referencia, 0) + 1
+    
+    def al_leer_texto(texto):
+        if dentro_de_fuente:
+            textos.append(texto)
+    
+    parser.StartElementHandler = al_abrir
+    parser.EndElementHandler = al_cerrar
+    parser.CharacterDataHandler = al_leer_texto
+    
+    previo = b''
+    pendiente = b''
+    while True:
+        bloque = origen.read(tamano_bloque)
+        parser.Parse(bloque, not bloque)
+        
+        # IPs en cualquier parte del documento (también fuera de las fuentes de datos).
+        # 'previo' ya se revisó: solo es el entorno de la búsqueda
+        datos = previo + pendiente + bloque
+        limite = len(datos) if not bloque else len(datos) - SOLAPAMIENTO_IP
+        posicion = len(previo)
+        for coincidencia in PATRON_IP.finditer(datos, len(previo)):
+            if coincidencia.start() >= limite:
+                break
+            ip = coincidencia.group(1).decode('ascii')
+            if qgz_editor.es_ip_valida(ip):
+                referencias[('ip', ip)] = referencias.get(('ip', ip), 0) + 1
+            posicion = coincidencia.end()
+        corte = max(posicion, limite)
+        previo = datos[max(corte - 1, 0):corte]
+        pendiente = datos[corte:]
+        
+        if not bloque:
+            break
+
+
+def extraer_referencias_qgz(ruta_qgz):
+    """
+    Extrae las referencias de todos los .qgs de un proyecto .qgz.
+    
+    Args:
+        ruta_qgz: Ruta al archivo .qgz
+    
+    Returns:
+        tuple: (dict (tipo, valor) → cantidad, mensaje_de_error o None)
+    """
+    referencias = {}
+    try:
+        with zipfile.ZipFile(ruta_qgz, 'r') as zip_entrada:
+            miembros_qgs = [m for m in zip_entrada.infolist()
+                            if not m.is_dir() and m.filename.lower().endswith('.qgs')]
+            if not miembros_qgs:
+                return referencias, "No se encontró ningún archivo .qgs dentro del proyecto"
+            for miembro in miembros_qgs:
+                with zip_entrada.open(miembro, 'r') as origen:
+                    extraer_referencias_documento(origen, referencias)
+    except zipfile.BadZipFile:
+        return {}, "El archivo no es un ZIP válido"
+    except xml.parsers.expat.ExpatError as e:
+        return referencias, f"El .qgs no es un XML válido ({e})"
+    except Exception as e:
+        return {}, str(e)
+    return referencias, None
+
+
+def analizar_archivo(ruta_qgz, sha256_anterior):
+    """
+    Calcula el hash de un .qgz y, si cambió, extrae sus referencias.
+    
+    Se ejecuta en los procesos del modo paralelo.
+    
+    Args:
+        ruta_qgz: Ruta al archivo .qgz
+        sha256_anterior: Hash guardado en el índice (o None)
+    
+    Returns:
+        tuple: (sha256, referencias o None si el contenido no cambió, error o None)
+    """
+    sha256 = calcular_sha256(ruta_qgz)
+    if sha256 == sha256_anterior:
+        return sha256, None, None
+    referencias, error = extraer_referencias_qgz(ruta_qgz)
+    return sha256, referencias, error
+
+
+def abrir_indice(ruta_indice):
+    """
+    Abre (o crea) la base de datos del índice.
+    
+    Args:
+        ruta_indice: Ruta al archivo SQLite
+    
+    Returns:
+        sqlite3.Connection: Conexión abierta
+    """
+    conexion = sqlite3.connect(ruta_indice)
+    conexion.execute("PRAGMA foreign_keys = ON")
+    conexion.execute("PRAGMA journal_mode = WAL")
+    conexion.executescript(ESQUEMA_INDICE)
+    fila = conexion.execute("SELECT valor FROM metadatos WHERE clave = 'version'").fetchone()
+    if fila is None:
+        conexion.execute("INSERT INTO metadatos VALUES ('version', ?)", (str(VERSION_INDICE),))
+        conexion.commit()
+    elif fila[0] != str(VERSION_INDICE):
+        raise ValueError(f"El índice {ruta_indice} es de otra versión; bórralo para regenerarlo")
+    return conexion
+
+
+def guardar_referencias(conexion, archivo_id, referencias):
+    """
+    Reemplaza las referencias de un archivo en el índice.
+    
+    Args:
+        conexion: Conexión al índice
+        archivo_id: Id del archivo en la tabla 'archivos'
+        referencias: Diccionario (tipo, valor) → cantidad
+    """
+    conexion.execute("DELETE FROM apariciones WHERE archivo_id = ?", (archivo_id,))
+    conexion.executemany(
+        "INSERT OR IGNORE INTO valores (tipo, valor, valor_minusculas) VALUES (?, ?, ?)",
+        [(tipo, valor, valor.lower()) for tipo, valor in referencias])
+    conexion.executemany(
+        "INSERT INTO apariciones (valor_id, archivo_id, cantidad) "
+        "SELECT id, ?, ? FROM valores WHERE tipo = ? AND valor = ?",
+        [(archivo_id, cantidad, tipo, valor) for (tipo, valor), cantidad in referencias.items()])
+
+
+def actualizar_indice(carpeta_entrada, ruta_indice, trabajos=0):
+    """
+    Crea o actualiza el índice con los .qgz de la carpeta de entrada.
+    
+    Solo se vuelven a leer los archivos cuyo tamaño o fecha de modificación
+    cambiaron, y de ellos solo los que además cambiaron de contenido
+    (hash SHA-256). Los archivos que ya no existen se quitan del índice.
+    
+    Args:
+        carpeta_entrada: Ruta a la carpeta con los .qgz
+        ruta_indice: Ruta al archivo SQLite del índice
+        trabajos: Cantidad de procesos (0 = automático)
+    
+    Returns:
+        dict: Cantidades 'nuevos', 'actualizados', 'sin_cambios', 'eliminados' y 'errores'
+    """
+    resumen = dict.fromkeys(['nuevos', 'actualizados', 'sin_cambios', 'eliminados', 'errores'], 0)
+    archivos = sorted(f for f in os.listdir(carpeta_entrada)
+                      if qgz_editor.es_archivo_qgz(f) and os.path.isfile(os.path.join(carpeta_entrada, f)))
+    
+    conexion = abrir_indice(ruta_indice)
+    try:
+        anteriores = {nombre: (id_, tamano, mtime_ns, sha256) for id_, nombre, tamano, mtime_ns, sha256
+                      in conexion.execute("SELECT id, nombre, tamano, mtime_ns, sha256 FROM archivos")}
+        
+        # Quitar los archivos que ya no están en la carpeta
+        presentes = set(archivos)
+        for nombre, (id_, _, _, _) in anteriores.items():
+            if nombre not in presentes:
+                conexion.execute("DELETE FROM archivos WHERE id = ?", (id_,))
+                resumen['eliminados'] += 1
+        
+        # Elegir los archivos cuyo tamaño o fecha cambió
+        pendientes = []
+        for nombre in archivos:
+            firma = qgz_editor.firma_archivo(os.path.join(carpeta_entrada, nombre))
+            anterior = anteriores.get(nombre)
+            if anterior and (anterior[1], anterior[2]) == (firma['tamano'], firma['mtime_ns']):
+                resumen['sin_cambios'] += 1
+            else:
+                pendientes.append((nombre, firma, anterior))
+        
+        def registrar(nombre, firma, anterior, sha256, referencias, error):
+            ahora = datetime.now().isoformat(timespec='seconds')
+            if anterior is None:
+                cursor = conexion.execute(
+                    "INSERT INTO archivos (nombre, tamano, mtime_ns, sha256, indexado, error) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (nombre, firma['tamano'], firma['mtime_ns'], sha256, ahora, error))
+                archivo_id = cursor.lastrowid
+                resumen['nuevos'] += 1
+            else:
+                archivo_id = anterior[0]
+                conexion.execute(
+                    "UPDATE archivos SET tamano = ?, mtime_ns = ?, sha256 = ?, indexado = ? WHERE id = ?",
+                    (firma['tamano'], firma['mtime_ns'], sha256, ahora, archivo_id))
+                if referencias is not None:
+                    conexion.execute("UPDATE archivos SET error = ? WHERE id = ?", (error, archivo_id))
+                    resumen['actualizados'] += 1
+                else:
+                    # Solo cambió la fecha: el contenido es el mismo
+                    resumen['sin_cambios'] += 1
+            if referencias is not None:
+                guardar_referencias(conexion, archivo_id, referencias)
+            if error:
+                resumen['errores'] += 1
+                print(f"      ✗ {nombre}: {error}")
+        
+        trabajos = qgz_editor.resolver_trabajos(trabajos, len(pendientes))
+        rutas = [os.path.join(carpeta_entrada, nombre) for nombre, _, _ in pendientes]
+        hashes_anteriores = [anterior[3] if anterior else None for _, _, anterior in pendientes]
+        if trabajos > 1:
+            with ProcessPoolExecutor(max_workers=trabajos) as ejecutor:
+                resultados = ejecutor.map(analizar_archivo, rutas, hashes_anteriores)
+                for (nombre, firma, anterior), resultado in zip(pendientes, resultados):
+                    registrar(nombre, firma, anterior, *resultado)
+        else:
+            for (nombre, firma, anterior), ruta, sha256_anterior in zip(pendientes, rutas, hashes_anteriores):
+                registrar(nombre, firma, anterior, *analizar_archivo(ruta, sha256_anterior))
+        
+        # Quitar los valores que ya no aparecen en ningún archivo
+        conexion.execute("DELETE FROM valores WHERE id NOT IN (SELECT valor_id FROM apariciones)")
+        conexion.commit()
+    finally:
+        conexion.close()
+    
+    return resumen
+
+
+def buscar_en_indice(ruta_indice, texto, tipo=None, exacto=False):
+    """
+    Busca en el índice los proyectos que contienen un valor.
+    
+    Args:
+        ruta_indice: Ruta al archivo SQLite del índice
+        texto: Valor a buscar (sin distinguir mayúsculas de minúsculas)
+        tipo: Limitar la búsqueda a un tipo de TIPOS_REFERENCIA (opcional)
+        exacto: Si es True, el valor tiene que coincidir completo; si no,
+                basta con que lo contenga
+    
+    Returns:
+        list: Tuplas (archivo, tipo, valor, cantidad) ordenadas por archivo
+    """
+    condiciones = []
+    parametros = []
+    if exacto:
+        condiciones.append("v.valor_minusculas = ?")
+        parametros.append(texto.lower())
+    else:
+        condiciones.append("v.valor_minusculas LIKE ? ESCAPE '\\'")
+        escapado = texto.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        parametros.append(f"%{escapado}%")
+    if tipo:
+        condiciones.append("v.tipo = ?")
+        parametros.append(tipo)
+    
+    conexion = sqlite3.connect(f"file:{ruta_indice}?mode=ro", uri=True)
+    try:
+        return conexion.execute(
+            "SELECT a.nombre, v.tipo, v.valor, ap.cantidad "
+            "FROM valores v "
+            "JOIN apariciones ap ON ap.valor_id = v.id "
+            "JOIN archivos a ON a.id = ap.archivo_id "
+            f"WHERE {' AND '.join(condiciones)} "
+            "ORDER BY a.nombre, v.tipo, v.valor", parametros).fetchall()
+    finally:
+        conexion.close()
+
+
+def leer_carpetas(directorio_base, ruta_config):
+    """
+    Obtiene las carpetas de entrada y salida de config.json.
+    
+    A diferencia de cargar_configuracion, no valida las reglas: el índice
+    no las usa.
+    
+    Args:
+        directorio_base: Directorio donde está el script
+        ruta_config: Ruta a config.json
+    
+    Returns:
+        tuple: (carpeta_entrada, carpeta_salida)
+    """
+    config = {}
+    try:
+        with open(ruta_config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        pass
+    return (os.path.join(directorio_base, config.get('carpeta_entrada', 'data_in')),
+            os.path.join(directorio_base, config.get('carpeta_salida', 'data_out')))
+
+
+def main_indexar(directorio_base, ruta_config, trabajos=0):
+    """
+    Subcomando 'indexar': crea o actualiza el índice.
+    
+    Returns:
+        int: Código de salida del programa
+    """
+    carpeta_entrada, carpeta_salida = leer_carpetas(directorio_base, ruta_config)
+    if not os.path.isdir(carpeta_entrada):
+        print(f"\n❌ ERROR: No existe la carpeta de entrada: {carpeta_entrada}")
+        return 1
+    os.makedirs(carpeta_salida, exist_ok=True)
+    ruta_indice = os.path.join(carpeta_salida, NOMBRE_INDICE)
+    
+    print(f"🔎 Actualizando índice de {carpeta_entrada}...")
+    try:
+        resumen = actualizar_indice(carpeta_entrada, ruta_indice, trabajos)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"\n❌ ERROR al actualizar el índice: {str(e)}")
+        return 1
+    
+    print(f"   ✅ Nuevos: {resumen['nuevos']}  |  Actualizados: {resumen['actualizados']}  |  "
+          f"Sin cambios: {resumen['sin_cambios']}  |  Eliminados: {resumen['eliminados']}")
+    if resumen['errores']:
+        print(f"   ⚠️ {resumen['errores']} archivo(s) con errores")
+    print(f"   📁 Índice: {ruta_indice}")
+    return 0
+
+
+def main_buscar(directorio_base, ruta_config, texto, tipo=None, exacto=False):
+    """
+    Subcomando 'buscar': consulta el índice sin abrir ningún archivo .qgz.
+    
+    Returns:
+        int: Código de salida del programa (1 si no hay índice)
+    """
+    _, carpeta_salida = leer_carpetas(directorio_base, ruta_config)
+    ruta_indice = os.path.join(carpeta_salida, NOMBRE_INDICE)
+    if not os.path.exists(ruta_indice):
+        print(f"\n❌ ERROR: No existe el índice: {ruta_indice}")
+        print("   👉 Créalo primero con: python qgz_editor.py indexar")
+        return 1
+    
+    resultados = buscar_en_indice(ruta_indice, texto, tipo, exacto)
+    if not resultados:
+        print(f"   Sin resultados para '{texto}'")
+        return 0
+    
+    archivos = {}
+    for archivo, tipo_valor, valor, cantidad in resultados:
+        archivos.setdefault(archivo, []).append((tipo_valor, valor, cantidad))
+    
+    print(f"   {len(archivos)} proyecto(s) contienen '{texto}':")
+    for archivo, valores in archivos.items():
+        print(f"   📄 {archivo}")
+        for tipo_valor, valor, cantidad in valores:
+            print(f"      • [{TIPOS_REFERENCIA[tipo_valor]}] {valor} ({cantidad} veces)")
+    return 0
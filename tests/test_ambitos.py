@@ -0,0 +1,84 @@
+import io
+import random
+
+import qgz_editor
+
+
+def aplicar(documento, reglas, tamano_bloque=qgz_editor.TAMANO_BLOQUE_QGS):
+    salida = io.BytesIO()
+    conteos = qgz_editor.aplicar_reglas_documento(lambda: io.BufferedReader(io.BytesIO(documento)),
+                                                  salida, reglas, {}, tamano_bloque)
+    return salida.getvalue(), conteos
+
+
+DOCUMENTO = (b'<qgis><maplayer><datasource>host=10.0.0.1</datasource>'
+             b'<layername>10.0.0.1 x</layername></maplayer></qgis>')
+
+
+def test_regla_con_ambito_solo_actua_dentro_del_ambito():
+    reglas = [{'buscar': '10.0.0.1', 'reemplazar_por': '10.0.0.2', 'tipo': 'ip', 'ambito': '//maplayer/datasource'}]
+    resultado, conteos = aplicar(DOCUMENTO, reglas)
+    assert resultado == DOCUMENTO.replace(b'host=10.0.0.1', b'host=10.0.0.2')
+    assert conteos == {'10.0.0.1': 1}
+
+
+def test_reglas_sin_ambito_cruzan_los_limites_de_los_ambitos():
+    reglas = [
+        {'buscar': '<datasource>host', 'reemplazar_por': '<datasource>HOST'},
+        {'buscar': '10.0.0.1', 'reemplazar_por': '10.0.0.2', 'tipo': 'ip', 'ambito': 'datasource'},
+        {'buscar': 'x</layername>', 'reemplazar_por': 'y</layername>'},
+    ]
+    esperado = (b'<qgis><maplayer><datasource>HOST=10.0.0.2</datasource>'
+                b'<layername>10.0.0.1 y</layername></maplayer></qgis>')
+    for tamano in (1, 2, 5, 13, 4096):
+        resultado, conteos = aplicar(DOCUMENTO, reglas, tamano)
+        assert resultado == esperado
+        assert conteos == {'<datasource>host': 1, '10.0.0.1': 1, 'x</layername>': 1}
+
+
+def test_agregar_una_regla_con_ambito_no_cambia_las_demas():
+    sin_ambito = [
+        {'buscar': 'a<b>', 'reemplazar_por': '[AB]'},
+        {'buscar': r'([a-c]{2})</b>', 'reemplazar_por': r'\1|', 'tipo': 'regex'},
+        {'buscar': '1.2.3.4', 'reemplazar_por': '5.6.7.8', 'tipo': 'ip'},
+    ]
+    con_ambito = sin_ambito + [{'buscar': 'zz', 'reemplazar_por': 'ZZ', 'ambito': 'b'}]
+    azar = random.Random(9)
+    piezas = ['a', 'b', 'c', '1.2.3.4', '.5', ' ']
+    for _ in range(300):
+        partes = ['<r>']
+        for _ in range(azar.randint(0, 6)):
+            etiqueta = azar.choice('bc')
+            texto = ''.join(azar.choice(piezas) for _ in range(azar.randint(0, 4)))
+            partes.append(f'{texto}<{etiqueta}>{texto}</{etiqueta}>')
+        partes.append('</r>')
+        documento = ''.join(partes).encode()
+        esperado = aplicar(documento, sin_ambito)
+        resultado, conteos = aplicar(documento, con_ambito, azar.randint(1, 9))
+        assert resultado == esperado[0], documento
+        assert {clave: conteos[clave] for clave in esperado[1]} == esperado[1]
+
+
+def test_el_documento_se_lee_una_sola_vez():
+    aperturas = []
+    
+    def abrir():
+        aperturas.append(1)
+        return io.BufferedReader(io.BytesIO(DOCUMENTO))
+    
+    reglas = [{'buscar': '10.0.0.1', 'reemplazar_por': '10.0.0.2', 'tipo': 'ip', 'ambito': 'datasource'}]
+    qgz_editor.aplicar_reglas_documento(abrir, io.BytesIO(), reglas, {})
+    assert len(aperturas) == 1
+
+
+def test_xml_invalido_aplica_las_reglas_sin_ambito(capsys):
+    documento = b'<qgis><datasource>10.0.0.1</datasource><roto a=1>10.0.0.1 viejo</qgis>'
+    reglas = [
+        {'buscar': 'viejo', 'reemplazar_por': 'nuevo'},
+        {'buscar': '10.0.0.1', 'reemplazar_por': '10.0.0.2', 'tipo': 'ip', 'ambito': 'datasource'},
+    ]
+    for tamano in (1, 7, 4096):
+        resultado, conteos = aplicar(documento, reglas, tamano)
+        assert resultado == (b'<qgis><datasource>10.0.0.2</datasource><roto a=1>10.0.0.1 nuevo</qgis>')
+        assert conteos == {'viejo': 1, '10.0.0.1': 1}
+    assert 'no es un XML válido' in capsys.readouterr().out
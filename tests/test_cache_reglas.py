@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import qgz_editor
+
+
+REGLAS = [{'buscar': f'servidor-{i}.local', 'reemplazar_por': f'srv{i}'} for i in range(50)]
+REGLAS.append({'buscar': r'port=([0-9]{2,5})', 'reemplazar_por': r'port=1\1', 'tipo': 'regex'})
+DOCUMENTO = b'servidor-7.local port=80 servidor-49.local'
+ESPERADO = b'srv7 port=180 srv49'
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(qgz_editor, 'CARPETA_CACHE_REGLAS', str(tmp_path))
+    monkeypatch.setattr(qgz_editor, 'MINIMO_REGLAS_CACHE_DISCO', 1)
+    qgz_editor._motores_en_memoria.clear()
+    yield tmp_path
+    qgz_editor._motores_en_memoria.clear()
+
+
+def archivo_cache(carpeta):
+    archivos = [nombre for nombre in os.listdir(carpeta) if nombre.endswith(qgz_editor.EXTENSION_CACHE_REGLAS)]
+    assert len(archivos) == 1
+    return os.path.join(carpeta, archivos[0])
+
+
+def reemplazar(motor):
+    return qgz_editor.aplicar_reemplazos_seguro(DOCUMENTO, REGLAS, motor)[0]
+
+
+def test_motor_leido_de_disco_da_el_mismo_resultado(cache):
+    assert reemplazar(qgz_editor.motor_en_cache(REGLAS, 'utf-8')) == ESPERADO
+    ruta = archivo_cache(cache)
+    qgz_editor._motores_en_memoria.clear()
+    assert qgz_editor.leer_patron_cache(ruta, qgz_editor.huella_reglas(REGLAS, 'utf-8'), True) is not None
+    assert reemplazar(qgz_editor.motor_en_cache(REGLAS, 'utf-8')) == ESPERADO
+
+
+def test_patron_modificado_se_descarta(cache):
+    qgz_editor.motor_en_cache(REGLAS, 'utf-8')
+    ruta = archivo_cache(cache)
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    datos['patron'] = datos['patron'].replace('servidor', 'otro')
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+    assert qgz_editor.leer_patron_cache(ruta, qgz_editor.huella_reglas(REGLAS, 'utf-8'), True) is None
+    
+    qgz_editor._motores_en_memoria.clear()
+    assert reemplazar(qgz_editor.motor_en_cache(REGLAS, 'utf-8')) == ESPERADO
+
+
+def test_patron_con_otros_grupos_se_descarta(cache):
+    qgz_editor.motor_en_cache(REGLAS, 'utf-8')
+    ruta = archivo_cache(cache)
+    with open(ruta, encoding='utf-8') as f:
+        datos = json.load(f)
+    assert '(port=([0-9]{2,5}))' in datos['patron']
+    datos['patron'] = datos['patron'].replace('(port=([0-9]{2,5}))', '(port=(?:[0-9]{2,5}))')
+    datos['sha256'] = hashlib.sha256(datos['patron'].encode('utf-8')).hexdigest()
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+    qgz_editor._motores_en_memoria.clear()
+    assert reemplazar(qgz_editor.motor_en_cache(REGLAS, 'utf-8')) == ESPERADO
+
+
+def test_archivo_de_otras_reglas_no_se_usa(cache):
+    qgz_editor.motor_en_cache(REGLAS, 'utf-8')
+    ruta = archivo_cache(cache)
+    otras = REGLAS[:-1]
+    assert qgz_editor.leer_patron_cache(ruta, qgz_editor.huella_reglas(otras, 'utf-8'), True) is None
+    assert qgz_editor.leer_patron_cache(ruta, qgz_editor.huella_reglas(REGLAS, 'utf-8'), False) is None
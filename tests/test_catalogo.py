@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+import qgz_catalogo
+
+
+def crear(carpeta, nombre, contenido=b'x'):
+    (carpeta / nombre).write_bytes(contenido)
+
+
+def test_paginas_con_cursor_no_repiten_ni_saltean(tmp_path):
+    for i in range(5):
+        crear(tmp_path, f'{i}.qgz', b'x' * (10 - i))
+    crear(tmp_path, '.oculto.qgz')
+    crear(tmp_path, 'otro.txt')
+    catalogo = qgz_catalogo.CatalogoCarpeta(tmp_path)
+    
+    pagina = catalogo.pagina(orden='tamano', limite=2)
+    assert [e['nombre'] for e in pagina['items']] == ['4.qgz', '3.qgz']
+    crear(tmp_path, '00.qgz', b'x')
+    catalogo.invalidar()
+    nombres = [e['nombre'] for e in pagina['items']]
+    while pagina['siguiente']:
+        pagina = catalogo.pagina(cursor=pagina['siguiente'], limite=2)
+        nombres += [e['nombre'] for e in pagina['items']]
+    assert nombres == ['4.qgz', '3.qgz', '2.qgz', '1.qgz', '0.qgz']
+
+
+@pytest.mark.parametrize('orden, clave', [
+    ('nombre', [1]),
+    ('nombre', ['a', 'b']),
+    ('tamano', ['grande', 'a.qgz']),
+    ('tamano', [1.5, 'a.qgz']),
+    ('modificado', [True, 'a.qgz']),
+    ('modificado', [1.5]),
+])
+def test_cursor_con_clave_de_otro_tipo_es_invalido(tmp_path, orden, clave):
+    crear(tmp_path, 'a.qgz')
+    catalogo = qgz_catalogo.CatalogoCarpeta(tmp_path)
+    with pytest.raises(ValueError, match='Cursor inválido'):
+        catalogo.pagina(cursor=qgz_catalogo.codificar_cursor(orden, False, clave))
+
+
+def test_borrado_y_vuelto_a_crear_es_modificado(tmp_path):
+    crear(tmp_path, 'a.qgz')
+    crear(tmp_path, 'b.qgz')
+    catalogo = qgz_catalogo.CatalogoCarpeta(tmp_path)
+    version = catalogo.actualizar()
+    
+    (tmp_path / 'a.qgz').unlink()
+    crear(tmp_path, 'c.qgz')
+    catalogo.invalidar()
+    crear(tmp_path, 'a.qgz', b'otro contenido')
+    (tmp_path / 'c.qgz').unlink()
+    catalogo.invalidar()
+    
+    cambios = catalogo.cambios_desde(version)
+    assert cambios == {'version': version + 2, 'agregados': [], 'eliminados': [], 'modificados': ['a.qgz']}
+
+
+def test_la_carpeta_se_lee_sin_tomar_el_bloqueo(tmp_path):
+    crear(tmp_path, 'a.qgz')
+    catalogo = qgz_catalogo.CatalogoCarpeta(tmp_path)
+    leyendo = threading.Event()
+    seguir = threading.Event()
+    leer_carpeta = catalogo._leer_carpeta
+    
+    def leer_lento():
+        leyendo.set()
+        seguir.wait(5)
+        return leer_carpeta()
+    
+    catalogo._leer_carpeta = leer_lento
+    hilo = threading.Thread(target=catalogo.actualizar)
+    hilo.start()
+    try:
+        assert leyendo.wait(5)
+        assert catalogo.condicion.acquire(timeout=1)
+        catalogo.condicion.release()
+    finally:
+        seguir.set()
+        hilo.join()
+    assert catalogo.version == 1
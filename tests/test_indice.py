@@ -0,0 +1,42 @@
+import io
+import zipfile
+
+import qgz_indice
+
+
+def referencias(documento, tamano_bloque):
+    resultado = {}
+    qgz_indice.extraer_referencias_documento(io.BytesIO(documento), resultado, tamano_bloque)
+    return resultado
+
+
+def test_numero_cortado_entre_bloques_no_es_una_ip():
+    documento = b'<qgis>v=1110.0.0.1 y 10.0.0.2</qgis>'
+    esperado = {('ip', '10.0.0.2'): 1}
+    for tamano in range(1, len(documento) + 1):
+        assert referencias(documento, tamano) == esperado, tamano
+
+
+def test_indexar_y_buscar(tmp_path):
+    entrada = tmp_path / 'data_in'
+    entrada.mkdir()
+    fuente = "dbname='gis' host=db.interno port=5432 user='x' hostaddr=10.1.2.3"
+    with zipfile.ZipFile(entrada / 'a.qgz', 'w') as zip_qgz:
+        zip_qgz.writestr('a.qgs', f'<qgis><maplayer><datasource>{fuente}</datasource></maplayer>'
+                                  '<layername>10.1.2.3</layername></qgis>')
+    with zipfile.ZipFile(entrada / 'b.qgz', 'w') as zip_qgz:
+        zip_qgz.writestr('b.qgs', '<qgis><datasource>/datos/rios.shp|layername=rios</datasource></qgis>')
+    ruta_indice = str(tmp_path / 'indice.sqlite')
+    
+    resumen = qgz_indice.actualizar_indice(str(entrada), ruta_indice, trabajos=1)
+    
+    assert resumen['nuevos'] == 2 and resumen['errores'] == 0
+    assert qgz_indice.buscar_en_indice(ruta_indice, '10.1.2.3', 'ip', exacto=True) == [
+        ('a.qgz', 'ip', '10.1.2.3', 2)]
+    assert qgz_indice.buscar_en_indice(ruta_indice, 'DB.INTERNO', 'host') == [('a.qgz', 'host', 'db.interno', 1)]
+    assert qgz_indice.buscar_en_indice(ruta_indice, 'rios.shp', 'ruta') == [
+        ('b.qgz', 'ruta', '/datos/rios.shp', 1)]
+    
+    (entrada / 'b.qgz').unlink()
+    assert qgz_indice.actualizar_indice(str(entrada), ruta_indice, trabajos=1)['eliminados'] == 1
+    assert qgz_indice.buscar_en_indice(ruta_indice, 'rios') == []
@@ -0,0 +1,97 @@
+import os
+import zipfile
+
+import qgz_editor
+
+
+def preparar(tmp_path, nombres=('a.qgz', 'b.qgz')):
+    (tmp_path / 'data_in').mkdir()
+    (tmp_path / 'data_out').mkdir()
+    for nombre in nombres:
+        escribir_qgz(tmp_path / 'data_in' / nombre, b'<qgis>viejo</qgis>')
+    return {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': [
+            {'buscar': 'viejo', 'reemplazar_por': 'nuevo'},
+        ]}},
+        'postfijo': '_MODIFICADO',
+    }
+
+
+def escribir_qgz(ruta, contenido):
+    with zipfile.ZipFile(ruta, 'w') as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', contenido)
+
+
+def lote(tmp_path, config, forzar=False):
+    return qgz_editor.procesar_lote(['a.qgz', 'b.qgz'], str(tmp_path / 'data_in'), str(tmp_path / 'data_out'),
+                                    config, trabajos=1, forzar=forzar)
+
+
+def test_lote_interrumpido_se_retoma_leyendo_el_diario_una_vez(tmp_path, monkeypatch, capsys):
+    config = preparar(tmp_path)
+    entrada, salida = str(tmp_path / 'data_in'), str(tmp_path / 'data_out')
+    # Un lote anterior terminó 'a.qgz' y se cortó antes de guardar el manifiesto
+    assert qgz_editor.procesar_archivo_qgz('a.qgz', entrada, salida, config)
+    hash_config = qgz_editor.calcular_hash_configuracion(config)
+    qgz_editor.registrar_en_diario(salida, *qgz_editor.entrada_manifiesto('a.qgz', entrada, salida,
+                                                                           config, hash_config))
+    lecturas = []
+    leer_diario = qgz_editor.leer_diario
+    monkeypatch.setattr(qgz_editor, 'leer_diario', lambda carpeta: lecturas.append(carpeta) or leer_diario(carpeta))
+    
+    resultado = lote(tmp_path, config)
+    
+    assert resultado == {'exitosos': 1, 'fallidos': 0, 'omitidos': 1}
+    assert 'Se retoma un lote interrumpido (1 archivo(s)' in capsys.readouterr().out
+    assert len(lecturas) == 1
+    assert not (tmp_path / 'data_out' / qgz_editor.NOMBRE_DIARIO).exists()
+    assert set(qgz_editor.cargar_manifiesto(salida)) == {'a_MODIFICADO.qgz', 'b_MODIFICADO.qgz'}
+
+
+def test_error_a_mitad_de_escritura_deja_la_salida_anterior(tmp_path, monkeypatch):
+    config = preparar(tmp_path, ['a.qgz'])
+    anterior = tmp_path / 'data_out' / 'a_MODIFICADO.qgz'
+    anterior.write_bytes(b'salida anterior')
+    
+    def fallar(abrir_origen, destino, reglas, motores):
+        destino.write(b'<qgis>a medio')
+        raise OSError('disco lleno')
+    
+    monkeypatch.setattr(qgz_editor, 'aplicar_reglas_documento', fallar)
+    resultado = qgz_editor.procesar_lote(['a.qgz'], str(tmp_path / 'data_in'), str(tmp_path / 'data_out'),
+                                         config, trabajos=1)
+    
+    assert resultado['fallidos'] == 1
+    assert anterior.read_bytes() == b'salida anterior'
+    assert set(os.listdir(tmp_path / 'data_out')) == {'a_MODIFICADO.qgz', qgz_editor.NOMBRE_MANIFIESTO}
+
+
+def test_segunda_ejecucion_omite_archivos_sin_cambios(tmp_path, capsys):
+    config = preparar(tmp_path)
+    assert lote(tmp_path, config) == {'exitosos': 2, 'fallidos': 0, 'omitidos': 0}
+    capsys.readouterr()
+    
+    assert lote(tmp_path, config) == {'exitosos': 0, 'fallidos': 0, 'omitidos': 2}
+    assert '2 archivo(s) sin cambios desde la última ejecución' in capsys.readouterr().out
+
+
+def test_cambios_en_entrada_salida_o_configuracion_reprocesan(tmp_path):
+    config = preparar(tmp_path)
+    lote(tmp_path, config)
+    
+    escribir_qgz(tmp_path / 'data_in' / 'a.qgz', b'<qgis>viejo y distinto</qgis>')
+    (tmp_path / 'data_out' / 'b_MODIFICADO.qgz').unlink()
+    assert lote(tmp_path, config) == {'exitosos': 2, 'fallidos': 0, 'omitidos': 0}
+    
+    config['modulos']['reemplazo_texto']['reglas'][0]['reemplazar_por'] = 'otro'
+    assert lote(tmp_path, config) == {'exitosos': 2, 'fallidos': 0, 'omitidos': 0}
+    with zipfile.ZipFile(tmp_path / 'data_out' / 'b_MODIFICADO.qgz') as zip_qgz:
+        assert zip_qgz.read('proyecto.qgs') == b'<qgis>otro</qgis>'
+
+
+def test_forzar_reprocesa_todo(tmp_path):
+    config = preparar(tmp_path)
+    lote(tmp_path, config)
+    
+    assert lote(tmp_path, config, forzar=True) == {'exitosos': 2, 'fallidos': 0, 'omitidos': 0}
+    assert lote(tmp_path, config) == {'exitosos': 0, 'fallidos': 0, 'omitidos': 2}
@@ -0,0 +1,187 @@
+import random
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import qgz_editor
+
+
+PROYECTO = (b'<qgis><maplayer><datasource>host=192.168.0.1 dbname=gis</datasource>'
+            b'</maplayer></qgis>')
+AUXILIAR = b'\x00datos auxiliares\xff' * 500
+
+REGLA_IP = {'buscar': '192.168.0.1', 'reemplazar_por': '192.168.0.2', 'tipo': 'ip'}
+
+
+def crear_qgz(ruta, proyecto=PROYECTO):
+    with zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', proyecto)
+        zip_qgz.writestr('proyecto.qgd', AUXILIAR)
+        zip_qgz.writestr('simbolo.svg', b'<svg/>', compress_type=zipfile.ZIP_STORED)
+
+
+def procesar(tmp_path, reglas, proyecto=PROYECTO, compresion=None):
+    entrada, salida = tmp_path / 'entrada', tmp_path / 'salida'
+    entrada.mkdir()
+    salida.mkdir()
+    crear_qgz(entrada / 'proyecto.qgz', proyecto)
+    config = {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': reglas}},
+        'postfijo': '_MODIFICADO',
+    }
+    if compresion:
+        config['compresion'] = compresion
+    metricas = {}
+    assert qgz_editor.procesar_archivo_qgz('proyecto.qgz', str(entrada), str(salida), config, metricas)
+    return entrada / 'proyecto.qgz', salida / 'proyecto_MODIFICADO.qgz', metricas
+
+
+def test_qgs_sin_coincidencias_se_copia_sin_comprimir(tmp_path):
+    regla = {'buscar': '10.9.9.9', 'reemplazar_por': '10.9.9.8', 'tipo': 'ip'}
+    entrada, salida, metricas = procesar(tmp_path, [regla])
+    assert metricas['etapas']['compresion'] == 0.0
+    with zipfile.ZipFile(entrada) as zip_entrada, zipfile.ZipFile(salida) as zip_salida:
+        assert zip_salida.testzip() is None
+        assert [m.filename for m in zip_salida.infolist()] == [m.filename for m in zip_entrada.infolist()]
+        original, copia = zip_entrada.getinfo('proyecto.qgs'), zip_salida.getinfo('proyecto.qgs')
+        assert (copia.CRC, copia.compress_size) == (original.CRC, original.compress_size)
+
+
+def test_procesar_qgz_reemplaza_qgs_y_copia_el_resto(tmp_path):
+    _, salida, metricas = procesar(tmp_path, [REGLA_IP])
+    assert metricas['conteos'] == {'192.168.0.1': 1}
+    with zipfile.ZipFile(salida) as zip_salida:
+        assert zip_salida.testzip() is None
+        assert zip_salida.namelist() == ['proyecto.qgs', 'proyecto.qgd', 'simbolo.svg']
+        assert zip_salida.read('proyecto.qgs') == PROYECTO.replace(b'192.168.0.1', b'192.168.0.2')
+        assert zip_salida.read('proyecto.qgd') == AUXILIAR
+        assert zip_salida.read('simbolo.svg') == b'<svg/>'
+
+
+class SoloEscritura:
+    """Destino sin seek ni tell, como un pipe o un socket"""
+    
+    def __init__(self):
+        self.partes = []
+    
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+
+def copiar_todo(entrada, destino):
+    with zipfile.ZipFile(entrada) as zip_entrada, open(entrada, 'rb') as origen, \
+            qgz_editor.EscritorZip(destino) as zip_salida:
+        for miembro in zip_entrada.infolist():
+            qgz_editor.copiar_miembro_sin_recomprimir(origen, miembro, zip_salida)
+
+
+def test_miembro_copiado_sin_recomprimir_pasa_testzip(tmp_path):
+    entrada = tmp_path / 'entrada.qgz'
+    with zipfile.ZipFile(entrada, 'w', zipfile.ZIP_DEFLATED) as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', PROYECTO)
+        zip_qgz.writestr('proyecto.qgd', AUXILIAR, compress_type=zipfile.ZIP_BZIP2)
+        zip_qgz.writestr('símbolos/ñandú.svg', b'<svg/>', compress_type=zipfile.ZIP_STORED)
+        zip_qgz.writestr('capas/ortofoto.tif', AUXILIAR, compress_type=zipfile.ZIP_LZMA)
+    destino = SoloEscritura()
+    copiar_todo(entrada, destino)
+    salida = tmp_path / 'salida.qgz'
+    salida.write_bytes(b''.join(destino.partes))
+    with zipfile.ZipFile(entrada) as zip_entrada, zipfile.ZipFile(salida) as zip_salida:
+        assert zip_salida.testzip() is None
+        for miembro in zip_entrada.infolist():
+            copia = zip_salida.getinfo(miembro.filename)
+            assert (copia.compress_type, copia.CRC, copia.compress_size) == \
+                (miembro.compress_type, miembro.CRC, miembro.compress_size)
+            assert copia.date_time == miembro.date_time
+            assert zip_salida.read(miembro.filename) == zip_entrada.read(miembro.filename)
+
+
+def test_copia_sin_recomprimir_de_miembros_zip64(tmp_path):
+    entrada, salida = tmp_path / 'entrada.qgz', tmp_path / 'salida.qgz'
+    with zipfile.ZipFile(entrada, 'w', zipfile.ZIP_DEFLATED) as zip_qgz:
+        with zip_qgz.open('proyecto.qgs', 'w', force_zip64=True) as destino:
+            destino.write(PROYECTO)
+        zip_qgz.writestr('proyecto.qgd', AUXILIAR)
+    with open(salida, 'wb') as destino:
+        copiar_todo(entrada, destino)
+    with zipfile.ZipFile(salida) as zip_salida:
+        assert zip_salida.testzip() is None
+        assert zip_salida.read('proyecto.qgs') == PROYECTO
+
+
+def test_cientos_de_miembros_y_politica_original(tmp_path):
+    entrada, salida = tmp_path / 'entrada', tmp_path / 'salida'
+    entrada.mkdir()
+    salida.mkdir()
+    with zipfile.ZipFile(entrada / 'proyecto.qgz', 'w', zipfile.ZIP_LZMA) as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', PROYECTO)
+        for numero in range(300):
+            zip_qgz.writestr(f'adjuntos/{numero}.txt', str(numero) * numero, compress_type=zipfile.ZIP_STORED)
+    config = {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': [REGLA_IP]}},
+        'postfijo': '_MODIFICADO',
+        'compresion': {'politica': 'original'},
+    }
+    assert qgz_editor.procesar_archivo_qgz('proyecto.qgz', str(entrada), str(salida), config)
+    with zipfile.ZipFile(salida / 'proyecto_MODIFICADO.qgz') as zip_salida:
+        assert zip_salida.testzip() is None
+        assert len(zip_salida.namelist()) == 301
+        assert zip_salida.getinfo('proyecto.qgs').compress_type == zipfile.ZIP_LZMA
+        assert zip_salida.read('proyecto.qgs') == PROYECTO.replace(b'192.168.0.1', b'192.168.0.2')
+        assert zip_salida.read('adjuntos/299.txt') == b'299' * 299
+
+
+def proyecto_grande(tamano):
+    azar = random.Random(16)
+    capas = []
+    largo = 0
+    while largo < tamano:
+        capas.append(f'<maplayer id="{azar.random()}"><datasource>host=192.168.0.1 '
+                     f'port={azar.randint(1, 65535)}</datasource></maplayer>'.encode())
+        largo += len(capas[-1])
+    return b'<qgis>' + b''.join(capas) + b'</qgis>'
+
+
+def test_deflate_paralelo_ida_y_vuelta():
+    datos = proyecto_grande(5 * qgz_editor.TAMANO_BLOQUE_DEFLATE)
+    with ThreadPoolExecutor(max_workers=4) as ejecutor:
+        compresor = qgz_editor.CompresorDeflateParalelo(6, ejecutor, 8)
+        comprimidos = b''.join(compresor.compress(datos[inicio:inicio + 300000])
+                               for inicio in range(0, len(datos), 300000))
+        comprimidos += compresor.flush()
+    assert zlib.decompress(comprimidos, -zlib.MAX_WBITS) == datos
+
+
+def test_qgs_grande_comprimido_en_paralelo_pasa_testzip(tmp_path, monkeypatch):
+    creados = []
+    
+    class CompresorEspia(qgz_editor.CompresorDeflateParalelo):
+        def __init__(self, *argumentos):
+            super().__init__(*argumentos)
+            creados.append(self)
+    
+    monkeypatch.setattr(qgz_editor, 'CompresorDeflateParalelo', CompresorEspia)
+    proyecto = proyecto_grande(3 * qgz_editor.TAMANO_BLOQUE_DEFLATE)
+    _, salida, _ = procesar(tmp_path, [REGLA_IP], proyecto,
+                            compresion={'politica': 'rapida', 'hilos': 4, 'umbral_paralelo_mb': 1})
+    assert len(creados) == 1
+    with zipfile.ZipFile(salida) as zip_salida:
+        assert zip_salida.testzip() is None
+        info = zip_salida.getinfo('proyecto.qgs')
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert info.compress_size < info.file_size
+        assert zip_salida.read('proyecto.qgs') == proyecto.replace(b'192.168.0.1', b'192.168.0.2')
+
+
+def test_qgs_latin1_se_conserva_byte_a_byte(tmp_path):
+    proyecto = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n<qgis><title>Señalización · año</title>'
+                '<datasource>host=192.168.0.1 user=peñón</datasource></qgis>').encode('latin-1')
+    reglas = [REGLA_IP, {'buscar': 'peñón', 'reemplazar_por': 'ñandú €'}]
+    _, salida, _ = procesar(tmp_path, reglas, proyecto)
+    with zipfile.ZipFile(salida) as zip_salida:
+        resultado = zip_salida.read('proyecto.qgs')
+    # Lo que no coincide queda igual; el reemplazo se codifica en latin-1 y lo
+    # que no entra en latin-1 va como referencia de carácter
+    assert resultado == proyecto.replace(b'192.168.0.1', b'192.168.0.2').replace(
+        'peñón'.encode('latin-1'), 'ñandú &#8364;'.encode('latin-1'))
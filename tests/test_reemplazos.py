@@ -0,0 +1,89 @@
+import io
+import random
+
+import pytest
+
+import qgz_editor
+
+
+REGLAS_IP_Y_TEXTO = [
+    {'buscar': '10.0.0.0/8', 'reemplazar_por': '172.0.0.0/8', 'tipo': 'ip'},
+    {'buscar': '192.168.0.1', 'reemplazar_por': '192.168.0.2', 'tipo': 'ip'},
+    {'buscar': '168.0.1', 'reemplazar_por': 'XXX'},
+    {'buscar': '0.1', 'reemplazar_por': 'Y'},
+    {'buscar': 'host=', 'reemplazar_por': 'h='},
+]
+
+
+def en_bloques(datos, reglas, motor, tamano_bloque):
+    salida = io.BytesIO()
+    conteos = qgz_editor.aplicar_reemplazos_en_bloques(io.BytesIO(datos), salida, reglas, motor,
+                                                       tamano_bloque=tamano_bloque)
+    return salida.getvalue(), conteos
+
+
+def test_ip_sin_regla_no_se_parte_entre_bloques():
+    motor = qgz_editor.compilar_reglas(REGLAS_IP_Y_TEXTO, 'utf-8')
+    datos = b'host=192.168.0.10 y 8.168.0.1 y 192.168.0.1'
+    completo = qgz_editor.aplicar_reemplazos_seguro(datos, REGLAS_IP_Y_TEXTO, motor)
+    # Las IP sin regla quedan como texto: solo cambian los textos que contienen
+    assert completo[0] == b'h=192.XXX0 y 8.XXX y 192.168.0.2'
+    for tamano in range(1, len(datos) + 2):
+        assert en_bloques(datos, REGLAS_IP_Y_TEXTO, motor, tamano) == completo
+
+
+def test_regla_ip_sin_relacion_no_cambia_las_reglas_de_texto():
+    texto = [{'buscar': '0.0.1', 'reemplazar_por': 'X'}]
+    ip = [{'buscar': '192.168.0.0/16', 'reemplazar_por': '172.16.0.0/16', 'tipo': 'ip'}]
+    assert qgz_editor.aplicar_reemplazos_seguro('host 10.0.0.1', texto) == ('host 10.X', {'0.0.1': 1})
+    resultado, conteos = qgz_editor.aplicar_reemplazos_seguro('host 10.0.0.1 192.168.0.1', texto + ip)
+    assert resultado == 'host 10.X 172.16.0.1'
+    assert conteos == {'0.0.1': 1, '192.168.0.0/16': 1}
+
+
+def test_ip_sin_red_igual_que_sin_reglas_ip():
+    texto = [{'buscar': '0.1', 'reemplazar_por': 'Y'}, {'buscar': '168.0', 'reemplazar_por': 'Z'},
+             {'buscar': r'\b1\.([0-9]{1,3})', 'reemplazar_por': r'uno.\1', 'tipo': 'regex'}]
+    ip = [{'buscar': '172.16.0.0/12', 'reemplazar_por': '10.16.0.0/12', 'tipo': 'ip'}]
+    motor_texto = qgz_editor.compilar_reglas(texto, 'utf-8')
+    motor_mixto = qgz_editor.compilar_reglas(texto + ip, 'utf-8')
+    alfabeto = ['10.', '192.', '168.', '0.', '1', '0', '.', ' ', 'x', '1.']
+    azar = random.Random(230)
+    for _ in range(3000):
+        datos = ''.join(azar.choice(alfabeto) for _ in range(azar.randint(0, 30))).encode()
+        solo_texto, conteos_texto = qgz_editor.aplicar_reemplazos_seguro(datos, texto, motor_texto)
+        mixto, conteos_mixto = qgz_editor.aplicar_reemplazos_seguro(datos, texto + ip, motor_mixto)
+        assert mixto == solo_texto, datos
+        assert conteos_mixto == dict(conteos_texto, **{'172.16.0.0/12': 0}), datos
+        assert en_bloques(datos, texto + ip, motor_mixto, azar.randint(1, 9)) == (mixto, conteos_mixto), datos
+
+
+def test_bloques_igual_que_documento_completo_con_ip_y_texto():
+    motor = qgz_editor.compilar_reglas(REGLAS_IP_Y_TEXTO, 'utf-8')
+    alfabeto = ['10.', '192.', '168.', '0.', '1', '0', '9', '.', ' ', 'host=', 'x', '/']
+    azar = random.Random(23)
+    for _ in range(3000):
+        datos = ''.join(azar.choice(alfabeto) for _ in range(azar.randint(0, 40))).encode()
+        completo = qgz_editor.aplicar_reemplazos_seguro(datos, REGLAS_IP_Y_TEXTO, motor)
+        assert en_bloques(datos, REGLAS_IP_Y_TEXTO, motor, azar.randint(1, 9)) == completo, datos
+
+
+REGLAS_MIXTAS = [
+    {'buscar': r'host=([a-z]{1,8}):(\d{2,5})\b', 'reemplazar_por': r'h=\2/\1', 'tipo': 'regex'},
+    {'buscar': r'(?:ab){1,3}c', 'reemplazar_por': 'Z', 'tipo': 'regex'},
+    {'buscar': '10.0.0.0/8', 'reemplazar_por': '172.16.0.0/8', 'tipo': 'ip'},
+    {'buscar': '192.168.1.1', 'reemplazar_por': '192.168.1.2', 'tipo': 'ip'},
+    {'buscar': 'abab', 'reemplazar_por': 'Q'},
+    {'buscar': 'host', 'reemplazar_por': 'H'},
+]
+
+
+def test_bloques_igual_que_documento_completo_con_literal_regex_e_ip():
+    motor = qgz_editor.compilar_reglas(REGLAS_MIXTAS, 'utf-8')
+    alfabeto = ['host=', 'ab', 'c', 'db', ':', '80', '5', ' ', '10.', '192.168.', '1.', '0.', '1', '.']
+    azar = random.Random(22)
+    for _ in range(2000):
+        datos = ''.join(azar.choice(alfabeto) for _ in range(azar.randint(0, 30))).encode()
+        completo = qgz_editor.aplicar_reemplazos_seguro(datos, REGLAS_MIXTAS, motor)
+        tamano = azar.randint(1, len(datos) + 1)
+        assert en_bloques(datos, REGLAS_MIXTAS, motor, tamano) == completo, (datos, tamano)
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import qgz_editor
+
+
+@pytest.mark.parametrize('patron, grupos', [
+    (r'host=([a-z]{1,20}):(\d{2,5})\b', 2),
+    (r'x(a{1,5}){1,5}', 1),
+    (r'(?i:ab)', 0),
+    (r'[ab]{0,30}c', 0),
+    (r'(?:10|20)\.0\.0\.\d{1,3}', 0),
+    (r'\x41[^\]]{1,3}', 0),
+])
+def test_regex_admitidas(patron, grupos):
+    assert qgz_editor.analizar_regex(patron)[0] == grupos
+
+
+@pytest.mark.parametrize('patron, motivo', [
+    ('xa*', 'superar'),
+    ('x+', 'superar'),
+    ('y[a-z]{0,2000}', 'superar'),
+    ('x(a|aa)*', 'superar'),
+    ('x(a|aa){0,30}', 'formas de coincidir'),
+    ('x(a{1,10}){1,10}b(c{1,10}){1,10}', 'formas de coincidir'),
+    ('a?', 'vacío'),
+    ('^x', 'anclas'),
+    (r'x\Z', 'anclas'),
+    ('(?=a)b', 'lookahead'),
+    (r'(a)\1', 'referencias'),
+    ('(?P<n>a)', 'nombre'),
+    ('(?i)ab', 'globales'),
+    ('(?x:a b)', 'no admitida'),
+    ('ñ', 'ASCII'),
+    ('(a', 'inválida'),
+])
+def test_regex_rechazadas(patron, motivo):
+    with pytest.raises(ValueError, match=motivo):
+        qgz_editor.analizar_regex(patron)
+
+
+def test_regex_admitida_es_lineal_en_el_documento():
+    reglas = [{'buscar': r'x(a{1,5}){1,5}b', 'reemplazar_por': 'y', 'tipo': 'regex'}]
+    motor = qgz_editor.compilar_reglas(reglas, 'utf-8')
+    tiempos = []
+    for repeticiones in (2000, 8000):
+        datos = b'xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa' * repeticiones
+        inicio = time.perf_counter()
+        qgz_editor.aplicar_reemplazos_seguro(datos, reglas, motor)
+        tiempos.append(time.perf_counter() - inicio)
+    # Cuatro veces más texto: muy por debajo de las dieciséis veces de un costo cuadrático
+    assert tiempos[1] < tiempos[0] * 10 + 0.05
@@ -0,0 +1,47 @@
+import zipfile
+
+import qgz_editor
+
+
+def preparar(tmp_path):
+    (tmp_path / 'data_in').mkdir()
+    (tmp_path / 'data_out').mkdir()
+    with zipfile.ZipFile(tmp_path / 'data_in' / 'a.qgz', 'w') as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', b'<qgis>viejo viejo antiguo</qgis>')
+        zip_qgz.writestr('otro.qgs', b'<qgis>viejo</qgis>')
+    with zipfile.ZipFile(tmp_path / 'data_in' / 'b.qgz', 'w') as zip_qgz:
+        zip_qgz.writestr('proyecto.qgs', b'<qgis>nada</qgis>')
+    (tmp_path / 'data_out' / 'a_MODIFICADO.qgz').write_bytes(b'salida anterior')
+    return {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': [
+            {'buscar': 'viejo', 'reemplazar_por': 'nuevo'},
+            {'buscar': 'antiguo', 'reemplazar_por': 'moderno'},
+        ]}},
+        'postfijo': '_MODIFICADO',
+        'carpeta_entrada': 'data_in',
+        'carpeta_salida': 'data_out',
+    }
+
+
+def contenido(carpeta):
+    return {ruta.name: ruta.read_bytes() for ruta in carpeta.iterdir()}
+
+
+def test_simulacion_cuenta_sin_tocar_la_salida(tmp_path, capsys):
+    config = preparar(tmp_path)
+    antes = contenido(tmp_path / 'data_out')
+    
+    assert qgz_editor.ejecutar_configuracion(config, str(tmp_path), trabajos=1, simular=True) == 0
+    
+    assert contenido(tmp_path / 'data_out') == antes
+    salida = capsys.readouterr().out
+    assert 'SIMULACIÓN FINALIZADA' in salida
+    filas = {linea.split()[0]: linea.split()[1:] for linea in salida.splitlines()
+             if linea.strip().startswith(('a.qgz', 'b.qgz', 'Total'))}
+    assert filas == {'a.qgz': ['3', '1', '4'], 'b.qgz': ['0', '0', '0'], 'Total': ['3', '1', '4']}
+
+
+def test_conteos_suman_todos_los_qgs_del_proyecto(tmp_path):
+    config = preparar(tmp_path)
+    assert qgz_editor.contar_coincidencias_qgz('a.qgz', str(tmp_path / 'data_in'), config) == (
+        'a.qgz', {'viejo': 3, 'antiguo': 1}, None)
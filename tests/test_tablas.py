@@ -0,0 +1,66 @@
+import gzip
+
+import qgz_editor
+
+
+def configuracion(tablas, reglas=()):
+    return {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': list(reglas), 'tablas': tablas}},
+        'postfijo': '_MODIFICADO',
+        'carpeta_entrada': 'data_in',
+        'carpeta_salida': 'data_out',
+    }
+
+
+def test_carga_csv_y_tsv_comprimida(tmp_path):
+    # BOM de Excel, cabecera, comentarios, filas vacías y comillas
+    (tmp_path / 'textos.csv').write_text(
+        '﻿buscar,reemplazar_por\n# comentario\n\nviejo,nuevo\n"a, b","c, d"\n', encoding='utf-8')
+    with gzip.open(tmp_path / 'redes.tsv.gz', 'wt', encoding='utf-8') as archivo:
+        archivo.write('10.0.0.0/24\t10.9.0.0/24\n192.168.1.5\t192.168.2.5\n')
+    config = configuracion(['textos.csv', {'archivo': 'redes.tsv.gz', 'tipo': 'ip', 'ambito': 'datasource'}],
+                           [{'buscar': 'otro', 'reemplazar_por': 'distinto'}])
+    original = config['modulos']['reemplazo_texto']
+    
+    validada = qgz_editor.validar_configuracion(config, str(tmp_path))
+    
+    modulo = validada['modulos']['reemplazo_texto']
+    assert modulo['reglas'] == [
+        {'buscar': 'otro', 'reemplazar_por': 'distinto'},
+        {'buscar': 'viejo', 'reemplazar_por': 'nuevo', 'tipo': 'texto'},
+        {'buscar': 'a, b', 'reemplazar_por': 'c, d', 'tipo': 'texto'},
+        {'buscar': '10.0.0.0/24', 'reemplazar_por': '10.9.0.0/24', 'tipo': 'ip', 'ambito': 'datasource'},
+        {'buscar': '192.168.1.5', 'reemplazar_por': '192.168.2.5', 'tipo': 'ip', 'ambito': 'datasource'},
+    ]
+    assert modulo['tablas_cargadas'] == [{'archivo': 'textos.csv', 'reglas': 2},
+                                         {'archivo': 'redes.tsv.gz', 'reglas': 2}]
+    assert 'tablas' not in modulo
+    assert len(original['reglas']) == 1 and 'tablas' in original
+
+
+def test_errores_de_las_tablas_se_informan_con_archivo_y_linea(tmp_path, capsys):
+    (tmp_path / 'reglas.csv').write_text(
+        'viejo,nuevo\nsolo_una_columna\ntres,columnas,de_mas\nviejo,otro\nviejo,nuevo\n', encoding='utf-8')
+    (tmp_path / 'redes.tsv').write_text('10.0.0.0/24\t10.1.0.0/16\n300.1.1.1\t10.0.0.1\n', encoding='utf-8')
+    config = configuracion(['reglas.csv', {'archivo': 'redes.tsv', 'tipo': 'ip'}, 'reglas.txt', 'falta.csv'])
+    
+    assert qgz_editor.validar_configuracion(config, str(tmp_path)) is None
+    
+    salida = capsys.readouterr().out
+    assert 'Las tablas de reglas tienen 7 error(es)' in salida
+    assert 'reglas.csv:2: se esperaban 2 columnas y hay 1' in salida
+    assert 'reglas.csv:3: se esperaban 2 columnas y hay 3' in salida
+    assert "reglas.csv:4: 'viejo' ya tiene otro reemplazo en reglas.csv:1" in salida
+    assert "redes.tsv:1: cambia el tamaño de la red: '10.0.0.0/24' → '10.1.0.0/16'" in salida
+    assert 'redes.tsv:2:' in salida
+    assert 'No se reconoce la extensión' in salida
+    assert 'falta.csv:' in salida
+    # La fila repetida con el mismo reemplazo no es un error
+    assert 'reglas.csv:5' not in salida
+
+
+def test_tabla_con_tipo_desconocido_se_rechaza(tmp_path, capsys):
+    (tmp_path / 'reglas.csv').write_text('viejo,nuevo\n', encoding='utf-8')
+    config = configuracion([{'archivo': 'reglas.csv', 'tipo': 'binario'}])
+    assert qgz_editor.validar_configuracion(config, str(tmp_path)) is None
+    assert "La sección 'tablas' de 'reemplazo_texto' no es válida" in capsys.readouterr().out
@@ -0,0 +1,78 @@
+import sys
+import threading
+import zipfile
+
+import qgz_editor
+
+
+def preparar(tmp_path, archivos):
+    (tmp_path / 'data_in').mkdir()
+    for nombre, contenido in archivos.items():
+        if contenido is None:
+            (tmp_path / 'data_in' / nombre).write_bytes(b'esto no es un zip')
+            continue
+        with zipfile.ZipFile(tmp_path / 'data_in' / nombre, 'w') as zip_qgz:
+            zip_qgz.writestr('proyecto.qgs', contenido)
+    return {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': [
+            {'buscar': 'viejo', 'reemplazar_por': 'nuevo'},
+        ]}},
+        'postfijo': '_MODIFICADO',
+        'carpeta_entrada': 'data_in',
+        'carpeta_salida': 'data_out',
+    }
+
+
+def test_trabajo_sin_errores_devuelve_cero(tmp_path):
+    config = preparar(tmp_path, {'a.qgz': b'<qgis>viejo</qgis>'})
+    lineas = []
+    assert qgz_editor.ejecutar_trabajo(config, str(tmp_path), lineas.append, trabajos=1) == 0
+    assert any('Todos los archivos se procesaron correctamente' in linea for linea in lineas)
+
+
+def test_trabajo_con_archivos_fallidos_no_devuelve_cero(tmp_path):
+    config = preparar(tmp_path, {'a.qgz': b'<qgis>viejo</qgis>', 'roto.qgz': None})
+    lineas = []
+    assert qgz_editor.ejecutar_trabajo(config, str(tmp_path), lineas.append, trabajos=1) != 0
+    assert (tmp_path / 'data_out' / 'a_MODIFICADO.qgz').is_file()
+
+
+def test_trabajo_sin_incremental_no_deja_manifiesto_ni_omite(tmp_path):
+    config = preparar(tmp_path, {'a.qgz': b'<qgis>viejo</qgis>'})
+    for _ in range(2):
+        lineas = []
+        assert qgz_editor.ejecutar_trabajo(config, str(tmp_path), lineas.append, trabajos=1,
+                                           incremental=False) == 0
+        assert not any('sin cambios desde' in linea.lower() for linea in lineas)
+    assert not (tmp_path / 'data_out' / qgz_editor.NOMBRE_MANIFIESTO).exists()
+    assert not (tmp_path / 'data_out' / qgz_editor.NOMBRE_DIARIO).exists()
+
+
+def test_tablas_del_trabajo_se_buscan_en_su_carpeta(tmp_path):
+    config = preparar(tmp_path, {'a.qgz': b'<qgis>viejo</qgis>'})
+    (tmp_path / 'reglas.csv').write_text('buscar,reemplazar_por\nviejo,de_tabla\n', encoding='utf-8')
+    config['modulos']['reemplazo_texto'] = {'activo': True, 'tablas': ['reglas.csv']}
+    lineas = []
+    assert qgz_editor.ejecutar_trabajo(config, str(tmp_path), lineas.append, trabajos=1) == 0
+    with zipfile.ZipFile(tmp_path / 'data_out' / 'a_MODIFICADO.qgz') as zip_qgz:
+        assert zip_qgz.read('proyecto.qgs') == b'<qgis>de_tabla</qgis>'
+
+
+def test_capturas_por_hilo_y_stdout_restaurado():
+    original = sys.stdout
+    barrera = threading.Barrier(2)
+    lineas = {0: [], 1: []}
+    
+    def trabajo(numero):
+        with qgz_editor.capturar_salida(lineas[numero].append):
+            barrera.wait(5)
+            print(f'hilo {numero}')
+            barrera.wait(5)
+    
+    hilos = [threading.Thread(target=trabajo, args=(numero,)) for numero in lineas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert lineas == {0: ['hilo 0'], 1: ['hilo 1']}
+    assert sys.stdout is original
@@ -0,0 +1,67 @@
+import os
+import time
+import zipfile
+
+import qgz_editor
+
+
+def preparar(tmp_path):
+    (tmp_path / 'data_in').mkdir()
+    for nombre in ('a.qgz', '.a_medio_copiar.qgz'):
+        with zipfile.ZipFile(tmp_path / 'data_in' / nombre, 'w') as zip_qgz:
+            zip_qgz.writestr('proyecto.qgs', b'<qgis>viejo</qgis>')
+    return {
+        'modulos': {'reemplazo_texto': {'activo': True, 'reglas': [
+            {'buscar': 'viejo', 'reemplazar_por': 'nuevo'},
+        ]}},
+        'postfijo': '_MODIFICADO',
+        'carpeta_entrada': 'data_in',
+        'carpeta_salida': 'data_out',
+    }
+
+
+def vigilar_hasta(tmp_path, monkeypatch, config, condicion):
+    """Ejecutar vigilar_carpeta hasta que se cumpla la condición (como si se apretara Ctrl+C)"""
+    dormir = time.sleep
+    limite = time.monotonic() + 30
+    
+    def revisar(segundos):
+        if condicion() or time.monotonic() > limite:
+            raise KeyboardInterrupt
+        dormir(segundos)
+    
+    monkeypatch.setattr(qgz_editor.time, 'sleep', revisar)
+    return qgz_editor.vigilar_carpeta(config, str(tmp_path), trabajos=1, intervalo=0.01, espera=0)
+
+
+def salida(tmp_path, nombre):
+    return tmp_path / 'data_out' / nombre
+
+
+def test_procesa_los_archivos_nuevos_y_no_los_ocultos(tmp_path, monkeypatch):
+    config = preparar(tmp_path)
+    assert vigilar_hasta(tmp_path, monkeypatch, config,
+                         lambda: salida(tmp_path, 'a_MODIFICADO.qgz').exists()) == 0
+    with zipfile.ZipFile(salida(tmp_path, 'a_MODIFICADO.qgz')) as zip_qgz:
+        assert zip_qgz.read('proyecto.qgs') == b'<qgis>nuevo</qgis>'
+    assert not salida(tmp_path, '.a_medio_copiar_MODIFICADO.qgz').exists()
+    assert (tmp_path / 'data_out' / qgz_editor.NOMBRE_MANIFIESTO).exists()
+    assert qgz_editor.firmas_carpeta(str(tmp_path / 'data_in')).keys() == {'a.qgz'}
+
+
+def caer_la_primera_vez(indice, total, archivo_qgz, carpeta_entrada, carpeta_salida):
+    marca = os.path.join(carpeta_salida, 'ya_se_cayo')
+    if not os.path.exists(marca):
+        open(marca, 'w').close()
+        os._exit(1)
+    return qgz_editor.procesar_archivo_con_log(indice, total, archivo_qgz, carpeta_entrada,
+                                               carpeta_salida, qgz_editor._config_vigilancia,
+                                               motores=qgz_editor._motores_vigilancia)
+
+
+def test_archivo_en_curso_se_reintenta_si_se_cae_el_proceso(tmp_path, monkeypatch, capsys):
+    config = preparar(tmp_path)
+    monkeypatch.setattr(qgz_editor, 'procesar_archivo_vigilado', caer_la_primera_vez)
+    vigilar_hasta(tmp_path, monkeypatch, config, lambda: salida(tmp_path, 'a_MODIFICADO.qgz').exists())
+    assert salida(tmp_path, 'ya_se_cayo').exists()
+    assert 'se reintenta' in capsys.readouterr().out
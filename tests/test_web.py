@@ -0,0 +1,97 @@
+import hashlib
+import io
+
+import pytest
+
+pytest.importorskip('flask')
+
+import web_server
+
+
+def test_trabajo_web_rechaza_tablas():
+    config = {'modulos': {'reemplazo_texto': {'activo': True, 'tablas': ['/etc/passwd']}}}
+    with pytest.raises(ValueError, match='tablas'):
+        web_server.crear_trabajo(config, [])
+
+
+def test_solo_se_publican_los_archivos_exitosos(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, 'DATA_OUT', tmp_path / 'publicado')
+    monkeypatch.setattr(web_server, 'TRABAJOS_DIR', tmp_path / 'trabajos')
+    trabajo = web_server.TrabajoWeb({'postfijo': '_MODIFICADO'}, ['a.qgz', 'roto.qgz'])
+    (trabajo.carpeta / 'data_out').mkdir(parents=True)
+    for nombre in ('a_MODIFICADO.qgz', 'roto_MODIFICADO.qgz'):
+        (trabajo.carpeta / 'data_out' / nombre).write_bytes(b'salida')
+    trabajo.agregar_evento({'evento': 'archivo_fin', 'archivo': 'a.qgz', 'exito': True, 'tiempo': 1.0})
+    trabajo.agregar_evento({'evento': 'archivo_fin', 'archivo': 'roto.qgz', 'exito': False, 'tiempo': 2.0})
+    
+    web_server.publicar_resultados(trabajo)
+    
+    assert sorted(p.name for p in (tmp_path / 'publicado').iterdir()) == ['a_MODIFICADO.qgz']
+
+
+def test_un_solo_trabajo_con_perfil_de_memoria_a_la_vez(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, 'TRABAJOS_DIR', tmp_path / 'trabajos')
+    monkeypatch.setattr(web_server, 'CATALOGO_ENTRADA', web_server.qgz_catalogo.CatalogoCarpeta(tmp_path))
+    memoria = frozenset({'tiempos', 'memoria'})
+    en_curso = web_server.TrabajoWeb({}, [], memoria)
+    monkeypatch.setattr(web_server, 'TRABAJOS', {en_curso.id: en_curso})
+    
+    with pytest.raises(ValueError, match='perfil de memoria'):
+        web_server.crear_trabajo({}, [], memoria)
+    assert list(web_server.TRABAJOS) == [en_curso.id]
+    assert not any((tmp_path / 'trabajos').iterdir())
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_server, 'DATA_IN', tmp_path)
+    monkeypatch.setattr(web_server, 'SUBIDAS_DIR', tmp_path / '.subidas')
+    monkeypatch.setattr(web_server, 'CATALOGO_ENTRADA', web_server.qgz_catalogo.CatalogoCarpeta(tmp_path))
+    monkeypatch.setattr(web_server, 'SUBIDAS', {})
+    return web_server.app.test_client()
+
+
+class Cortado(io.BytesIO):
+    """Cuerpo de un pedido que se corta después de entregar 'corte' bytes"""
+    
+    def __init__(self, datos, corte):
+        super().__init__(datos)
+        self.corte = corte
+    
+    def read(self, cantidad=-1):
+        if self.tell() >= self.corte:
+            raise ConnectionResetError('conexión cortada')
+        restante = self.corte - self.tell()
+        return super().read(restante if cantidad < 0 else min(cantidad, restante))
+    
+    def readinto(self, destino):
+        datos = self.read(len(destino))
+        destino[:len(datos)] = datos
+        return len(datos)
+
+
+def test_content_range_con_otro_total_se_rechaza(cliente):
+    subida = cliente.post('/api/uploads', json={'nombre': 'a.qgz', 'tamano': 10}).get_json()
+    respuesta = cliente.put(f"/api/uploads/{subida['id']}", data=b'0123',
+                            headers={'Content-Range': 'bytes 0-3/4'})
+    assert respuesta.status_code == 400
+    assert cliente.get(f"/api/uploads/{subida['id']}").get_json()['offset'] == 0
+
+
+def test_subida_se_retoma_tras_una_parte_cortada(cliente, tmp_path):
+    contenido = b'0123456789'
+    subida = cliente.post('/api/uploads', json={'nombre': 'a.qgz', 'tamano': len(contenido),
+                                                'sha256': hashlib.sha256(contenido).hexdigest()}).get_json()
+    url = f"/api/uploads/{subida['id']}"
+    assert cliente.put(url, data=contenido[:4], headers={'Content-Range': 'bytes 0-3/10'}).status_code == 200
+    
+    # La conexión se corta a mitad de la segunda parte; lo recibido queda guardado
+    cliente.put(url, input_stream=Cortado(contenido[4:], 3), headers={'Content-Range': 'bytes 4-9/10'})
+    # Y se retoma aunque el servidor se haya reiniciado
+    web_server.SUBIDAS.clear()
+    offset = cliente.get(url).get_json()['offset']
+    assert offset == 7
+    
+    respuesta = cliente.put(url, data=contenido[offset:], headers={'Content-Range': f'bytes {offset}-9/10'})
+    assert respuesta.get_json()['completo'] is True
+    assert (tmp_path / 'a.qgz').read_bytes() == contenido
@@ -6,12 +6,26 @@ Levanta interfaz web para usar qgz_editor.py sin tocar la terminal
 """
 
 from flask import Flask, render_template_string, request, jsonify, send_file
+import argparse
+import hashlib
+import io
 import os
 import json
-import subprocess
+import re
+import shutil
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+import qgz_catalogo
+import qgz_editor
+
 app = Flask(__name__)
+# Detrás de nginx/Apache, QGZ_X_SENDFILE=1 delega el envío de archivos al servidor web
+app.config['USE_X_SENDFILE'] = os.environ.get('QGZ_X_SENDFILE') == '1'
 
 # Directorio base
 BASE_DIR = Path(__file__).parent
@@ -19,6 +33,34 @@ CONFIG_FILE = BASE_DIR / 'config.json'
 DATA_IN = BASE_DIR / 'data_in'
 DATA_OUT = BASE_DIR / 'data_out'
 
+TRABAJOS_DIR = BASE_DIR / 'trabajos'
+SUBIDAS_DIR = DATA_IN / '.subidas'
+
+# Listas de archivos en memoria; se vuelven a leer sólo cuando la carpeta cambia
+CATALOGO_ENTRADA = qgz_catalogo.CatalogoCarpeta(DATA_IN)
+CATALOGO_SALIDA = qgz_catalogo.CatalogoCarpeta(DATA_OUT)
+# Cada cuánto se manda un comentario a los streams de cambios sin novedades
+SEGUNDOS_LATIDO_SSE = 15
+
+# Subidas por partes: bytes que se leen del pedido por vez
+TAMANO_BLOQUE_SUBIDA = 1024 * 1024
+PATRON_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+|\*)?/(\d+|\*)')
+
+# Trabajos que se ejecutan a la vez; el resto espera en cola
+MAX_TRABAJOS_SIMULTANEOS = int(os.environ.get('QGZ_TRABAJOS_WEB', '2'))
+# Trabajos terminados que se conservan (con sus carpetas) antes de borrarse
+TRABAJOS_CONSERVADOS = 20
+
+# Hilos que ejecutan el editor dentro de este proceso
+TRABAJADORES = ThreadPoolExecutor(max_workers=MAX_TRABAJOS_SIMULTANEOS,
+                                  thread_name_prefix='qgz-editor')
+TRABAJOS = {}
+_bloqueo_trabajos = threading.Lock()
+
+# Procesos para procesar archivos en paralelo; se crean una vez y se reutilizan
+_pool_procesos = None
+_bloqueo_pool = threading.Lock()
+
 # HTML de la interfaz (todo en uno)
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -337,8 +379,9 @@ HTML_TEMPLATE = """
         
         <!-- Archivos -->
         <div class="card">
-            <h2>📁 Archivos</h2>
+            <h2>📁 Archivos <span id="filesTotal" style="font-size: 0.9rem; color: #6c757d;"></span></h2>
             <div id="filesList" class="file-list"></div>
+            <div id="filesMore" style="text-align: center; margin-top: 0.75rem;"></div>
             
             <div class="upload-area" id="uploadArea">
                 <div style="font-size: 3rem; margin-bottom: 1rem;">📤</div>
@@ -376,6 +419,12 @@ HTML_TEMPLATE = """
             <button class="btn btn-success" onclick="processFiles()">▶️ PROCESAR ARCHIVOS</button>
             <div id="statusMessage" class="status-message"></div>
         </div>
+        
+        <!-- Resultados -->
+        <div class="card">
+            <h2>📥 Resultados <a id="downloadAll" href="/api/outputs.zip" style="font-size: 0.9rem; float: right;">Descargar todo (.zip)</a></h2>
+            <div id="outputsList" class="file-list"></div>
+        </div>
     </div>
     
     <script>
@@ -472,23 +521,74 @@ HTML_TEMPLATE = """
         }
         
         // Cargar lista de archivos
-        async function loadFiles() {
-            const response = await fetch('/api/files');
+        // La lista llega por páginas; al recargar se piden tantos como los que ya se ven
+        let filesCursor = null;
+        let filesShown = 0;
+        
+        async function loadFiles(more) {
+            let url = '/api/files?limite=' + (more ? 200 : Math.min(Math.max(filesShown, 200), 1000));
+            if (more && filesCursor) {
+                url += '&cursor=' + encodeURIComponent(filesCursor);
+            }
+            const response = await fetch(url);
             const data = await response.json();
             
             const container = document.getElementById('filesList');
+            const moreEl = document.getElementById('filesMore');
+            document.getElementById('filesTotal').textContent = data.total ? '(' + data.total + ')' : '';
+            filesCursor = data.siguiente;
+            moreEl.innerHTML = data.siguiente ? '<a href="#" onclick="loadFiles(true); return false;">Ver más</a>' : '';
             
-            if (data.files.length === 0) {
+            if (!more && data.files.length === 0) {
+                filesShown = 0;
                 container.innerHTML = '<div class="empty-state">No hay archivos en data_in/. Arrastra archivos .qgz arriba.</div>';
                 return;
             }
             
-            container.innerHTML = data.files.map(function(file) {
+            const html = data.files.map(function(file) {
                 return '<div class="file-item">' +
                     '<div class="file-icon">📄</div>' +
                     '<div class="file-name">' + file + '</div>' +
                     '</div>';
             }).join('');
+            if (more) {
+                container.insertAdjacentHTML('beforeend', html);
+                filesShown += data.files.length;
+            } else {
+                container.innerHTML = html;
+                filesShown = data.files.length;
+            }
+        }
+        
+        // El servidor avisa cuando cambia data_in (en lugar de preguntar cada tanto)
+        function watchFiles() {
+            const source = new EventSource('/api/files/events');
+            source.onmessage = function() {
+                loadFiles();
+            };
+        }
+        
+        // Cargar lista de resultados (data_out)
+        async function loadOutputs() {
+            const response = await fetch('/api/outputs');
+            const data = await response.json();
+            
+            const container = document.getElementById('outputsList');
+            document.getElementById('downloadAll').style.display = data.outputs.length ? '' : 'none';
+            
+            if (data.outputs.length === 0) {
+                container.innerHTML = '<div class="empty-state">Todavía no hay resultados en data_out/.</div>';
+                return;
+            }
+            
+            container.innerHTML = data.outputs.map(function(output) {
+                const megas = (output.tamano / (1024 * 1024)).toFixed(1);
+                return '<div class="file-item">' +
+                    '<div class="file-icon">📦</div>' +
+                    '<div class="file-name">' + output.nombre + ' <span style="color: #6c757d;">(' + megas + ' MB)</span></div>' +
+                    '<a href="/api/outputs/' + encodeURIComponent(output.nombre) + '" download>Descargar</a>' +
+                    '</div>';
+            }).join('');
         }
         
         // Renderizar reglas
@@ -505,6 +605,7 @@ HTML_TEMPLATE = """
                     '<select onchange="updateRule(' + index + ', \\'tipo\\', this.value)">' +
                     '<option value="ip"' + (rule.tipo === 'ip' ? ' selected' : '') + '>IP</option>' +
                     '<option value="texto"' + (rule.tipo === 'texto' ? ' selected' : '') + '>Texto</option>' +
+                    '<option value="regex"' + (rule.tipo === 'regex' ? ' selected' : '') + '>Regex</option>' +
                     '</select>' +
                     '<input type="text" value="' + (rule.buscar || '') + '" placeholder="Buscar..." ' +
                     'onchange="updateRule(' + index + ', \\'buscar\\', this.value)">' +
@@ -559,18 +660,105 @@ HTML_TEMPLATE = """
             await uploadFiles(Array.from(e.target.files));
         };
         
+        // Subidas por partes: se pueden retomar y van varias a la vez
+        const TAMANO_PARTE = 8 * 1024 * 1024;
+        const SUBIDAS_SIMULTANEAS = 3;
+        const MAX_REINTENTOS = 5;
+        
         async function uploadFiles(files) {
-            for (const file of files) {
-                const formData = new FormData();
-                formData.append('file', file);
-                await fetch('/api/upload', {
-                    method: 'POST',
-                    body: formData
-                });
+            const cola = files.slice();
+            const trabajadores = [];
+            for (let i = 0; i < SUBIDAS_SIMULTANEAS; i++) {
+                trabajadores.push((async function() {
+                    while (cola.length > 0) {
+                        await uploadFile(cola.shift());
+                    }
+                })());
             }
+            await Promise.all(trabajadores);
             loadFiles();
         }
         
+        async function startUpload(file, clave) {
+            // Retomar una subida anterior del mismo archivo, si el servidor todavía la tiene
+            const anterior = localStorage.getItem(clave);
+            if (anterior) {
+                const response = await fetch('/api/uploads/' + anterior);
+                if (response.ok) {
+                    return await response.json();
+                }
+                localStorage.removeItem(clave);
+            }
+            const response = await fetch('/api/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ nombre: file.name, tamano: file.size })
+            });
+            const subida = await response.json();
+            if (subida.success) {
+                localStorage.setItem(clave, subida.id);
+            }
+            return subida;
+        }
+        
+        async function uploadFile(file) {
+            const clave = 'subida:' + file.name + ':' + file.size + ':' + file.lastModified;
+            let subida;
+            try {
+                subida = await startUpload(file, clave);
+            } catch (error) {
+                alert('❌ No se pudo subir ' + file.name + ': ' + error.message);
+                return;
+            }
+            if (!subida.success) {
+                alert('❌ No se pudo subir ' + file.name + ': ' + subida.error);
+                return;
+            }
+            
+            let offset = subida.offset;
+            let completo = false;
+            let reintentos = 0;
+            while (!completo) {
+                const fin = Math.min(offset + TAMANO_PARTE, file.size);
+                try {
+                    const response = await fetch('/api/uploads/' + subida.id + '?offset=' + offset, {
+                        method: 'PUT',
+                        body: file.slice(offset, fin)
+                    });
+                    const data = await response.json();
+                    if (response.ok || response.status === 409) {
+                        // 409: el servidor indica desde dónde seguir
+                        offset = data.offset;
+                        completo = data.completo === true;
+                        reintentos = 0;
+                        if (response.status === 409) {
+                            await new Promise(function(r) { setTimeout(r, 500); });
+                        }
+                    } else {
+                        localStorage.removeItem(clave);
+                        alert('❌ No se pudo subir ' + file.name + ': ' + data.error);
+                        return;
+                    }
+                } catch (error) {
+                    // Conexión cortada: esperar y preguntar cuánto llegó
+                    if (++reintentos > MAX_REINTENTOS) {
+                        alert('❌ Se cortó la subida de ' + file.name + '. Vuelve a soltar el archivo para continuar.');
+                        return;
+                    }
+                    await new Promise(function(r) { setTimeout(r, 1000 * reintentos); });
+                    try {
+                        const estado = await (await fetch('/api/uploads/' + subida.id)).json();
+                        if (typeof estado.offset === 'number') {
+                            offset = estado.offset;
+                        }
+                    } catch (e) {
+                        // Se reintenta en la próxima vuelta
+                    }
+                }
+            }
+            localStorage.removeItem(clave);
+        }
+        
         // Procesar archivos
         async function processFiles() {
             // Actualizar reglas en el módulo
@@ -585,13 +773,20 @@ HTML_TEMPLATE = """
                 carpeta_salida: 'data_out'
             };
             
-            // Primero guardar config
+            // Guardar config (para la próxima vez) y crear el trabajo con una copia propia
             await fetch('/api/save-config', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(config)
             });
             
+            const jobResponse = await fetch('/api/jobs', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ config: config })
+            });
+            const job = await jobResponse.json();
+            
             // Crear área de consola
             const statusEl = document.getElementById('statusMessage');
             statusEl.className = 'status-message show processing';
@@ -604,23 +799,34 @@ HTML_TEMPLATE = """
                 'border: 1px solid #30363d;"></div>';
             
             const consoleEl = document.getElementById('console');
-            let lastMessage = '';
             let processSuccess = false;
             
-            // Usar EventSource para streaming
-            const eventSource = new EventSource('/api/process');
+            if (!job.success) {
+                statusEl.className = 'status-message show error';
+                document.getElementById('statusHeader').innerHTML = '❌ ' + job.error;
+                return;
+            }
+            
+            // Usar EventSource para streaming del trabajo
+            const eventSource = new EventSource('/api/jobs/' + job.id + '/events');
             
             eventSource.onmessage = function(event) {
                 const data = JSON.parse(event.data);
                 
-                if (data.type === 'log') {
+                if (data.type === 'done') {
+                    processSuccess = data.status === 'success';
+                    eventSource.onerror();
+                } else if (data.type === 'log') {
                     consoleEl.textContent += data.message + '\\n';
                     consoleEl.scrollTop = consoleEl.scrollHeight;
-                    lastMessage = data.message;
-                    // Detectar éxito por el mensaje final
-                    if (data.message.includes('procesaron correctamente') || data.message.includes('PROCESO FINALIZADO')) {
-                        processSuccess = true;
+                } else if (data.type === 'progress' && data.event.evento === 'archivo_fin') {
+                    // Avance y tiempo restante estimado, a partir de los eventos estructurados
+                    const p = data.progreso;
+                    let texto = 'Ejecutando proceso... (' + p.terminados + ' de ' + p.total + ' archivos)';
+                    if (p.eta_segundos !== null) {
+                        texto += ' · quedan ~' + Math.ceil(p.eta_segundos) + ' s';
                     }
+                    document.getElementById('statusHeader').innerHTML = '<span class="spinner">⏳</span> ' + texto;
                 }
             };
             
@@ -635,12 +841,15 @@ HTML_TEMPLATE = """
                     headerEl.innerHTML = '❌ Proceso terminado con errores';
                 }
                 loadFiles();
+                loadOutputs();
             };
         }
         
         // Inicializar
         loadConfig();
         loadFiles();
+        loadOutputs();
+        watchFiles();
     </script>
 </body>
 </html>
@@ -651,15 +860,13 @@ def index():
     """Página principal"""
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/api/config')
-def get_config():
-    """Obtener configuración actual"""
+def leer_config():
+    """Leer config.json (o la configuración por defecto si no se puede leer)"""
     try:
         with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        return jsonify(config)
+            return json.load(f)
     except:
-        return jsonify({
+        return {
             'modulos': {
                 'reemplazo_texto': {
                     'activo': True,
@@ -670,16 +877,573 @@ def get_config():
             'postfijo': '_MODIFICADO',
             'carpeta_entrada': 'data_in',
             'carpeta_salida': 'data_out'
-        })
+        }
+
+def obtener_pool_procesos():
+    """Pool de procesos compartido por todos los trabajos (se crea la primera vez)"""
+    global _pool_procesos
+    with _bloqueo_pool:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _pool_procesos
+
+def descartar_pool_procesos():
+    """Descartar el pool si un proceso murió, para crear uno nuevo en el próximo trabajo"""
+    global _pool_procesos
+    with _bloqueo_pool:
+        if _pool_procesos is not None:
+            _pool_procesos.shutdown(wait=False, cancel_futures=True)
+            _pool_procesos = None
+
+class TrabajoWeb:
+    """
+    Un pedido de procesamiento con su propia copia de la configuración y
+    sus propias carpetas de entrada y salida (trabajos/<id>/).
+    """
+    
+    def __init__(self, config, archivos, perfil=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.config = config
+        self.archivos = archivos
+        self.perfil = perfil
+        self.carpeta = TRABAJOS_DIR / self.id
+        self.estado = 'en_cola'
+        self.codigo = None
+        self.mensajes = []
+        self.progreso = {
+            'total': 0,
+            'terminados': 0,
+            'fallidos': 0,
+            'bytes_entrada': 0,
+            'bytes_procesados': 0,
+            'eta_segundos': None
+        }
+        self.inicio_lote = None
+        # Archivos de entrada que terminaron bien: solo sus salidas se publican
+        self.exitosos = []
+        self.condicion = threading.Condition()
+    
+    def agregar_linea(self, linea):
+        with self.condicion:
+            self.mensajes.append({'type': 'log', 'message': linea.rstrip()})
+            self.condicion.notify_all()
+    
+    def agregar_evento(self, evento):
+        """Registrar un evento estructurado de qgz_editor y actualizar el progreso"""
+        with self.condicion:
+            progreso = self.progreso
+            if evento['evento'] == 'lote_inicio':
+                self.inicio_lote = evento['tiempo']
+                progreso['total'] = evento['total']
+                progreso['bytes_entrada'] = evento['bytes_entrada']
+            elif evento['evento'] == 'archivo_fin':
+                progreso['terminados'] += 1
+                progreso['fallidos'] += 0 if evento['exito'] else 1
+                if evento['exito']:
+                    self.exitosos.append(evento['archivo'])
+                progreso['bytes_procesados'] += evento.get('bytes_entrada', 0)
+                # Estimación por bytes: lo que falta al ritmo medido hasta ahora
+                transcurrido = evento['tiempo'] - (self.inicio_lote or evento['tiempo'])
+                if progreso['bytes_procesados'] and transcurrido > 0:
+                    faltan = max(progreso['bytes_entrada'] - progreso['bytes_procesados'], 0)
+                    progreso['eta_segundos'] = round(transcurrido * faltan / progreso['bytes_procesados'], 1)
+            self.mensajes.append({'type': 'progress', 'event': evento, 'progreso': dict(progreso)})
+            self.condicion.notify_all()
+    
+    def terminar(self, codigo):
+        with self.condicion:
+            self.codigo = codigo
+            self.estado = 'completado' if codigo == 0 else 'error'
+            self.condicion.notify_all()
+    
+    def resumen(self):
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'archivos': self.archivos,
+            'codigo': self.codigo,
+            'progreso': dict(self.progreso)
+        }
+
+def preparar_carpetas_trabajo(trabajo):
+    """
+    Crear trabajos/<id>/ con la configuración y los archivos seleccionados.
+    
+    Los archivos se enlazan (hard link) desde data_in, así el trabajo no se ve
+    afectado si después alguien sube otra versión con el mismo nombre.
+    """
+    entrada = trabajo.carpeta / 'data_in'
+    entrada.mkdir(parents=True)
+    (trabajo.carpeta / 'data_out').mkdir()
+    
+    for nombre in trabajo.archivos:
+        try:
+            os.link(DATA_IN / nombre, entrada / nombre)
+        except OSError:
+            shutil.copy2(DATA_IN / nombre, entrada / nombre)
+    
+    with open(trabajo.carpeta / 'config.json', 'w', encoding='utf-8') as f:
+        json.dump(trabajo.config, f, indent=4, ensure_ascii=False)
+
+def publicar_resultados(trabajo):
+    """
+    Mover a data_out las salidas de los archivos que el trabajo procesó bien (reemplazo atómico).
+    
+    Las de un archivo que falló no se publican, aunque el resto del trabajo
+    haya terminado bien.
+    """
+    DATA_OUT.mkdir(exist_ok=True)
+    salida = trabajo.carpeta / 'data_out'
+    with trabajo.condicion:
+        exitosos = list(trabajo.exitosos)
+    for archivo in exitosos:
+        nombre = qgz_editor.nombre_archivo_salida(archivo, trabajo.config)
+        if not (salida / nombre).is_file():
+            continue
+        temporal = DATA_OUT / f'.{nombre}.{trabajo.id}.tmp'
+        try:
+            os.link(salida / nombre, temporal)
+        except OSError:
+            shutil.copy2(salida / nombre, temporal)
+        os.replace(temporal, DATA_OUT / nombre)
+    CATALOGO_SALIDA.invalidar()
+
+def limpiar_trabajos_viejos():
+    """Borrar los trabajos terminados más antiguos, conservando los últimos"""
+    with _bloqueo_trabajos:
+        terminados = [t for t in TRABAJOS.values() if t.codigo is not None]
+        viejos = terminados[:-TRABAJOS_CONSERVADOS] if len(terminados) > TRABAJOS_CONSERVADOS else []
+        for trabajo in viejos:
+            del TRABAJOS[trabajo.id]
+    for trabajo in viejos:
+        shutil.rmtree(trabajo.carpeta, ignore_errors=True)
+
+def ejecutar_trabajo_web(trabajo):
+    """Ejecutar un trabajo en su carpeta (corre en uno de los TRABAJADORES)"""
+    trabajo.estado = 'ejecutando'
+    codigo = 1
+    try:
+        # Las carpetas del trabajo reemplazan a las de la configuración recibida
+        config = dict(trabajo.config, carpeta_entrada='data_in', carpeta_salida='data_out')
+        # Cada trabajo empieza con su data_out vacía: el manifiesto y el diario
+        # no tendrían nada que omitir ni que retomar
+        codigo = qgz_editor.ejecutar_trabajo(config, str(trabajo.carpeta), trabajo.agregar_linea,
+                                             ejecutor=obtener_pool_procesos(),
+                                             al_recibir_evento=trabajo.agregar_evento,
+                                             perfil=trabajo.perfil, incremental=False)
+        publicar_resultados(trabajo)
+        if codigo != 0 and trabajo.exitosos:
+            trabajo.agregar_linea(f'⚠️ Solo se publicaron en data_out los {len(trabajo.exitosos)} archivo(s) '
+                                  'procesados correctamente')
+    except BrokenProcessPool:
+        descartar_pool_procesos()
+        trabajo.agregar_linea('❌ Error: un proceso de trabajo terminó inesperadamente')
+    except Exception as e:
+        trabajo.agregar_linea(f'❌ Error: {e}')
+    finally:
+        trabajo.terminar(codigo)
+        limpiar_trabajos_viejos()
+
+def crear_trabajo(config, archivos=None, perfil=None):
+    """
+    Registrar un trabajo nuevo y ponerlo en la cola.
+    
+    Args:
+        config: Configuración a usar (se guarda una copia propia del trabajo)
+        archivos: Nombres de archivos .qgz de data_in (None = todos)
+        perfil: Opciones de --profile de qgz_editor (None = sin perfil)
+        
+    Returns:
+        TrabajoWeb: El trabajo creado
+        
+    Raises:
+        ValueError: Si algún archivo no es un .qgz existente en data_in, si
+                    la configuración pide tablas de reglas, o si pide perfil
+                    de memoria mientras otro trabajo con ese perfil no terminó
+    """
+    # Las rutas de las tablas son del disco del servidor: un pedido web no puede elegirlas
+    reemplazo = (config.get('modulos') or {}).get('reemplazo_texto') if isinstance(config, dict) else None
+    if isinstance(reemplazo, dict) and reemplazo.get('tablas'):
+        raise ValueError("Los trabajos web no admiten 'tablas': agrega las reglas en 'reglas' "
+                         "o procesa las tablas desde la línea de comandos")
+    
+    disponibles = CATALOGO_ENTRADA.nombres()
+    if archivos is None:
+        archivos = disponibles
+    faltantes = [a for a in archivos if a not in set(disponibles)]
+    if faltantes:
+        raise ValueError(f"Archivos no encontrados en data_in: {', '.join(map(str, faltantes))}")
+    
+    trabajo = TrabajoWeb(json.loads(json.dumps(config)), list(archivos), perfil)
+    preparar_carpetas_trabajo(trabajo)
+    with _bloqueo_trabajos:
+        # tracemalloc es uno solo para todo el proceso: dos trabajos con perfil
+        # de memoria a la vez se mezclarían los picos
+        ocupado = bool(perfil and 'memoria' in perfil and any(
+            t.codigo is None and t.perfil and 'memoria' in t.perfil for t in TRABAJOS.values()))
+        if not ocupado:
+            TRABAJOS[trabajo.id] = trabajo
+    if ocupado:
+        shutil.rmtree(trabajo.carpeta, ignore_errors=True)
+        raise ValueError("Ya hay un trabajo con perfil de memoria en curso: espera a que termine "
+                         "o pide el perfil sin 'memoria'")
+    trabajo.agregar_linea(f"⏳ Trabajo {trabajo.id} en cola ({len(archivos)} archivo(s))")
+    TRABAJADORES.submit(ejecutar_trabajo_web, trabajo)
+    return trabajo
+
+def generar_eventos(trabajo):
+    """Eventos SSE con el progreso de un trabajo (desde el principio)"""
+    enviados = 0
+    while True:
+        with trabajo.condicion:
+            while enviados == len(trabajo.mensajes) and trabajo.codigo is None:
+                trabajo.condicion.wait()
+            nuevos = trabajo.mensajes[enviados:]
+            codigo = trabajo.codigo
+        enviados += len(nuevos)
+        
+        for mensaje in nuevos:
+            yield f"data: {json.dumps(mensaje)}\n\n"
+        
+        if codigo is not None:
+            break
+    
+    # Enviar resultado final
+    if codigo == 0:
+        yield f"data: {json.dumps({'type': 'done', 'status': 'success', 'message': 'Proceso completado correctamente', 'job': trabajo.id})}\n\n"
+    else:
+        yield f"data: {json.dumps({'type': 'done', 'status': 'error', 'message': 'El proceso terminó con errores', 'job': trabajo.id})}\n\n"
+
+def respuesta_eventos(trabajo):
+    """Respuesta HTTP en streaming para generar_eventos"""
+    from flask import Response
+    
+    response = Response(generar_eventos(trabajo), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Connection'] = 'keep-alive'
+    return response
+
+@app.route('/api/config')
+def get_config():
+    """Obtener configuración actual"""
+    return jsonify(leer_config())
 
 @app.route('/api/files')
 def get_files():
-    """Listar archivos en data_in"""
+    """Listar archivos en data_in, por páginas (?orden=nombre|tamano|modificado&desc=1&limite=N&cursor=...)"""
     try:
-        files = [f for f in os.listdir(DATA_IN) if f.endswith('.qgz')]
-        return jsonify({'files': files})
-    except:
-        return jsonify({'files': []})
+        pagina = CATALOGO_ENTRADA.pagina(orden=request.args.get('orden', 'nombre'),
+                                         descendente=request.args.get('desc') in ('1', 'true'),
+                                         cursor=request.args.get('cursor'),
+                                         limite=request.args.get('limite', qgz_catalogo.LIMITE_POR_DEFECTO))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    pagina['files'] = [item['nombre'] for item in pagina['items']]
+    return jsonify(pagina)
+
+def generar_cambios_archivos(version):
+    """Eventos SSE con los cambios de data_in posteriores a una versión del catálogo"""
+    while True:
+        actual = CATALOGO_ENTRADA.esperar_cambios(version, timeout=SEGUNDOS_LATIDO_SSE)
+        if actual == version:
+            # Comentario SSE: mantiene viva la conexión a través de proxies
+            yield ": latido\n\n"
+            continue
+        cambios = CATALOGO_ENTRADA.cambios_desde(version)
+        if cambios is None:
+            # Demasiados cambios juntos: el cliente tiene que volver a pedir la lista
+            cambios = {'version': actual, 'recargar': True}
+        version = cambios['version']
+        yield f"id: {version}\ndata: {json.dumps(dict(cambios, type='files'))}\n\n"
+
+@app.route('/api/files/events')
+def file_events():
+    """Avisos (SSE) cada vez que cambian los archivos de data_in"""
+    from flask import Response
+    
+    # Al reconectarse, EventSource manda el último id recibido
+    version = request.headers.get('Last-Event-ID') or request.args.get('version')
+    try:
+        version = int(version) if version is not None else CATALOGO_ENTRADA.actualizar()
+    except ValueError:
+        return jsonify({'success': False, 'error': f'Versión inválida: {version}'}), 400
+    
+    response = Response(generar_cambios_archivos(version), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+class SubidaWeb:
+    """
+    Subida de un archivo por partes, que se puede retomar.
+    
+    Los bytes se escriben directamente en data_in/.subidas/<id>.part y, al
+    completarse, ese archivo se renombra a data_in/<nombre> (sin copiarlo).
+    El estado se guarda en <id>.json para retomar incluso si el servidor
+    se reinicia.
+    """
+    
+    def __init__(self, id_subida, nombre, tamano, sha256_esperado=None, recibido=0):
+        self.id = id_subida
+        self.nombre = nombre
+        self.tamano = tamano
+        self.sha256_esperado = sha256_esperado
+        self.recibido = recibido
+        self.hash = hashlib.sha256()
+        self.bloqueo = threading.Lock()
+        self.parcial = SUBIDAS_DIR / f'{id_subida}.part'
+        self.meta = SUBIDAS_DIR / f'{id_subida}.json'
+    
+    def guardar_meta(self):
+        temporal = self.meta.with_suffix('.json.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'nombre': self.nombre, 'tamano': self.tamano,
+                       'sha256': self.sha256_esperado, 'recibido': self.recibido}, f)
+        os.replace(temporal, self.meta)
+    
+    @classmethod
+    def cargar(cls, id_subida):
+        """Retomar una subida guardada en disco (recalcula el hash de lo ya recibido)"""
+        subida = cls(id_subida, None, 0)
+        with open(subida.meta, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        subida.nombre = datos['nombre']
+        subida.tamano = datos['tamano']
+        subida.sha256_esperado = datos.get('sha256')
+        with open(subida.parcial, 'r+b') as f:
+            recibido = min(datos['recibido'], os.fstat(f.fileno()).st_size)
+            f.truncate(recibido)
+            while f.tell() < recibido:
+                subida.hash.update(f.read(min(TAMANO_BLOQUE_SUBIDA, recibido - f.tell())))
+        subida.recibido = recibido
+        return subida
+    
+    def resumen(self):
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'tamano': self.tamano,
+            'offset': self.recibido,
+            'completo': False
+        }
+    
+    def descartar(self):
+        for ruta in (self.parcial, self.meta):
+            try:
+                ruta.unlink()
+            except FileNotFoundError:
+                pass
+
+SUBIDAS = {}
+_bloqueo_subidas = threading.Lock()
+
+def obtener_subida(id_subida):
+    """Subida en curso por id (de memoria o, tras un reinicio, de disco)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', id_subida):
+        return None
+    with _bloqueo_subidas:
+        subida = SUBIDAS.get(id_subida)
+        if subida is None:
+            try:
+                subida = SUBIDAS[id_subida] = SubidaWeb.cargar(id_subida)
+            except (OSError, ValueError, KeyError):
+                return None
+        return subida
+
+def completar_subida(subida):
+    """Verificar el hash y mover el archivo a data_in con su nombre final"""
+    sha256 = subida.hash.hexdigest()
+    with _bloqueo_subidas:
+        SUBIDAS.pop(subida.id, None)
+    if subida.sha256_esperado and subida.sha256_esperado.lower() != sha256:
+        subida.descartar()
+        return jsonify({'success': False, 'error': 'El hash SHA-256 no coincide, sube el archivo de nuevo',
+                        'sha256': sha256}), 422
+    # Renombrar (misma carpeta/disco): los trabajos en curso conservan la versión anterior
+    os.replace(subida.parcial, DATA_IN / subida.nombre)
+    subida.meta.unlink()
+    CATALOGO_ENTRADA.invalidar()
+    return jsonify(dict(subida.resumen(), success=True, completo=True, sha256=sha256))
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Iniciar una subida por partes. Body: {"nombre": "x.qgz", "tamano": bytes, "sha256": opcional}"""
+    datos = request.get_json(silent=True) or {}
+    nombre = os.path.basename(str(datos.get('nombre', '')))
+    tamano = datos.get('tamano')
+    if not nombre.endswith('.qgz') or nombre.startswith('.'):
+        return jsonify({'success': False, 'error': 'Solo se aceptan archivos .qgz'}), 400
+    if isinstance(tamano, bool) or not isinstance(tamano, int) or tamano < 0:
+        return jsonify({'success': False, 'error': "'tamano' debe ser la cantidad de bytes del archivo"}), 400
+    
+    SUBIDAS_DIR.mkdir(parents=True, exist_ok=True)
+    subida = SubidaWeb(uuid.uuid4().hex, nombre, tamano, datos.get('sha256'))
+    subida.parcial.touch()
+    subida.guardar_meta()
+    with _bloqueo_subidas:
+        SUBIDAS[subida.id] = subida
+    return jsonify(dict(subida.resumen(), success=True)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Estado de una subida: 'offset' es desde dónde hay que seguir enviando"""
+    subida = obtener_subida(upload_id)
+    if subida is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    return jsonify(dict(subida.resumen(), success=True))
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """
+    Recibir una parte. La posición va en 'Content-Range: bytes inicio-fin/total'
+    o en '?offset=inicio' y tiene que ser la siguiente a lo ya recibido.
+    """
+    subida = obtener_subida(upload_id)
+    if subida is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    
+    rango = PATRON_CONTENT_RANGE.fullmatch(request.headers.get('Content-Range', ''))
+    offset = int(rango.group(1)) if rango else request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': "Falta la posición (Content-Range u 'offset')"}), 400
+    # El total y el fin del rango tienen que ser los de la subida que se creó
+    if rango and rango.group(3) != '*' and int(rango.group(3)) != subida.tamano:
+        return jsonify(dict(subida.resumen(), success=False,
+                            error=f'El total de Content-Range no es el tamaño declarado ({subida.tamano})')), 400
+    if rango and rango.group(2) not in (None, '*') and not offset <= int(rango.group(2)) < subida.tamano:
+        return jsonify(dict(subida.resumen(), success=False,
+                            error='El rango de Content-Range no es válido para esta subida')), 400
+    
+    if not subida.bloqueo.acquire(blocking=False):
+        return jsonify(dict(subida.resumen(), success=False, error='Ya se está recibiendo otra parte')), 409
+    try:
+        if offset != subida.recibido:
+            return jsonify(dict(subida.resumen(), success=False,
+                                error='Posición incorrecta, sigue desde offset')), 409
+        
+        # Escribir en el archivo parcial a medida que llegan los bytes
+        try:
+            with open(subida.parcial, 'r+b') as f:
+                f.seek(offset)
+                while True:
+                    bloque = request.stream.read(TAMANO_BLOQUE_SUBIDA)
+                    if not bloque:
+                        break
+                    if subida.recibido + len(bloque) > subida.tamano:
+                        f.truncate(subida.recibido)
+                        return jsonify(dict(subida.resumen(), success=False,
+                                            error='Se recibieron más bytes que el tamaño declarado')), 400
+                    f.write(bloque)
+                    subida.hash.update(bloque)
+                    subida.recibido += len(bloque)
+        finally:
+            # Si la conexión se corta, lo recibido hasta ahí queda guardado
+            subida.guardar_meta()
+        
+        if subida.recibido == subida.tamano:
+            return completar_subida(subida)
+        return jsonify(dict(subida.resumen(), success=True))
+    finally:
+        subida.bloqueo.release()
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """Cancelar una subida y borrar lo recibido"""
+    subida = obtener_subida(upload_id)
+    if subida is None:
+        return jsonify({'success': False, 'error': 'Subida no encontrada'}), 404
+    with _bloqueo_subidas:
+        SUBIDAS.pop(subida.id, None)
+    subida.descartar()
+    return jsonify({'success': True})
+
+def listar_resultados():
+    """Archivos .qgz de data_out (nombre, tamaño y fecha), ordenados por nombre"""
+    return CATALOGO_SALIDA.entradas()
+
+def ruta_resultado(nombre):
+    """Ruta de un resultado de data_out, o None si el nombre no es válido o no existe"""
+    if nombre != os.path.basename(nombre) or not nombre.endswith('.qgz') or nombre.startswith('.'):
+        return None
+    ruta = DATA_OUT / nombre
+    return ruta if ruta.is_file() else None
+
+class SalidaEnStreaming(io.RawIOBase):
+    """Archivo de solo escritura y sin seek que acumula lo escrito hasta retirarlo"""
+    
+    def __init__(self):
+        self.partes = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+    
+    def retirar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+def generar_paquete_zip(rutas):
+    """
+    Generar un .zip con los archivos indicados mientras se envía.
+    
+    Los .qgz ya están comprimidos, así que se guardan sin recomprimir
+    (ZIP_STORED). zipfile escribe sobre una salida sin seek (con data
+    descriptors), así que no hace falta ningún archivo temporal.
+    """
+    salida = SalidaEnStreaming()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as paquete:
+        for ruta in rutas:
+            info = zipfile.ZipInfo.from_file(ruta, ruta.name)
+            info.compress_type = zipfile.ZIP_STORED
+            tamano = ruta.stat().st_size
+            with open(ruta, 'rb') as origen, \
+                    paquete.open(info, 'w', force_zip64=tamano > qgz_editor.UMBRAL_FORZAR_ZIP64) as destino:
+                while True:
+                    bloque = origen.read(qgz_editor.TAMANO_BLOQUE_COPIA)
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+                    yield salida.retirar()
+    # Directorio central del ZIP
+    yield salida.retirar()
+
+@app.route('/api/outputs')
+def list_outputs():
+    """Listar los resultados de data_out"""
+    return jsonify({'outputs': listar_resultados()})
+
+@app.route('/api/outputs/<name>')
+def download_output(name):
+    """Descargar un resultado (con soporte de Range, ETag y sendfile)"""
+    ruta = ruta_resultado(name)
+    if ruta is None:
+        return jsonify({'success': False, 'error': 'Resultado no encontrado'}), 404
+    # conditional=True: respuestas 206/304 con Range, If-Range e If-None-Match;
+    # el archivo se entrega con wsgi.file_wrapper (sendfile si el servidor lo admite)
+    return send_file(ruta, as_attachment=True, download_name=name, conditional=True, etag=True, max_age=0)
+
+@app.route('/api/outputs.zip')
+def download_outputs_zip():
+    """Descargar varios resultados en un solo .zip generado al vuelo (?archivos=a.qgz&archivos=b.qgz, por defecto todos)"""
+    from flask import Response
+    
+    nombres = [n for valor in request.args.getlist('archivos') for n in valor.split(',') if n]
+    if not nombres:
+        nombres = [resultado['nombre'] for resultado in listar_resultados()]
+    rutas = [ruta_resultado(nombre) for nombre in nombres]
+    faltantes = [nombre for nombre, ruta in zip(nombres, rutas) if ruta is None]
+    if faltantes:
+        return jsonify({'success': False, 'error': f"Resultados no encontrados: {', '.join(faltantes)}"}), 404
+    
+    response = Response(generar_paquete_zip(rutas), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename="resultados_qgz.zip"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -687,7 +1451,11 @@ def upload_file():
     file = request.files['file']
     if file and file.filename.endswith('.qgz'):
         filepath = DATA_IN / file.filename
-        file.save(filepath)
+        # Guardar aparte y reemplazar: los trabajos en curso conservan la versión anterior
+        temporal = DATA_IN / f'.{file.filename}.{uuid.uuid4().hex[:8]}.tmp'
+        file.save(temporal)
+        os.replace(temporal, filepath)
+        CATALOGO_ENTRADA.invalidar()
         return jsonify({'success': True})
     return jsonify({'success': False})
 
@@ -699,58 +1467,71 @@ def save_config():
         json.dump(config, f, indent=4, ensure_ascii=False)
     return jsonify({'success': True})
 
-@app.route('/api/process', methods=['GET'])
-def process():
-    """Procesar archivos con qgz_editor.py - streaming de output"""
-    from flask import Response
-    import time
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Crear un trabajo con una copia de la configuración y los archivos elegidos"""
+    datos = request.get_json(silent=True) or {}
+    config = datos.get('config') or leer_config()
+    archivos = datos.get('archivos')
+    if archivos is not None and not isinstance(archivos, list):
+        return jsonify({'success': False, 'error': "'archivos' debe ser una lista"}), 400
     
-    def generate():
-        """Genera el output en tiempo real"""
-        try:
-            # Iniciar proceso con stdin cerrado
-            proc = subprocess.Popen(
-                ['python3', '-u', 'qgz_editor.py'],
-                cwd=BASE_DIR,
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
-            )
-            
-            # Leer output línea por línea
-            while True:
-                line = proc.stdout.readline()
-                if not line and proc.poll() is not None:
-                    break
-                if line:
-                    yield f"data: {json.dumps({'type': 'log', 'message': line.rstrip()})}\n\n"
-            
-            # Leer cualquier output restante
-            remaining = proc.stdout.read()
-            if remaining:
-                for line in remaining.strip().split('\n'):
-                    if line:
-                        yield f"data: {json.dumps({'type': 'log', 'message': line})}\n\n"
-            
-            proc.stdout.close()
-            return_code = proc.wait()
-            
-            # Enviar resultado final
-            if return_code == 0:
-                yield f"data: {json.dumps({'type': 'done', 'status': 'success', 'message': 'Proceso completado correctamente'})}\n\n"
-            else:
-                yield f"data: {json.dumps({'type': 'done', 'status': 'error', 'message': 'El proceso terminó con errores'})}\n\n"
-                
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'done', 'status': 'error', 'message': f'Error: {str(e)}'})}\n\n"
+    # 'perfil': true (solo tiempos), "cprofile,memoria", "todo" o una lista de opciones
+    perfil = datos.get('perfil')
+    try:
+        if perfil is True:
+            perfil = qgz_editor.leer_opciones_perfil('tiempos')
+        elif perfil:
+            perfil = qgz_editor.leer_opciones_perfil(perfil if isinstance(perfil, str) else ','.join(perfil))
+        else:
+            perfil = None
+    except (argparse.ArgumentTypeError, TypeError) as e:
+        return jsonify({'success': False, 'error': f"'perfil' inválido: {e}"}), 400
     
-    response = Response(generate(), mimetype='text/event-stream')
-    response.headers['Cache-Control'] = 'no-cache'
-    response.headers['X-Accel-Buffering'] = 'no'
-    response.headers['Connection'] = 'keep-alive'
-    return response
+    try:
+        trabajo = crear_trabajo(config, archivos, perfil)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(dict(trabajo.resumen(), success=True)), 202
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Estado de un trabajo"""
+    trabajo = TRABAJOS.get(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo.resumen())
+
+@app.route('/api/jobs/<job_id>/profile')
+def job_profile(job_id):
+    """Descargar el perfil de cProfile (perfil.prof) o el informe (?formato=txt) de un trabajo"""
+    trabajo = TRABAJOS.get(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    nombre = 'perfil.txt' if request.args.get('formato') == 'txt' else 'perfil.prof'
+    ruta = trabajo.carpeta / 'data_out' / qgz_editor.CARPETA_PERFIL / nombre
+    if trabajo.codigo is None or not ruta.is_file():
+        return jsonify({'success': False, 'error': 'El trabajo no tiene ese perfil (¿terminó? ¿se pidió con perfil?)'}), 404
+    return send_file(ruta, as_attachment=True, download_name=f'{trabajo.id}_{nombre}')
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Progreso de un trabajo en streaming (SSE)"""
+    trabajo = TRABAJOS.get(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return respuesta_eventos(trabajo)
+
+@app.route('/api/process', methods=['GET'])
+def process():
+    """Procesar todos los archivos con la configuración guardada - streaming de output"""
+    try:
+        trabajo = crear_trabajo(leer_config())
+    except Exception as e:
+        from flask import Response
+        evento = json.dumps({'type': 'done', 'status': 'error', 'message': f'Error: {str(e)}'})
+        return Response(f"data: {evento}\n\n", mimetype='text/event-stream')
+    return respuesta_eventos(trabajo)
 
 if __name__ == '__main__':
     print("\n" + "="*60)
@@ -8,10 +8,16 @@ Levanta interfaz web para usar qgz_editor.py sin tocar la terminal
 from flask import Flask, render_template_string, request, jsonify, Response, stream_with_context
 import os
 import json
-import subprocess
+import queue
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+import qgz_catalogo
+import qgz_editor
+
 app = Flask(__name__)
 
 # Directorio base
@@ -20,6 +26,14 @@ CONFIG_FILE = BASE_DIR / 'config.json'
 DATA_IN = BASE_DIR / 'data_in'
 DATA_OUT = BASE_DIR / 'data_out'
 
+# Lista de data_in en memoria; se vuelve a leer sólo cuando la carpeta cambia
+CATALOGO_ENTRADA = qgz_catalogo.CatalogoCarpeta(DATA_IN)
+
+# El editor corre dentro de este proceso, en un hilo trabajador (un trabajo a la vez)
+TRABAJADOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qgz-editor')
+_pool_procesos = None
+_bloqueo_pool = threading.Lock()
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="es">
@@ -245,6 +259,7 @@ HTML_TEMPLATE = """
                     <select onchange="updateRule(${index}, 'tipo', this.value)">
                         <option value="ip" ${rule.tipo === 'ip' ? 'selected' : ''}>IP</option>
                         <option value="texto" ${rule.tipo === 'texto' ? 'selected' : ''}>Texto</option>
+                        <option value="regex" ${rule.tipo === 'regex' ? 'selected' : ''}>Regex</option>
                     </select>
                     <input type="text" value="${rule.buscar}" placeholder="Buscar..." onchange="updateRule(${index}, 'buscar', this.value)">
                     <input type="text" value="${rule.reemplazar_por}" placeholder="Reemplazar por..." onchange="updateRule(${index}, 'reemplazar_por', this.value)">
@@ -291,7 +306,7 @@ HTML_TEMPLATE = """
             loadFiles();
         }
         
-        let refreshInterval = null;
+        let filesSource = null;
         let isProcessing = false;
         
         async function processFiles() {
@@ -376,11 +391,13 @@ HTML_TEMPLATE = """
         
         loadConfig();
         loadFiles();
-        refreshInterval = setInterval(() => {
+        // El servidor avisa cuando cambia data_in (ya no se pregunta cada 5 segundos)
+        filesSource = new EventSource('/api/files/events');
+        filesSource.onmessage = () => {
             if (!isProcessing) {
                 loadFiles();
             }
-        }, 5000); // Cambiado a 5 segundos y solo si no está procesando
+        };
     </script>
 </body>
 </html>
@@ -390,27 +407,65 @@ HTML_TEMPLATE = """
 def index():
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/api/config')
-def get_config():
+def leer_config():
     try:
         with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        return jsonify(config)
+            return json.load(f)
     except:
-        return jsonify({
+        return {
             'reemplazos': [],
             'postfijo': '_MODIFICADO',
             'carpeta_entrada': 'data_in',
             'carpeta_salida': 'data_out'
-        })
+        }
+
+def ejecutar_editor(config, al_recibir_linea):
+    """Ejecutar qgz_editor como biblioteca reutilizando un pool de procesos"""
+    global _pool_procesos
+    with _bloqueo_pool:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        pool = _pool_procesos
+    try:
+        return qgz_editor.ejecutar_trabajo(config, str(BASE_DIR), al_recibir_linea, ejecutor=pool)
+    except BrokenProcessPool:
+        with _bloqueo_pool:
+            _pool_procesos = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        al_recibir_linea('❌ Error: un proceso de trabajo terminó inesperadamente')
+        return 1
+
+@app.route('/api/config')
+def get_config():
+    return jsonify(leer_config())
 
 @app.route('/api/files')
 def get_files():
     try:
-        files = [f for f in os.listdir(DATA_IN) if f.endswith('.qgz')]
-        return jsonify({'files': files})
-    except:
-        return jsonify({'files': []})
+        pagina = CATALOGO_ENTRADA.pagina(orden=request.args.get('orden', 'nombre'),
+                                         descendente=request.args.get('desc') in ('1', 'true'),
+                                         cursor=request.args.get('cursor'),
+                                         limite=request.args.get('limite', qgz_catalogo.LIMITE_POR_DEFECTO))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    pagina['files'] = [item['nombre'] for item in pagina['items']]
+    return jsonify(pagina)
+
+@app.route('/api/files/events')
+def file_events():
+    version = CATALOGO_ENTRADA.actualizar()
+    
+    def generar():
+        nonlocal version
+        while True:
+            actual = CATALOGO_ENTRADA.esperar_cambios(version, timeout=15)
+            if actual == version:
+                yield ": latido\n\n"
+                continue
+            version = actual
+            yield f"data: {json.dumps({'type': 'files', 'version': version})}\n\n"
+    
+    return Response(stream_with_context(generar()), mimetype='text/event-stream')
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -418,6 +473,7 @@ def upload_file():
     if file and file.filename.endswith('.qgz'):
         filepath = DATA_IN / file.filename
         file.save(filepath)
+        CATALOGO_ENTRADA.invalidar()
         return jsonify({'success': True})
     return jsonify({'success': False})
 
@@ -430,26 +486,19 @@ def save_config():
 
 @app.route('/api/process', methods=['GET'])
 def process():
+    config = leer_config()
+    lineas = queue.Queue()
+    
     def generate():
         try:
-            process = subprocess.Popen(
-                ['python3', '-u', 'qgz_editor.py'],  # -u = unbuffered output
-                cwd=BASE_DIR,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=0,  # Sin buffer
-                universal_newlines=True
-            )
-            
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    yield f"data: {json.dumps({'type': 'log', 'message': line.rstrip()})}\\n\\n"
-                    time.sleep(0.01)
+            trabajo = TRABAJADOR.submit(ejecutar_editor, config, lineas.put)
+            trabajo.add_done_callback(lambda _: lineas.put(None))
             
-            process.wait()
+            for line in iter(lineas.get, None):
+                yield f"data: {json.dumps({'type': 'log', 'message': line.rstrip()})}\\n\\n"
+                time.sleep(0.01)
             
-            if process.returncode == 0:
+            if trabajo.result() == 0:
                 yield f"data: {json.dumps({'type': 'success', 'message': '✅ Archivos procesados correctamente!'})}\\n\\n"
             else:
                 yield f"data: {json.dumps({'type': 'error', 'message': '❌ Error al procesar archivos'})}\\n\\n"